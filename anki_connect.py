@@ -0,0 +1,121 @@
+"""
+minimal AnkiConnect client
+
+- reuses one keep-alive HTTP connection per thread
+- groups many actions into AnkiConnect `multi` requests
+- can send several `multi` requests at once over a bounded thread pool
+"""
+
+import json
+import threading
+import http.client
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+ANKI_CONNECT_URL = "http://localhost:8765"
+ANKI_CONNECT_VERSION = 6
+
+
+def request(action, **params):
+    return {'action': action, 'params': params, 'version': ANKI_CONNECT_VERSION}
+
+
+def check_response(response):
+    if len(response) != 2:
+        raise Exception('response has an unexpected number of fields')
+    if 'error' not in response:
+        raise Exception('response is missing required error field')
+    if 'result' not in response:
+        raise Exception('response is missing required result field')
+    if response['error'] is not None:
+        raise Exception(response['error'])
+    return response['result']
+
+
+class AnkiConnect:
+    # number of actions sent in a single `multi` request
+    BATCH_SIZE = 50
+
+    def __init__(self, url: str = ANKI_CONNECT_URL, max_workers: int = 4):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 8765
+        self.max_workers = max(1, max_workers)
+        self.local = threading.local()
+        # created on first use, and kept so that its threads keep their connections alive
+        self.executor: ThreadPoolExecutor | None = None
+        self.connections: list[http.client.HTTPConnection] = []
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections = []
+
+    def connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = http.client.HTTPConnection(self.host, self.port)
+            self.local.conn = conn
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+
+    def close(self):
+        # closes the connection of the current thread, a new one is opened on the next request
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
+            with self.lock:
+                self.connections.remove(conn)
+
+    def post(self, body: bytes) -> Any:
+        # retries once on a fresh connection, in case the server closed the kept-alive one
+        for attempt in range(2):
+            conn = self.connection()
+            try:
+                conn.request("POST", "/", body, {"Content-Type": "application/json"})
+                response = conn.getresponse()
+                data = response.read()
+                if response.will_close:
+                    self.close()
+                return json.loads(data)
+            except (http.client.RemoteDisconnected, http.client.CannotSendRequest, BrokenPipeError, ConnectionResetError):
+                self.close()
+                if attempt == 1:
+                    raise
+
+    def invoke(self, action, **params):
+        requestJson = json.dumps(request(action, **params)).encode('utf-8')
+        return check_response(self.post(requestJson))
+
+    def multi(self, actions: list[tuple[str, dict[str, Any]]]) -> list[Any]:
+        """
+        actions: (action, params) pairs.
+        returns the result of each action, in order.
+        Actions are sent BATCH_SIZE at a time, with up to max_workers batches in flight.
+        """
+        batches = [actions[i:i + self.BATCH_SIZE] for i in range(0, len(actions), self.BATCH_SIZE)]
+        if len(batches) <= 1 or self.max_workers == 1:
+            results = [self.invoke_batch(batch) for batch in batches]
+        else:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            results = list(self.executor.map(self.invoke_batch, batches))
+        return [result for batch_results in results for result in batch_results]
+
+    def invoke_batch(self, batch: list[tuple[str, dict[str, Any]]]) -> list[Any]:
+        responses = self.invoke("multi", actions=[request(action, **params) for action, params in batch])
+        return [check_response(response) for response in responses]
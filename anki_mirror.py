@@ -0,0 +1,151 @@
+"""
+local mirror of the Word field of the Anki collection, for offline substring search.
+
+- notes(note_id, word, mod): the Word field of every note that has one
+- note_chars(char, note_id): inverted index from every character of a word to its notes
+- sync_state(key, value): time of the last sync
+
+filled once with findNotes / notesInfo, then kept up to date with sync(),
+which only fetches the notes that were added or edited since the last sync.
+
+examples:
+
+python3 anki_mirror.py          # syncs the mirror
+python3 anki_mirror.py --full   # rebuilds the mirror from scratch
+"""
+
+import time
+import sqlite3
+import argparse
+from typing import Any
+
+from anki_connect import AnkiConnect, ANKI_CONNECT_URL
+
+MIRROR_FILE = "anki_mirror.db"
+WORD_FIELD = "Word"
+# notes requested per notesInfo action
+NOTES_INFO_BATCH_SIZE = 500
+
+
+def init_tables(conn: sqlite3.Connection):
+    CREATE_TABLES_SQL = """
+        CREATE TABLE IF NOT EXISTS notes (
+            note_id integer PRIMARY KEY NOT NULL,
+            word text NOT NULL,
+            mod integer NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS note_chars (
+            char text NOT NULL,
+            note_id integer NOT NULL,
+            PRIMARY KEY (char, note_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS note_chars_note_idx ON note_chars(note_id);
+        CREATE TABLE IF NOT EXISTS sync_state (
+            key text PRIMARY KEY NOT NULL,
+            value text NOT NULL
+        );
+    """
+    conn.executescript(CREATE_TABLES_SQL)
+
+
+def open_mirror(path: str = MIRROR_FILE) -> sqlite3.Connection:
+    conn = sqlite3.connect(path)
+    init_tables(conn)
+    return conn
+
+
+def last_sync(conn: sqlite3.Connection) -> float | None:
+    row = conn.execute("SELECT value FROM sync_state WHERE key = 'last_sync'").fetchone()
+    return None if row is None else float(row[0])
+
+
+def fetch_notes(client: AnkiConnect, note_ids: list[int]) -> list[dict[str, Any]]:
+    batches = [note_ids[i:i + NOTES_INFO_BATCH_SIZE] for i in range(0, len(note_ids), NOTES_INFO_BATCH_SIZE)]
+    results = client.multi([("notesInfo", {"notes": batch}) for batch in batches])
+    return [info for infos in results for info in infos if info]
+
+
+def store_notes(conn: sqlite3.Connection, notes: list[dict[str, Any]]):
+    rows = []
+    for info in notes:
+        field = info.get("fields", {}).get(WORD_FIELD)
+        if field is None:
+            continue
+        rows.append((info["noteId"], field["value"], info.get("mod", 0)))
+    delete_notes(conn, [row[0] for row in rows])
+    conn.executemany("INSERT INTO notes (note_id, word, mod) VALUES (?,?,?)", rows)
+    conn.executemany(
+        "INSERT OR IGNORE INTO note_chars (char, note_id) VALUES (?,?)",
+        ((char, note_id) for note_id, word, _ in rows for char in set(word)),
+    )
+
+
+def delete_notes(conn: sqlite3.Connection, note_ids: list[int]):
+    params = [(note_id,) for note_id in note_ids]
+    conn.executemany("DELETE FROM notes WHERE note_id = ?", params)
+    conn.executemany("DELETE FROM note_chars WHERE note_id = ?", params)
+
+
+def sync(conn: sqlite3.Connection, client: AnkiConnect, full: bool = False) -> tuple[int, int]:
+    """
+    brings the mirror up to date with the collection.
+    Only notes that are new, or were edited since the last sync (by day, as Anki's edited:n search is)
+    are fetched again. Notes that no longer exist are removed.
+    returns the number of notes fetched and removed.
+    """
+    started = time.time()
+    previous = None if full else last_sync(conn)
+
+    remote_ids = set(client.invoke("findNotes", query=f"{WORD_FIELD}:_*"))
+    local_ids = set(row[0] for row in conn.execute("SELECT note_id FROM notes"))
+    if previous is None:
+        to_fetch = remote_ids
+    else:
+        days = int((started - previous) // 86400) + 1
+        edited = set(client.invoke("findNotes", query=f"{WORD_FIELD}:_* edited:{days}"))
+        to_fetch = (remote_ids - local_ids) | (edited & remote_ids)
+    removed = local_ids - remote_ids
+
+    with conn:
+        if full:
+            conn.execute("DELETE FROM notes")
+            conn.execute("DELETE FROM note_chars")
+        delete_notes(conn, sorted(removed))
+        store_notes(conn, fetch_notes(client, sorted(to_fetch)))
+        conn.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES ('last_sync', ?)", (str(started),))
+    return len(to_fetch), len(removed)
+
+
+def search_words(conn: sqlite3.Connection, kanji: str, limit: int) -> tuple[list[str], int]:
+    """
+    equivalent of searching `Word:*{kanji}*` in Anki:
+    returns the words of the first `limit` matching notes, and the number of matching notes
+    """
+    SQL = """
+        SELECT notes.word FROM note_chars JOIN notes USING (note_id)
+        WHERE note_chars.char = ? AND instr(notes.word, ?) > 0
+        ORDER BY notes.note_id
+    """
+    words = [row[0] for row in conn.execute(SQL, (kanji[0], kanji))]
+    return words[:limit], len(words)
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--full", action="store_true", help="rebuild the mirror from scratch")
+    parser.add_argument("--anki-url", type=str, default=ANKI_CONNECT_URL)
+    parser.add_argument("--mirror-file", type=str, default=MIRROR_FILE)
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    with AnkiConnect(args.anki_url) as client:
+        conn = open_mirror(args.mirror_file)
+        fetched, removed = sync(conn, client, args.full)
+        conn.close()
+    print(f"{fetched} notes fetched, {removed} removed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+before/after benchmarks of the optimizations of the build, on the files of the working tree.
+Each benchmark runs the old and the new code path on the same input, checks that they give the same result,
+and prints the best time of several runs.
+
+- parse: kanjivg.xml parsed by KanjisHandler through xml.sax, which calls BasicHandler.startElement/endElement
+  for every tag and looks up the handle_* callbacks by name, against ExpatDriver (utils.readXmlFile)
+- build: gen_db.py with the svg file of each kanji found by scanning the whole listSvgFiles() list,
+  as find_svg_id did, against the SvgCatalog lookup. The lookups are timed alone, then in full builds
+  of kanjivg.db in a temporary directory, so that the kanjivg.db of the working tree is left as is
+
+examples:
+
+python3 bench.py parse
+python3 bench.py parse --runs 10 --xml-file kanjivg.min.xml
+python3 bench.py build --runs 1
+"""
+
+import io
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import tempfile
+import contextlib
+import argparse
+import xml.sax
+from typing import Any, Callable
+
+import gen_db
+from kanjivg import KanjisHandler
+from utils import readXmlFile, iterXmlFile, SvgCatalog
+
+
+def best_time(func: Callable[[], Any], runs: int) -> tuple[float, Any]:
+    """returns the best wall time of `runs` calls of func, and the result of the last call"""
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        # the warnings handlers print about the data are the same for every run
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def print_times(title: str, times: list[tuple[str, float]]):
+    print(title)
+    width = max(len(name) for name, _ in times)
+    for name, elapsed in times:
+        print(f"  {name:<{width}}  {elapsed:.2f}s")
+    if len(times) == 2 and times[1][1] > 0:
+        print(f"  {times[0][1] / times[1][1]:.1f}x faster")
+
+
+def parse_sax(path: str) -> dict[str, Any]:
+    # utils.parseXmlFile before ExpatDriver
+    handler = KanjisHandler()
+    xml.sax.parse(path, handler)
+    return handler.kanjis
+
+
+def bench_parse(args):
+    sax_time, sax_kanjis = best_time(lambda: parse_sax(args.xml_file), args.runs)
+    expat_time, expat_kanjis = best_time(lambda: readXmlFile(args.xml_file), args.runs)
+    if list(sax_kanjis) != list(expat_kanjis) or any(repr(sax_kanjis[key]) != repr(expat_kanjis[key]) for key in sax_kanjis):
+        raise RuntimeError("xml.sax and ExpatDriver parsed different kanji")
+    print_times(f"{args.xml_file}: {len(expat_kanjis)} kanji, best of {args.runs} runs", [
+        ("xml.sax + BasicHandler", sax_time),
+        ("ExpatDriver", expat_time),
+    ])
+
+
+class ScanCatalog(SvgCatalog):
+    """SvgCatalog whose base() filters the whole file list on every call, as gen_db.find_svg_id did before SvgCatalog"""
+    def __init__(self, dir):
+        SvgCatalog.__init__(self, dir)
+        self.all_svg_files = list(self)
+
+    def base(self, id):
+        svg_files = [f for f in self.all_svg_files if f.id == id]
+        for svg_file in svg_files:
+            if not hasattr(svg_file, "variant"):
+                return svg_file
+        return svg_files[0] if svg_files else None
+
+
+def resolve_svg_files(catalog_class: type[SvgCatalog], dir: str, ids: list[str]) -> list[str]:
+    catalog = catalog_class(dir)
+    return [gen_db.find_svg_id(id, catalog).path for id in ids]
+
+
+def build_db(catalog_class: type[SvgCatalog], dir: str) -> list[tuple]:
+    """runs gen_db.py in dir with catalog_class in place of SvgCatalog, returns the rows of the kanjivg table"""
+    cwd, argv = os.getcwd(), sys.argv
+    os.chdir(dir)
+    sys.argv = ["gen_db.py"]
+    gen_db.SvgCatalog = catalog_class
+    try:
+        if os.path.exists("kanjivg.db"):
+            os.remove("kanjivg.db")
+        gen_db.main()
+        # svgs are left out, each build trains its own compression dictionary
+        with sqlite3.connect("kanjivg.db") as conn:
+            return conn.execute("SELECT id, element, decomposition, components, combinations FROM kanjivg ORDER BY id").fetchall()
+    finally:
+        gen_db.SvgCatalog = SvgCatalog
+        sys.argv = argv
+        os.chdir(cwd)
+
+
+def bench_build(args):
+    with contextlib.redirect_stdout(io.StringIO()):
+        ids = [kanji.code for kanji in iterXmlFile("kanjivg.xml")]
+    scan_time, scan_paths = best_time(lambda: resolve_svg_files(ScanCatalog, args.kanji_dir, ids), args.runs)
+    catalog_time, catalog_paths = best_time(lambda: resolve_svg_files(SvgCatalog, args.kanji_dir, ids), args.runs)
+    if scan_paths != catalog_paths:
+        raise RuntimeError("the list scan and SvgCatalog found different svg files")
+    print_times(f"{args.kanji_dir}: {len(ids)} kanji -> svg file, best of {args.runs} runs", [
+        ("listSvgFiles scan", scan_time),
+        ("SvgCatalog", catalog_time),
+    ])
+
+    dir = tempfile.mkdtemp()
+    try:
+        # gen_db.py reads these from the current directory
+        for name in ["kanjivg.xml", "custom.json"]:
+            shutil.copy(name, os.path.join(dir, name))
+        os.symlink(os.path.abspath(args.kanji_dir), os.path.join(dir, "kanji"))
+        scan_time, scan_rows = best_time(lambda: build_db(ScanCatalog, dir), args.runs)
+        catalog_time, catalog_rows = best_time(lambda: build_db(SvgCatalog, dir), args.runs)
+    finally:
+        shutil.rmtree(dir)
+    if scan_rows != catalog_rows:
+        raise RuntimeError("the builds with the list scan and with SvgCatalog differ")
+    print_times(f"gen_db.py: {len(catalog_rows)} rows, best of {args.runs} runs", [
+        ("listSvgFiles scan", scan_time),
+        ("SvgCatalog", catalog_time),
+    ])
+
+
+def get_args():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--runs", type=int, default=5, help="number of runs of each code path, the best time is printed")
+    parser = argparse.ArgumentParser()
+    benchmarks = parser.add_subparsers(dest="benchmark", required=True)
+    parse = benchmarks.add_parser("parse", parents=[common], help="parse an aggregation file with xml.sax and with ExpatDriver")
+    parse.add_argument("--xml-file", type=str, default="kanjivg.xml")
+    parse.set_defaults(func=bench_parse)
+    build = benchmarks.add_parser("build", parents=[common], help="build kanjivg.db with the svg files found by a list scan and by SvgCatalog")
+    build.add_argument("--kanji-dir", type=str, default="kanji")
+    build.set_defaults(func=bench_build)
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,465 @@
+"""
+binary copy of kanjivg.xml, written by kvg.py release, that is memory mapped and read one kanji at a time
+instead of parsing the whole xml file:
+
+    header
+    slots:          hash table of the codepoints, the index + 1 of their first entry (0 = empty slot)
+    entries:        one per kanji, sorted by codepoint and variant: its groups and strokes
+    string offsets: start of each string of the string table, and end of the last one
+    string data:    utf-8 strings shared by all kanji: elements, positions, stroke types... (string 0 is None)
+    groups:         packed StrokeGr records of every kanji, in document order
+    strokes:        packed Stroke records of every kanji, in document order
+    paths:          utf-8 path data of every stroke
+
+a group has the index of its parent group and the number of strokes of the kanji before it,
+which is enough to interleave groups and strokes back in the order of the xml file.
+the records of a kanji only refer to the string table, to its own groups and to its own path data,
+so release --incremental copies the records of the kanji that did not change from the previous binary file
+and only parses and packs the blocks it transformed again (see update_corpus).
+
+the header records the size and mtime of the release file it was made from,
+open_corpus only opens the binary file if it matches the current release file.
+
+examples:
+
+python3 binary_corpus.py          # writes kanjivg.bin from kanjivg.xml, and checks it
+python3 kvg_lookup.py find-xml 未  # reads 未 from kanjivg.bin
+"""
+
+import os
+import sys
+import mmap
+import time
+import struct
+import argparse
+from typing import Iterator
+
+from kanjivg import Kanji, StrokeGr, Stroke
+from kvg import releaseFile
+from utils import iterXmlFile, canonicalId
+
+BINARY_FILE = "kanjivg.bin"
+MAGIC = b"KVGB"
+VERSION = 2
+
+# magic, version, slot bits, release file mtime_ns and size, kanji, string, group and stroke counts,
+# offsets of the slots, entries, string offsets, string data, groups, strokes and paths
+HEADER = struct.Struct("<4sHHqqIIII7I")
+SLOT = struct.Struct("<I")
+# codepoint, variant, group count, stroke count, first group, first stroke, first path byte, path bytes
+ENTRY = struct.Struct("<IHHHIIII")
+STRING_OFFSET = struct.Struct("<I")
+# parent (local index), strokes before, element, original, position, radical, phon, variant, partial, part, number, flags
+GROUP = struct.Struct("<HHHHHHHHHBBB")
+# parent (local index), type, path offset (from the first path byte of the kanji), path length
+STROKE = struct.Struct("<HHIH")
+
+NO_PARENT = 0xFFFF
+NO_PATH = 0xFFFF
+MAX_STRINGS = 0xFFFF
+TRAD_FORM = 1
+RADICAL_FORM = 2
+
+
+def slot_of(code: int, bits: int) -> int:
+    # fibonacci hashing of the codepoint
+    return ((code * 2654435761) & 0xFFFFFFFF) >> (32 - bits)
+
+
+class StringTable:
+    """interned strings, string 0 being None. Starts with the strings of a previous table when given, keeping their ids"""
+    def __init__(self, strings: list[bytes] | None = None):
+        self.strings: list[bytes] = strings or [b""]
+        self.ids: dict[str, int] = {value.decode("utf-8"): sid for sid, value in enumerate(self.strings) if sid > 0}
+
+    def add(self, value: str | None) -> int:
+        if value is None or value is False:
+            return 0
+        sid = self.ids.get(value)
+        if sid is None:
+            sid = len(self.strings)
+            if sid > MAX_STRINGS:
+                raise ValueError(f"more than {MAX_STRINGS} distinct strings")
+            self.ids[value] = sid
+            self.strings.append(value.encode("utf-8"))
+        return sid
+
+
+def pack_kanji(kanji: Kanji, strings: StringTable, groups: bytearray, strokes: bytearray, paths: bytearray) -> tuple[int, int]:
+    # appends the records of kanji, returns its group and stroke counts
+    group_ids: dict[int, int] = {}
+    stroke_count = 0
+    first_path = len(paths)
+
+    def pack_group(group: StrokeGr, parent: int):
+        nonlocal stroke_count
+        index = len(group_ids)
+        group_ids[id(group)] = index
+        flags = (TRAD_FORM if group.tradForm else 0) | (RADICAL_FORM if group.radicalForm else 0)
+        groups.extend(GROUP.pack(
+            parent, stroke_count,
+            strings.add(group.element), strings.add(group.original), strings.add(group.position),
+            strings.add(group.radical), strings.add(group.phon), strings.add(group.variant), strings.add(group.partial),
+            group.part or 0, group.number or 0, flags,
+        ))
+        for child in group.childs:
+            if isinstance(child, StrokeGr):
+                pack_group(child, index)
+                continue
+            if child.svg is None:
+                path_offset, path_length = 0, NO_PATH
+            else:
+                path = child.svg.encode("utf-8")
+                path_offset, path_length = len(paths) - first_path, len(path)
+                paths.extend(path)
+            strokes.extend(STROKE.pack(index, strings.add(child.stype), path_offset, path_length))
+            stroke_count += 1
+
+    pack_group(kanji.strokes, NO_PARENT)
+    return len(group_ids), stroke_count
+
+
+def sort_key(code: str | int, variant: str | None) -> tuple[int, str]:
+    return (code if isinstance(code, int) else int(code, 16), variant or "")
+
+
+class CorpusWriter:
+    """
+    the sections of a binary file, filled one kanji at a time in entry order:
+    either packed from its tree with add, or copied from another binary file with copy
+    """
+    def __init__(self, strings: list[bytes] | None = None):
+        self.strings = StringTable(strings)
+        self.codes: list[int] = []
+        self.entries = bytearray()
+        self.groups = bytearray()
+        self.strokes = bytearray()
+        self.paths = bytearray()
+
+    def add(self, kanji: Kanji):
+        first_group, first_stroke, first_path = len(self.groups) // GROUP.size, len(self.strokes) // STROKE.size, len(self.paths)
+        group_count, stroke_count = pack_kanji(kanji, self.strings, self.groups, self.strokes, self.paths)
+        code = int(kanji.code, 16)
+        self.codes.append(code)
+        self.entries.extend(ENTRY.pack(code, self.strings.add(kanji.variant), group_count, stroke_count,
+                                       first_group, first_stroke, first_path, len(self.paths) - first_path))
+
+    def copy(self, corpus: "BinaryCorpus", first: int, end: int):
+        """
+        the records of the entries first:end of corpus, whose string table this writer started with.
+        Their records are contiguous in corpus, so they are copied at once and only the entries are rebased
+        """
+        if first == end:
+            return
+        data = corpus.data
+        start = corpus.entries_offset
+        entries = list(ENTRY.iter_unpack(data[start + first * ENTRY.size:start + end * ENTRY.size]))
+        _, _, _, _, first_group, first_stroke, first_path, _ = entries[0]
+        _, _, group_count, stroke_count, last_group, last_stroke, last_path, path_size = entries[-1]
+        group_shift = len(self.groups) // GROUP.size - first_group
+        stroke_shift = len(self.strokes) // STROKE.size - first_stroke
+        path_shift = len(self.paths) - first_path
+        for code, variant, group_count_, stroke_count_, group, stroke, path, size in entries:
+            self.codes.append(code)
+            self.entries.extend(ENTRY.pack(code, variant, group_count_, stroke_count_, group + group_shift, stroke + stroke_shift, path + path_shift, size))
+        start = corpus.groups_offset
+        self.groups.extend(data[start + first_group * GROUP.size:start + (last_group + group_count) * GROUP.size])
+        start = corpus.strokes_offset
+        self.strokes.extend(data[start + first_stroke * STROKE.size:start + (last_stroke + stroke_count) * STROKE.size])
+        start = corpus.paths_offset
+        self.paths.extend(data[start + first_path:start + last_path + path_size])
+
+    def write(self, path: str, source: str) -> int:
+        """writes the binary file, made from the release file source, returns its size"""
+        # at most half full, so that probes stay short
+        bits = max(len(self.codes) * 2 - 1, 1).bit_length()
+        slots = [0] * (1 << bits)
+        for index, code in enumerate(self.codes):
+            if index > 0 and self.codes[index - 1] == code:
+                continue
+            slot = slot_of(code, bits)
+            while slots[slot]:
+                slot = (slot + 1) & ((1 << bits) - 1)
+            slots[slot] = index + 1
+
+        string_offsets = bytearray()
+        string_data = bytearray()
+        for value in self.strings.strings:
+            string_offsets.extend(STRING_OFFSET.pack(len(string_data)))
+            string_data.extend(value)
+        string_offsets.extend(STRING_OFFSET.pack(len(string_data)))
+
+        sections = [struct.pack(f"<{len(slots)}I", *slots), self.entries, string_offsets, string_data, self.groups, self.strokes, self.paths]
+        offsets = []
+        offset = HEADER.size
+        for section in sections:
+            offsets.append(offset)
+            offset += len(section)
+
+        st = os.stat(source)
+        header = HEADER.pack(MAGIC, VERSION, bits, st.st_mtime_ns, st.st_size, len(self.codes), len(self.strings.strings),
+                             len(self.groups) // GROUP.size, len(self.strokes) // STROKE.size, *offsets)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+            for section in sections:
+                f.write(section)
+        os.replace(tmp_path, path)
+        return offset
+
+
+def write_corpus(kanjis: list[Kanji], path: str = BINARY_FILE, source: str = releaseFile) -> int:
+    """writes the binary file of kanjis, made from the release file source, returns its size"""
+    writer = CorpusWriter()
+    for kanji in sorted(kanjis, key=lambda kanji: sort_key(kanji.code, kanji.variant)):
+        writer.add(kanji)
+    return writer.write(path, source)
+
+
+def update_corpus(old: "BinaryCorpus", unchanged: list[tuple[str, str | None]], changed: list[Kanji],
+                  path: str = BINARY_FILE, source: str = releaseFile) -> int | None:
+    """
+    writes the binary file of the (code, variant) unchanged kanji, copied from old, and of the changed kanji, packed.
+    The strings of old are kept, even those only the removed kanji used, a full write drops them.
+    Returns the size of the file, or None without writing it if one of the unchanged kanji is not in old
+    """
+    indexes = old.sort_keys()
+    items: list[tuple[tuple[int, str], int | Kanji]] = []
+    for code, variant in unchanged:
+        index = indexes.get(sort_key(code, variant))
+        if index is None:
+            return None
+        items.append((sort_key(code, variant), index))
+    items.extend((sort_key(kanji.code, kanji.variant), kanji) for kanji in changed)
+    items.sort(key=lambda item: item[0])
+    if any(items[i][0] == items[i + 1][0] for i in range(len(items) - 1)):
+        return None
+
+    writer = CorpusWriter(old.raw_strings())
+    # runs of consecutive entries of old are copied at once
+    run_start = run_end = 0
+    for _, item in items:
+        if isinstance(item, int) and item == run_end:
+            run_end += 1
+            continue
+        writer.copy(old, run_start, run_end)
+        if isinstance(item, int):
+            run_start, run_end = item, item + 1
+        else:
+            run_start = run_end = 0
+            writer.add(item)
+    writer.copy(old, run_start, run_end)
+    return writer.write(path, source)
+
+
+def parse_blocks(blocks: list[bytes]) -> list[Kanji]:
+    # the kanji of <kanji> blocks of the release file
+    from kanjivg import KanjisHandler
+    from xmlhandler import ExpatDriver
+    handler = KanjisHandler()
+    driver = ExpatDriver(handler)
+    driver.feed(b"<kanjivg>")
+    kanjis = []
+    for block in blocks:
+        driver.feed(block)
+        kanjis.extend(handler.kanjis.values())
+        handler.kanjis.clear()
+    driver.feed(b"</kanjivg>", True)
+    return kanjis
+
+
+def write_release_corpus(release_file: str = releaseFile, path: str = BINARY_FILE) -> int:
+    return write_corpus(list(iterXmlFile(release_file)), path, release_file)
+
+
+def update_release_corpus(old: "BinaryCorpus", unchanged: list[tuple[str, str | None]], blocks: list[bytes],
+                          release_file: str = releaseFile, path: str = BINARY_FILE) -> int | None:
+    """update_corpus with the <kanji> blocks release --incremental transformed again"""
+    return update_corpus(old, unchanged, parse_blocks(blocks), path, release_file)
+
+
+class BinaryCorpus:
+    """
+    the memory mapped binary file. Kanji trees are built when asked for, with get or by iterating,
+    and strings are decoded once
+    """
+    def __init__(self, path: str = BINARY_FILE):
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.bits, self.source_mtime_ns, self.source_size,
+         self.kanji_count, self.string_count, self.group_count, self.stroke_count,
+         self.slots_offset, self.entries_offset, self.string_offsets_offset, self.string_data_offset,
+         self.groups_offset, self.strokes_offset, self.paths_offset) = HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != VERSION:
+            self.data.close()
+            raise ValueError(f"{path} is not a version {VERSION} binary corpus")
+        self.strings: list[str | None] = [None] * self.string_count
+
+    def close(self):
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.kanji_count
+
+    def raw_strings(self) -> list[bytes]:
+        offsets = struct.unpack_from(f"<{self.string_count + 1}I", self.data, self.string_offsets_offset)
+        start = self.string_data_offset
+        return [self.data[start + offsets[sid]:start + offsets[sid + 1]] for sid in range(self.string_count)]
+
+    def sort_keys(self) -> dict[tuple[int, str], int]:
+        # (codepoint, variant or "") -> index of every entry
+        start = self.entries_offset
+        entries = ENTRY.iter_unpack(self.data[start:start + self.kanji_count * ENTRY.size])
+        return {(code, self.string(variant) or ""): index for index, (code, variant, *_) in enumerate(entries)}
+
+    def entry(self, index: int) -> tuple[int, ...]:
+        return ENTRY.unpack_from(self.data, self.entries_offset + index * ENTRY.size)
+
+    def string(self, sid: int) -> str | None:
+        if sid == 0:
+            return None
+        value = self.strings[sid]
+        if value is None:
+            start, end = struct.unpack_from("<II", self.data, self.string_offsets_offset + sid * STRING_OFFSET.size)
+            value = sys.intern(self.data[self.string_data_offset + start:self.string_data_offset + end].decode("utf-8"))
+            self.strings[sid] = value
+        return value
+
+    def find(self, code: str | int, variant: str | None = None) -> int | None:
+        """index of the entry of a kanji (character, hex code or codepoint), None if there is none"""
+        codepoint = int(canonicalId(code), 16)
+        mask = (1 << self.bits) - 1
+        slot = slot_of(codepoint, self.bits)
+        while True:
+            index = SLOT.unpack_from(self.data, self.slots_offset + slot * SLOT.size)[0]
+            if index == 0:
+                return None
+            index -= 1
+            if ENTRY.unpack_from(self.data, self.entries_offset + index * ENTRY.size)[0] == codepoint:
+                break
+            slot = (slot + 1) & mask
+        # the variants of a codepoint follow its first entry
+        while index < self.kanji_count:
+            entry_code, entry_variant = ENTRY.unpack_from(self.data, self.entries_offset + index * ENTRY.size)[:2]
+            if entry_code != codepoint:
+                return None
+            if self.string(entry_variant) == variant:
+                return index
+            index += 1
+        return None
+
+    def __contains__(self, code: str | int) -> bool:
+        return self.find(code) is not None
+
+    def get(self, code: str | int, variant: str | None = None) -> Kanji | None:
+        index = self.find(code, variant)
+        return None if index is None else self.kanji(index)
+
+    def kanji(self, index: int) -> Kanji:
+        """builds the tree of the entry at index"""
+        codepoint, variant, group_count, stroke_count, first_group, first_stroke, first_path, _ = self.entry(index)
+        kanji = Kanji(codepoint, self.string(variant))
+        string = self.string
+        start = self.strokes_offset + first_stroke * STROKE.size
+        stroke_records = list(STROKE.iter_unpack(self.data[start:start + stroke_count * STROKE.size]))
+        groups: list[StrokeGr] = []
+        next_stroke = 0
+
+        def add_strokes(end: int):
+            nonlocal next_stroke
+            for parent, stype, path_offset, path_length in stroke_records[next_stroke:end]:
+                stroke = Stroke(groups[parent])
+                stroke.stype = string(stype)
+                if path_length != NO_PATH:
+                    path_start = self.paths_offset + first_path + path_offset
+                    stroke.svg = self.data[path_start:path_start + path_length].decode("utf-8")
+                groups[parent].childs.append(stroke)
+            next_stroke = max(next_stroke, end)
+
+        start = self.groups_offset + first_group * GROUP.size
+        for (parent, strokes_before, element, original, position, radical, phon, group_variant, partial,
+             part, number, flags) in GROUP.iter_unpack(self.data[start:start + group_count * GROUP.size]):
+            add_strokes(strokes_before)
+            group = StrokeGr(None if parent == NO_PARENT else groups[parent])
+            group.element = string(element)
+            group.original = string(original)
+            group.position = string(position)
+            group.radical = string(radical)
+            group.phon = string(phon)
+            group.variant = string(group_variant) or False
+            group.partial = string(partial) or False
+            group.part = part or None
+            group.number = number or None
+            group.tradForm = bool(flags & TRAD_FORM)
+            group.radicalForm = bool(flags & RADICAL_FORM)
+            groups.append(group)
+        add_strokes(stroke_count)
+        kanji.strokes = groups[0]
+        return kanji
+
+    def __iter__(self) -> Iterator[Kanji]:
+        for index in range(self.kanji_count):
+            yield self.kanji(index)
+
+
+def open_corpus(release_file: str = releaseFile, path: str = BINARY_FILE) -> BinaryCorpus | None:
+    """the binary corpus of release_file, None if it is missing or was made from another version of release_file"""
+    try:
+        corpus = BinaryCorpus(path)
+        st = os.stat(release_file)
+    except (OSError, ValueError):
+        return None
+    if (corpus.source_mtime_ns, corpus.source_size) != (st.st_mtime_ns, st.st_size):
+        corpus.close()
+        return None
+    return corpus
+
+
+def iter_kanji(release_file: str = releaseFile) -> Iterator[Kanji]:
+    """the kanji of release_file, read from its binary corpus if it is up to date, parsed otherwise"""
+    corpus = open_corpus(release_file)
+    if corpus is None:
+        yield from iterXmlFile(release_file)
+        return
+    with corpus:
+        yield from corpus
+
+
+def check_corpus(release_file: str = releaseFile, path: str = BINARY_FILE) -> int:
+    # compares every kanji of the binary file with the parsed release file, returns the kanji count
+    with BinaryCorpus(path) as corpus:
+        count = 0
+        for kanji in iterXmlFile(release_file):
+            stored = corpus.get(kanji.code, kanji.variant)
+            if stored is None or repr(stored) != repr(kanji):
+                raise ValueError(f"{kanji.kId()} differs in {path}")
+            count += 1
+        if count != len(corpus):
+            raise ValueError(f"{path} has {len(corpus)} kanji, {release_file} has {count}")
+    return count
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--release-file", type=str, default=releaseFile)
+    parser.add_argument("--output", type=str, default=BINARY_FILE)
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    started = time.time()
+    size = write_release_corpus(args.release_file, args.output)
+    written = time.time()
+    count = check_corpus(args.release_file, args.output)
+    print(f"{args.output}: {count} kanji, {size} bytes, written in {written - started:.2f}s, checked in {time.time() - written:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
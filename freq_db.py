@@ -0,0 +1,228 @@
+"""
+stores kanji frequency corpora in kanjivg.db, so they are not parsed from json on every use:
+
+    frequencies(corpus, element, rank, occurrences, display)
+
+- corpus: name of the corpus, by default the directory of its meta bank, i.e. innocent_corpus
+- rank: frequency value of the meta bank (1 = most frequent)
+- occurrences: number of occurrences, if the display value is of format `int (int)`
+- display: display value of the meta bank
+
+and what update_db.py --per-corpus computes from each corpus, kept side by side
+so search.py --corpus can pick one at query time:
+
+    corpus_ranks(corpus, element, rank, occurrences, cumulative_percent)
+    corpus_combinations(corpus, element, combinations)
+
+examples:
+
+python3 freq_db.py kanji_freq/innocent_corpus/kanji_meta_bank_1.json
+python3 freq_db.py --corpus aozora kanji_freq/aozora
+"""
+
+import os
+import re
+import json
+import sqlite3
+import argparse
+from typing import Iterable, Iterator
+
+from sort_kanji import FreqMap, to_freq_map, rx_FREQ_USAGE
+
+DEFAULT_CORPUS = "innocent_corpus"
+
+
+def init_table(conn: sqlite3.Connection):
+    CREATE_TABLE_SQL = """
+        CREATE TABLE IF NOT EXISTS frequencies (
+            corpus text NOT NULL,
+            element text NOT NULL,
+            rank integer NOT NULL,
+            occurrences integer,
+            display text NOT NULL,
+            PRIMARY KEY (corpus, element)
+        ) WITHOUT ROWID;
+    """
+    conn.execute(CREATE_TABLE_SQL)
+    conn.execute("CREATE INDEX IF NOT EXISTS frequencies_rank_idx ON frequencies(corpus, rank)")
+
+
+def init_corpus_tables(conn: sqlite3.Connection):
+    CREATE_TABLES_SQL = """
+        CREATE TABLE IF NOT EXISTS corpus_ranks (
+            corpus text NOT NULL,
+            element text NOT NULL,
+            rank integer NOT NULL,
+            occurrences integer,
+            cumulative_percent real,
+            PRIMARY KEY (corpus, element)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS corpus_combinations (
+            corpus text NOT NULL,
+            element text NOT NULL,
+            combinations text NOT NULL,
+            PRIMARY KEY (corpus, element)
+        ) WITHOUT ROWID;
+    """
+    conn.executescript(CREATE_TABLES_SQL)
+
+
+def has_table(conn: sqlite3.Connection, table: str) -> bool:
+    SQL = "SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?"
+    return conn.execute(SQL, (table,)).fetchone() is not None
+
+
+def has_corpus(conn: sqlite3.Connection, corpus: str) -> bool:
+    if not has_table(conn, "frequencies"):
+        return False
+    return conn.execute("SELECT 1 FROM frequencies WHERE corpus = ? LIMIT 1", (corpus,)).fetchone() is not None
+
+
+def list_corpora(conn: sqlite3.Connection) -> list[str]:
+    if not has_table(conn, "frequencies"):
+        return []
+    return [row[0] for row in conn.execute("SELECT DISTINCT corpus FROM frequencies ORDER BY corpus")]
+
+
+def meta_bank_files(path: str) -> list[str]:
+    # a meta bank file, or a directory containing kanji_meta_bank_*.json files
+    if not os.path.isdir(path):
+        return [path]
+    rx_bank = re.compile(r"kanji_meta_bank_(\d+)\.json")
+    banks = [(int(m.group(1)), f) for f in os.listdir(path) if (m := rx_bank.fullmatch(f))]
+    return [os.path.join(path, f) for _, f in sorted(banks)]
+
+
+def read_meta_banks(paths: Iterable[str]) -> FreqMap:
+    freq_list = []
+    for path in paths:
+        for bank in meta_bank_files(path):
+            with open(bank) as f:
+                freq_list.extend(json.load(f))
+    return to_freq_map(freq_list)
+
+
+def to_rows(corpus: str, freq_map: FreqMap) -> Iterator[tuple[str, str, int, int | None, str]]:
+    for element, freq in freq_map.items():
+        display = str(freq.get("displayValue", freq["value"]))
+        result = rx_FREQ_USAGE.match(display)
+        occurrences = int(result.group(1)) if result else None
+        yield (corpus, element, freq["value"], occurrences, display)
+
+
+def ingest_freq_map(conn: sqlite3.Connection, corpus: str, freq_map: FreqMap) -> int:
+    # replaces the whole corpus
+    init_table(conn)
+    conn.execute("DELETE FROM frequencies WHERE corpus = ?", (corpus,))
+    INSERT_SQL = "INSERT OR REPLACE INTO frequencies (corpus, element, rank, occurrences, display) VALUES (?,?,?,?,?)"
+    conn.executemany(INSERT_SQL, to_rows(corpus, freq_map))
+    return len(freq_map)
+
+
+def load_freq_map(conn: sqlite3.Connection, corpus: str) -> FreqMap:
+    SQL = "SELECT element, rank, display FROM frequencies WHERE corpus = ?"
+    return {element: {"value": rank, "displayValue": display} for element, rank, display in conn.execute(SQL, (corpus,))}
+
+
+def load_rank_map(conn: sqlite3.Connection, corpus: str, occurrence_based: bool) -> dict[str, int]:
+    # element -> occurrences (or rank) of the corpus, see update_db.py
+    if occurrence_based:
+        SQL = "SELECT element, occurrences FROM frequencies WHERE corpus = ? AND occurrences IS NOT NULL"
+    else:
+        SQL = "SELECT element, rank FROM frequencies WHERE corpus = ?"
+    return dict(conn.execute(SQL, (corpus,)).fetchall())
+
+
+def has_occurrences(conn: sqlite3.Connection, corpus: str) -> bool:
+    # whether the display values of corpus had occurrences, rank only corpora (aozora, jpdb...) have none
+    SQL = "SELECT 1 FROM frequencies WHERE corpus = ? AND occurrences IS NOT NULL LIMIT 1"
+    return conn.execute(SQL, (corpus,)).fetchone() is not None
+
+
+def has_corpus_combinations(conn: sqlite3.Connection, corpus: str) -> bool:
+    if not has_table(conn, "corpus_combinations"):
+        return False
+    return conn.execute("SELECT 1 FROM corpus_combinations WHERE corpus = ? LIMIT 1", (corpus,)).fetchone() is not None
+
+
+def has_corpus_ranks(conn: sqlite3.Connection, corpus: str) -> bool:
+    if not has_table(conn, "corpus_ranks"):
+        return False
+    return conn.execute("SELECT 1 FROM corpus_ranks WHERE corpus = ? LIMIT 1", (corpus,)).fetchone() is not None
+
+
+def load_corpus_rank(conn: sqlite3.Connection, corpus: str, element: str) -> tuple[int, int | None, float | None] | None:
+    # (rank, occurrences, cumulative_percent) of element in corpus, None if update_db.py --per-corpus did not store them
+    SQL = "SELECT rank, occurrences, cumulative_percent FROM corpus_ranks WHERE corpus = ? AND element = ?"
+    return conn.execute(SQL, (corpus, element)).fetchone()
+
+
+def load_combinations(conn: sqlite3.Connection, corpus: str, element: str) -> list[str] | None:
+    # the combinations of element sorted by corpus, None if update_db.py --per-corpus did not store them
+    SQL = "SELECT combinations FROM corpus_combinations WHERE corpus = ? AND element = ?"
+    row = conn.execute(SQL, (corpus, element)).fetchone()
+    return None if row is None else json.loads(row[0])
+
+
+class CorpusFreqMap:
+    """
+    read only, dict like view of a corpus: each get() is a single indexed lookup,
+    instead of loading the whole corpus in memory.
+    With ranked, values are the ranks update_db.py --per-corpus stored in corpus_ranks,
+    the order its corpus_combinations are sorted in, with their occurrences and cumulative percent
+    """
+    SQL = "SELECT rank, display FROM frequencies WHERE corpus = ? AND element = ?"
+    RANKED_SQL = """
+        SELECT corpus_ranks.rank, frequencies.display, corpus_ranks.occurrences, corpus_ranks.cumulative_percent
+        FROM corpus_ranks LEFT JOIN frequencies ON frequencies.corpus = corpus_ranks.corpus AND frequencies.element = corpus_ranks.element
+        WHERE corpus_ranks.corpus = ? AND corpus_ranks.element = ?
+    """
+
+    def __init__(self, conn: sqlite3.Connection, corpus: str, ranked: bool = False):
+        self.conn = conn
+        self.corpus = corpus
+        self.ranked = ranked
+
+    def get(self, element: str, default=None):
+        if self.ranked:
+            row = self.conn.execute(self.RANKED_SQL, (self.corpus, element)).fetchone()
+            if row is None:
+                return default
+            return {"value": row[0], "displayValue": row[1], "occurrences": row[2], "cumulativePercent": row[3]}
+        row = self.conn.execute(self.SQL, (self.corpus, element)).fetchone()
+        if row is None:
+            return default
+        return {"value": row[0], "displayValue": row[1]}
+
+    def __getitem__(self, element: str):
+        freq = self.get(element)
+        if freq is None:
+            raise KeyError(element)
+        return freq
+
+    def __contains__(self, element: str) -> bool:
+        return self.get(element) is not None
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("meta_banks", type=str, nargs="+", help="kanji_meta_bank_*.json files, or directories containing them")
+    parser.add_argument("--corpus", type=str, default=None, help="defaults to the name of the directory of the first meta bank")
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    corpus = args.corpus
+    if corpus is None:
+        first = os.path.abspath(args.meta_banks[0])
+        corpus = os.path.basename(first if os.path.isdir(first) else os.path.dirname(first))
+
+    freq_map = read_meta_banks(args.meta_banks)
+    with sqlite3.connect("kanjivg.db") as conn:
+        count = ingest_freq_map(conn, corpus, freq_map)
+    print(f"{count} kanji ingested into corpus {corpus}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,17 @@
-from kvg_lookup import canonicalId, readXmlFile
+from kvg_lookup import canonicalId
 from kanjivg import Kanji, StrokeGr, Stroke
 from util import json_to_str
-from utils import listSvgFiles, SvgFileInfo
+from utils import SvgCatalog, SvgFileInfo
+from binary_corpus import iter_kanji
 from kanji_data import KanjiData
+import svg_store
 
 
 import json
 import sqlite3
-from typing import Any
+import hashlib
+import argparse
+from typing import Any, Iterable, Iterator
 from collections import defaultdict
 
 # select * from decompositions where data like '%隷%'
@@ -46,16 +50,12 @@ def find_xml(kanji_str: str, files) -> dict[str, Any] | None:
     id = canonicalId(kanji_str)
     return find_xml_id(id, files)
 
-def find_svg_id(id, all_svg_files: list[SvgFileInfo]) -> SvgFileInfo:
+def find_svg_id(id, catalog: SvgCatalog) -> SvgFileInfo:
     # finds first file that isn't a variant
-    svg_files = [f for f in all_svg_files if f.id == id]
-    for svg_file in svg_files:
-        if not hasattr(svg_file, "variant"): # non-variant
-            return svg_file
-        #(f.path, f.read())
-    #if len(svg_files) == 0:
-    #    return None
-    return svg_files[0]
+    svg_file = catalog.base(id)
+    if svg_file is None:
+        raise RuntimeError(f"No svg file found for {id}")
+    return svg_file
 
 
 def find_xml_id(id, files):
@@ -65,6 +65,12 @@ def find_xml_id(id, files):
     raise RuntimeError(f"Character {id} ({chr(int(id, 16))}) not found.\n")
 
 
+# compressed svgs are below 1 KB: 8 and 16 KB pages only make lookups read more
+PAGE_SIZE = 4096
+# every nth svg file is used to train the compression dictionary, see svg_store.train_dictionary
+SVG_DICTIONARY_SAMPLE_STEP = 50
+
+
 def init_table(conn: sqlite3.Connection):
     cur = conn.cursor()
 
@@ -75,11 +81,11 @@ def init_table(conn: sqlite3.Connection):
     # components, combinations is of type json array
     # they both can be empty, i.e. {} or []
     # but CANNOT be null
+    # svg files are stored compressed in kanjivg_svg, see svg_store.py
     CREATE_TABLE_SQL = """
         CREATE TABLE kanjivg (
             id integer PRIMARY KEY NOT NULL,
             element text NOT NULL,
-            svg text NOT NULL,
             decomposition text NOT NULL,
             components text NOT NULL,
             combinations text NOT NULL,
@@ -89,23 +95,85 @@ def init_table(conn: sqlite3.Connection):
        );
     """
     cur.execute(CREATE_TABLE_SQL)
+    cur.close()
 
+
+def create_indexes(conn: sqlite3.Connection):
+    # created once the table is loaded, see bulk_load_pragmas
     CREATE_IDX_SQL = f"""
-        CREATE INDEX idx ON kanjivg(element);
+        CREATE INDEX IF NOT EXISTS idx ON kanjivg(element);
+    """
+    conn.execute(CREATE_IDX_SQL)
+
+
+def bulk_load_pragmas(conn: sqlite3.Connection):
+    """
+    build time settings for a full build.
+    The database is rebuilt from scratch anyways, so there is no point in journaling
+    or syncing to disk while loading it.
+    """
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -65536") # 64 MiB
+    conn.execute("PRAGMA temp_store = MEMORY")
+    # only takes effect on a new database, or with the VACUUM of optimize_for_reading
+    conn.execute(f"PRAGMA page_size = {PAGE_SIZE}")
+
+
+def optimize_for_reading(conn: sqlite3.Connection):
+    """
+    gathers statistics for the query planner and rewrites the database file without free pages,
+    after a full build.
+    """
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.execute("PRAGMA journal_mode = DELETE")
+
+
+def init_state_table(conn: sqlite3.Connection):
+    cur = conn.cursor()
+    cur.execute("DROP TABLE IF EXISTS build_state")
+
+    # hash: hash of the svg, decomposition and components columns of the element
+    # combinations_hash: hash of its combinations column
+    CREATE_TABLE_SQL = """
+        CREATE TABLE build_state (
+            element text PRIMARY KEY NOT NULL,
+            hash text NOT NULL,
+            combinations_hash text NOT NULL
+       );
     """
-    cur.execute(CREATE_IDX_SQL)
+    cur.execute(CREATE_TABLE_SQL)
     cur.close()
 
 
+def load_build_state(conn: sqlite3.Connection) -> dict[str, tuple[str, str]] | None:
+    # returns None if the database was not built by gen_db with build state yet
+    cur = conn.cursor()
+    SQL = "SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('kanjivg', 'build_state', 'kanjivg_svg')"
+    if len(cur.execute(SQL).fetchall()) != 3:
+        return None
+    columns = [row[1] for row in cur.execute("PRAGMA table_info(build_state)").fetchall()]
+    if "combinations_hash" not in columns:
+        return None
+    return {row[0]: (row[1], row[2]) for row in cur.execute("SELECT element, hash, combinations_hash FROM build_state")}
+
 
 def find_all_components(summary: dict[str, Any], ignore_element: bool=True) -> list[str]:
     # traverses the tree to find the top most "element" values, if they exist
     # currently ignore individual stroke groups
+    return [element for element, _ in find_component_positions(summary, ignore_element)]
+
+
+def find_component_positions(summary: dict[str, Any], ignore_element: bool=True) -> list[tuple[str, str | None]]:
+    # find_all_components, along with the position of the group of each component
 
     if not ignore_element:
         element = summary.get("element")
         if element is not None:
-            return [element]
+            return [(element, summary.get("position"))]
 
     groups = summary.get("groups")
     if groups is None:
@@ -113,38 +181,350 @@ def find_all_components(summary: dict[str, Any], ignore_element: bool=True) -> l
 
     result = []
     for group in groups:
-        group_comps = find_all_components(group, ignore_element=False)
+        group_comps = find_component_positions(group, ignore_element=False)
         result.extend(group_comps)
     return result
 
 
-def override_data(data):
+def load_overrides() -> dict[str, dict[str, Any]]:
     OVERRIDE_FILE = "custom.json"
     with open(OVERRIDE_FILE) as f:
-        json_data = json.load(f)
-    for key, value in json_data.items():
-        for column, col_val in value.items():
-            if column == "combinations":
-                data[key].combinations.extend(col_val)
-            else:
-                setattr(data[key], column, col_val)
+        return json.load(f)
 
 
+def override_columns(kanji_data: KanjiData, override: dict[str, Any] | None):
+    # combinations are extended once all combinations are known, see BuildWriter.write_combinations
+    if override is None:
+        return
+    for column, col_val in override.items():
+        if column != "combinations":
+            setattr(kanji_data, column, col_val)
 
 
-def main():
-    data: dict[str, KanjiData] = {}
-    combinations = defaultdict(set)
-
-    INSERT_ROW_SQL = "INSERT INTO kanjivg (element, svg, decomposition, components, combinations) VALUES (?,?,?,?,?)"
-
-    # parse gigantic xml file containing all kanjis into summary and components
-    files = readXmlFile("./kanjivg.xml")
-    all_svg_files = listSvgFiles("./kanji/")
-    for key in files.keys():
-        id = canonicalId(key)
-        summary = find_xml_id(id, files)
-        svg_file = find_svg_id(id, all_svg_files)
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--incremental", action="store_true", help="only rewrite the rows that changed since the last build")
+    return parser.parse_args()
+
+
+def text_hash(*values: str) -> str:
+    return hashlib.sha1("\0".join(values).encode("utf-8")).hexdigest()
+
+
+EMPTY_COMBINATIONS = json_to_str([])
+EMPTY_COMBINATIONS_HASH = text_hash(EMPTY_COMBINATIONS)
+
+
+class BuildWriter:
+    """
+    writes kanjivg rows as they are generated: new rows are streamed into a single executemany,
+    so that no more than one row of svg data is held in memory.
+    svgs are compressed with zdict, and written to kanjivg_svg in batches of BATCH_SIZE.
+
+    rows are first written with empty combinations, which are filled by
+    write_combinations once every row has been seen.
+    Rows (or combinations) whose hash matches the previous build state are not written again,
+    which makes an incremental build only touch the rows that changed.
+    """
+    BATCH_SIZE = 256
+
+    INSERT_ROW_SQL = "INSERT INTO kanjivg (element, decomposition, components, combinations) VALUES (?,?,?,?)"
+    UPDATE_ROW_SQL = "UPDATE kanjivg SET (decomposition, components) = (?,?) WHERE element = ?"
+    UPSERT_SVG_SQL = "INSERT OR REPLACE INTO kanjivg_svg (element, data) VALUES (?,?)"
+    DELETE_SVG_SQL = "DELETE FROM kanjivg_svg WHERE element = ?"
+    UPDATE_COMBINATIONS_SQL = "UPDATE kanjivg SET combinations = ? WHERE element = ?"
+    DELETE_ROW_SQL = "DELETE FROM kanjivg WHERE element = ?"
+    UPSERT_STATE_SQL = "INSERT OR REPLACE INTO build_state (element, hash, combinations_hash) VALUES (?,?,?)"
+    DELETE_STATE_SQL = "DELETE FROM build_state WHERE element = ?"
+
+    def __init__(self, conn: sqlite3.Connection, state: dict[str, tuple[str, str]], zdict: bytes):
+        self.cur = conn.cursor()
+        # updates are run while self.cur is still inserting
+        self.update_cur = conn.cursor()
+        # build state of the previous build, empty for a full build
+        self.state = state
+        # element -> hash of every row of this build, in insertion order
+        self.hashes: dict[str, str] = {}
+        self.updates: list[tuple[str, ...]] = []
+        self.zdict = zdict
+        self.svgs: list[tuple[str, bytes]] = []
+        self.added = 0
+        self.updated: set[str] = set()
+
+    def __contains__(self, element: str) -> bool:
+        return element in self.hashes
+
+    def insert(self, items: Iterable[tuple[str, KanjiData]]):
+        self.cur.executemany(self.INSERT_ROW_SQL, self.new_rows(items))
+        self.flush()
+
+    def new_rows(self, items: Iterable[tuple[str, KanjiData]]) -> Iterator[tuple[str, ...]]:
+        """
+        yields the rows of items that are not in the database yet.
+        Rows that changed since the previous build are updated in batches of BATCH_SIZE instead.
+        """
+        for element, kanji_data in items:
+            assert kanji_data.decomposition is not None
+            assert kanji_data.components is not None
+            row = (json_to_str(kanji_data.decomposition), json_to_str(kanji_data.components))
+            row_hash = text_hash(kanji_data.svg, *row)
+            old = self.state.get(element)
+            if element in self.hashes:
+                # every yielded row has been inserted by the time the next one is asked for
+                print(f"{element} is generated more than once, keeping the last one")
+                self.flush()
+                self.update_cur.execute(self.UPDATE_ROW_SQL, row + (element,))
+                self.add_svg(element, kanji_data.svg)
+            elif old is None:
+                self.added += 1
+                self.add_svg(element, kanji_data.svg)
+                yield (element,) + row + (EMPTY_COMBINATIONS,)
+            elif old[0] != row_hash:
+                self.updates.append(row + (element,))
+                self.updated.add(element)
+                self.add_svg(element, kanji_data.svg)
+                if len(self.updates) >= self.BATCH_SIZE:
+                    self.flush()
+            self.hashes[element] = row_hash
+
+    def add_svg(self, element: str, svg: str):
+        self.svgs.append((element, svg_store.compress(svg, self.zdict)))
+        if len(self.svgs) >= self.BATCH_SIZE:
+            self.update_cur.executemany(self.UPSERT_SVG_SQL, self.svgs)
+            self.svgs = []
+
+    def flush(self):
+        if self.updates:
+            self.update_cur.executemany(self.UPDATE_ROW_SQL, self.updates)
+            self.updates = []
+        if self.svgs:
+            self.update_cur.executemany(self.UPSERT_SVG_SQL, self.svgs)
+            self.svgs = []
+
+    def write_combinations(self, parents: dict[str, dict[str, None]], overrides: dict[str, dict[str, Any]]):
+        combination_updates = []
+        states = []
+        for element, row_hash in self.hashes.items():
+            combinations = [parent for parent in parents.get(element, {}) if parent != element]
+            combinations.extend(overrides.get(element, {}).get("combinations", []))
+            combinations_json = json_to_str(combinations)
+            combinations_hash = text_hash(combinations_json)
+
+            old = self.state.get(element)
+            old_combinations_hash = EMPTY_COMBINATIONS_HASH if old is None else old[1]
+            if combinations_hash != old_combinations_hash:
+                combination_updates.append((combinations_json, element))
+                if old is not None:
+                    self.updated.add(element)
+            if old != (row_hash, combinations_hash):
+                states.append((element, row_hash, combinations_hash))
+        self.cur.executemany(self.UPDATE_COMBINATIONS_SQL, combination_updates)
+        self.cur.executemany(self.UPSERT_STATE_SQL, states)
+
+    def delete_missing(self) -> int:
+        # rows of the previous build that were not generated again
+        missing = [(element,) for element in self.state if element not in self.hashes]
+        self.cur.executemany(self.DELETE_ROW_SQL, missing)
+        self.cur.executemany(self.DELETE_SVG_SQL, missing)
+        self.cur.executemany(self.DELETE_STATE_SQL, missing)
+        return len(missing)
+
+    def renumber(self) -> int:
+        """
+        gives every row the id a full build would have given it: its position in the generation order.
+        An incremental build appends new rows after the last id and leaves the ids of removed rows unused,
+        which would change the ids of component_edge and component_bitsets compared to a full build.
+        Returns the number of rows whose id changed
+        """
+        ids = {element: id for id, element in enumerate(self.hashes, start=1)}
+        moved = [(ids[element], element) for element, id in self.cur.execute("SELECT element, id FROM kanjivg").fetchall() if ids[element] != id]
+        # moved rows go through negative ids, so that no two rows have the same id in between
+        self.cur.executemany("UPDATE kanjivg SET id = -? WHERE element = ?", moved)
+        self.cur.execute("UPDATE kanjivg SET id = -id WHERE id < 0")
+        return len(moved)
+
+
+def init_edge_table(conn: sqlite3.Connection):
+    """
+    relational form of the components / combinations columns, one row per component of a kanji:
+    - ordinal: index of the component in the components column of the parent.
+      custom.json combinations that are not in the components of the parent come after them
+    - position: position of the group of the component in the decomposition, if any
+
+    the primary key covers parent -> children, component_edge_child_idx child -> parents
+    """
+    CREATE_TABLE_SQL = """
+        DROP TABLE IF EXISTS component_edge;
+        CREATE TABLE component_edge (
+            parent_id integer NOT NULL,
+            child_id integer NOT NULL,
+            ordinal integer NOT NULL,
+            position text,
+            PRIMARY KEY (parent_id, ordinal)
+        ) WITHOUT ROWID;
+    """
+    conn.executescript(CREATE_TABLE_SQL)
+
+
+def create_edge_indexes(conn: sqlite3.Connection):
+    conn.execute("CREATE INDEX IF NOT EXISTS component_edge_child_idx ON component_edge(child_id, parent_id, ordinal, position)")
+
+
+def edge_rows(conn: sqlite3.Connection) -> list[tuple[int, int, int, str | None]]:
+    rows = conn.execute("SELECT id, element, decomposition, components, combinations FROM kanjivg ORDER BY id").fetchall()
+    ids = {element: id for id, element, *_ in rows}
+    # parent -> its components, in order
+    edges: dict[str, list[tuple[str, str | None]]] = {}
+    for _, element, decomposition, components_json, _ in rows:
+        components = json.loads(components_json)
+        positions = find_component_positions(json.loads(decomposition))
+        if [component for component, _ in positions] != components:
+            # overridden by custom.json
+            positions = [(component, None) for component in components]
+        edges[element] = positions
+    for _, element, _, _, combinations_json in rows:
+        for parent in json.loads(combinations_json):
+            if parent in edges and all(component != element for component, _ in edges[parent]):
+                edges[parent].append((element, None))
+
+    result = []
+    for parent, components in edges.items():
+        for ordinal, (component, position) in enumerate(components):
+            if component not in ids:
+                print(f"component {component} of {parent} is not in kanjivg")
+                continue
+            result.append((ids[parent], ids[component], ordinal, position))
+    return result
+
+
+def write_edges(conn: sqlite3.Connection):
+    """
+    rebuilds component_edge from the kanjivg table, after the combinations are written.
+    Like component_closure, it is rebuilt on incremental builds as well
+    """
+    init_edge_table(conn)
+    conn.executemany("INSERT INTO component_edge (parent_id, child_id, ordinal, position) VALUES (?,?,?,?)", edge_rows(conn))
+    create_edge_indexes(conn)
+
+
+def init_closure_table(conn: sqlite3.Connection):
+    # every (ancestor, descendant) pair of the decomposition graph,
+    # depth being the length of the shortest path between them (1 = direct component)
+    CREATE_TABLE_SQL = """
+        DROP TABLE IF EXISTS component_closure;
+        CREATE TABLE component_closure (
+            ancestor text NOT NULL,
+            descendant text NOT NULL,
+            depth integer NOT NULL,
+            PRIMARY KEY (ancestor, descendant)
+        ) WITHOUT ROWID;
+    """
+    conn.executescript(CREATE_TABLE_SQL)
+
+
+def create_closure_indexes(conn: sqlite3.Connection):
+    # the primary key answers "what does X contain", this index "what contains X"
+    conn.execute("CREATE INDEX IF NOT EXISTS component_closure_descendant_idx ON component_closure(descendant, depth, ancestor)")
+
+
+def load_component_graph(conn: sqlite3.Connection) -> dict[str, dict[str, None]]:
+    # element -> its direct components, from component_edge
+    SQL = """
+        SELECT parent.element, child.element FROM component_edge
+        JOIN kanjivg AS parent ON parent.id = component_edge.parent_id
+        JOIN kanjivg AS child ON child.id = component_edge.child_id
+        WHERE component_edge.parent_id != component_edge.child_id
+        ORDER BY component_edge.parent_id, component_edge.ordinal
+    """
+    graph: defaultdict[str, dict[str, None]] = defaultdict(dict)
+    for parent, child in conn.execute(SQL):
+        graph[parent][child] = None
+    return graph
+
+
+def closure_rows(graph: dict[str, dict[str, None]]) -> Iterator[tuple[str, str, int]]:
+    # breadth first search from every element, so each descendant is reached at its smallest depth first
+    for ancestor in list(graph):
+        seen = {ancestor}
+        frontier = [ancestor]
+        depth = 0
+        while frontier:
+            depth += 1
+            next_frontier = []
+            for element in frontier:
+                for component in graph.get(element, ()):
+                    if component not in seen:
+                        seen.add(component)
+                        next_frontier.append(component)
+                        yield ancestor, component, depth
+            frontier = next_frontier
+
+
+def write_closure(conn: sqlite3.Connection):
+    """
+    rebuilds component_closure from component_edge.
+    It only takes a fraction of a second, so it is rebuilt on incremental builds as well
+    """
+    init_closure_table(conn)
+    conn.executemany("INSERT INTO component_closure (ancestor, descendant, depth) VALUES (?,?,?)", closure_rows(load_component_graph(conn)))
+    create_closure_indexes(conn)
+
+
+def write_component_bitsets(conn: sqlite3.Connection):
+    """
+    inverted index for search.py --all-of / --none-of:
+    component -> bitset of the kanjivg ids of every kanji that contains it at any depth,
+    stored as a little endian blob (bit i set = kanji with id i), so a query is a few integer ANDs.
+    built from component_closure, see write_closure
+    """
+    CREATE_TABLE_SQL = """
+        DROP TABLE IF EXISTS component_bitsets;
+        CREATE TABLE component_bitsets (
+            component text PRIMARY KEY NOT NULL,
+            bits blob NOT NULL
+        ) WITHOUT ROWID;
+    """
+    conn.executescript(CREATE_TABLE_SQL)
+    SQL = """
+        SELECT component_closure.descendant, kanjivg.id
+        FROM component_closure JOIN kanjivg ON kanjivg.element = component_closure.ancestor
+        ORDER BY component_closure.descendant
+    """
+    ids: defaultdict[str, list[int]] = defaultdict(list)
+    for component, id in conn.execute(SQL):
+        ids[component].append(id)
+    rows = []
+    for component, component_ids in ids.items():
+        bits = 0
+        for id in component_ids:
+            bits |= 1 << id
+        rows.append((component, bits.to_bytes((bits.bit_length() + 7) // 8, "little")))
+    conn.executemany("INSERT INTO component_bitsets (component, bits) VALUES (?,?)", rows)
+
+
+def with_overrides(items: Iterable[tuple[str, KanjiData]], overrides: dict[str, dict[str, Any]]) -> Iterator[tuple[str, KanjiData]]:
+    for element, kanji_data in items:
+        override_columns(kanji_data, overrides.get(element))
+        yield element, kanji_data
+
+
+def train_svg_dictionary(catalog: SvgCatalog) -> bytes:
+    sample = []
+    for svg_file in catalog.baseFiles()[::SVG_DICTIONARY_SAMPLE_STEP]:
+        with open(svg_file.path) as f:
+            sample.append(f.read())
+    return svg_store.train_dictionary(sample)
+
+
+def iter_kanji_data(parents: dict[str, dict[str, None]], catalog: SvgCatalog) -> Iterator[tuple[str, KanjiData]]:
+    """
+    streams the kanji of kanjivg.xml, read from its binary copy when it is up to date (see binary_corpus.py),
+    along with the contents of their svg file.
+    parents is filled with the component -> parents map along the way.
+    """
+    for kanji in iter_kanji("./kanjivg.xml"):
+        summary = json_summary(kanji)
+        svg_file = find_svg_id(kanji.code, catalog)
         with open(svg_file.path) as f:
             svg_file_contents = f.read()
         if summary is not None:
@@ -156,34 +536,58 @@ def main():
             components = find_all_components(summary)
             # backfills combinations
             for component in components:
-                combinations[component].add(element)
+                parents[component][element] = None
 
-            data[element] = KanjiData(svg_file_contents, summary, components, [])
+            yield element, KanjiData(svg_file_contents, summary, components, [])
 
-    # sets combinations for each kanji
-    for component, combs in combinations.items():
-        if component not in data:
-            print(f"component {component} not in original data")
-            data[component] = KanjiData("", {}, [], [])
-        if component in combs:
-            combs.remove(component) # so it doesn't repeat itself
-        #data[component].combinations = sort_kanji(combs, freq_map) if freq_map else list(combs)
-        data[component].combinations = list(combs)
 
-    # reads custom.json to override any specific entries
-    override_data(data)
+def main():
+    args = get_args()
+    overrides = load_overrides()
+    # component -> parents. dicts are used as insertion ordered sets,
+    # so that combinations are listed in the same order on every build
+    parents: defaultdict[str, dict[str, None]] = defaultdict(dict)
 
-    with sqlite3.connect("kanjivg.db") as conn:
-        init_table(conn)
-        cur = conn.cursor()
+    catalog = SvgCatalog("./kanji/")
 
-        for element, kanji_data in data.items():
-            assert kanji_data.decomposition is not None
-            assert kanji_data.components is not None
-            assert kanji_data.combinations is not None
-            cur.execute(INSERT_ROW_SQL, (element, kanji_data.svg, json_to_str(kanji_data.decomposition), json_to_str(kanji_data.components), json_to_str(kanji_data.combinations)))
-
-        cur.close()
+    with sqlite3.connect("kanjivg.db") as conn:
+        state = load_build_state(conn) if args.incremental else None
+        zdict = svg_store.load_dictionary(conn) if state is not None else None
+        full_build = state is None or zdict is None
+        if full_build:
+            bulk_load_pragmas(conn)
+            init_table(conn)
+            init_state_table(conn)
+            svg_store.init_tables(conn)
+            zdict = train_svg_dictionary(catalog)
+            svg_store.write_dictionary(conn, zdict)
+            state = {}
+        writer = BuildWriter(conn, state, zdict)
+        writer.insert(with_overrides(iter_kanji_data(parents, catalog), overrides))
+
+        # components that do not have a kanji of their own
+        missing = [component for component in parents if component not in writer]
+        for component in missing:
+            print(f"component {component} not in original data")
+        writer.insert(with_overrides(((component, KanjiData("", {}, [], [])) for component in missing), overrides))
+
+        for element in overrides:
+            if element not in writer:
+                print(f"{element} in custom.json is not in the generated data")
+
+        # the combinations are updated by element
+        create_indexes(conn)
+        writer.write_combinations(parents, overrides)
+        removed = writer.delete_missing()
+        renumbered = 0 if full_build else writer.renumber()
+        write_edges(conn)
+        write_closure(conn)
+        write_component_bitsets(conn)
+
+        if full_build:
+            optimize_for_reading(conn)
+        else:
+            print(f"{writer.added} added, {len(writer.updated)} updated, {removed} removed, {renumbered} renumbered")
 
 if __name__ == "__main__":
     main()
@@ -3,11 +3,12 @@ import json
 from typing import Any, Optional
 from dataclasses import dataclass
 
-from util import json_to_str, SVG, DECOMPOSITION, COMPONENTS, COMBINATIONS
+from util import json_to_str, ELEMENT, DECOMPOSITION, COMPONENTS, COMBINATIONS, RANK, OCCURENCES, CUMULATIVE_PERCENT
+from svg_store import SvgStore
 
 @dataclass
 class KanjiData:
-    svg: str
+    svg: str | None # read on first access when read from kanjivg.db, see StoredKanjiData
     decomposition: dict[str, Any]
     components: list[str] # in
     combinations: list[str] # out
@@ -25,6 +26,24 @@ class KanjiData:
         return json_to_str(data)
 
 
+class StoredKanjiData(KanjiData):
+    """KanjiData of a kanjivg.db row, whose svg is only read from kanjivg_svg and decompressed when accessed"""
+    def __init__(self, element: str, svg_store: SvgStore | None, decomposition: dict[str, Any], components: list[str], combinations: list[str], *frequencies):
+        self.element = element
+        self.svg_store = svg_store
+        KanjiData.__init__(self, None, decomposition, components, combinations, *frequencies)
+
+    @property
+    def svg(self) -> str | None:
+        if self._svg is None and self.svg_store is not None:
+            self._svg = self.svg_store.get(self.element)
+        return self._svg
+
+    @svg.setter
+    def svg(self, svg: str | None):
+        self._svg = svg
+
+
 def get_kanjivg_data(cur, kanji: str) -> KanjiData | None:
     SQL = "SELECT * FROM kanjivg WHERE element = ?"
     data_list = cur.execute(SQL, kanji).fetchall()
@@ -33,10 +52,14 @@ def get_kanjivg_data(cur, kanji: str) -> KanjiData | None:
     if len(data_list) == 0:
         return None
     row = data_list[0]
-    return row_to_kanjivg_data(row)
+    return row_to_kanjivg_data(row, SvgStore(cur.connection))
 
 
-def row_to_kanjivg_data(row: list[Any]) -> KanjiData | None:
-    return KanjiData(row[SVG], json.loads(row[DECOMPOSITION]), json.loads(row[COMPONENTS]), json.loads(row[COMBINATIONS]))
+def row_to_kanjivg_data(row: list[Any], svg_store: SvgStore | None = None) -> KanjiData | None:
+    # without svg_store, the svg of the returned KanjiData is None
+    return StoredKanjiData(
+        row[ELEMENT], svg_store, json.loads(row[DECOMPOSITION]), json.loads(row[COMPONENTS]), json.loads(row[COMBINATIONS]),
+        row[OCCURENCES], row[RANK], row[CUMULATIVE_PERCENT],
+    )
 
 
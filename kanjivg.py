@@ -18,10 +18,12 @@
 from xmlhandler import *
 from utils import PYTHON_VERSION_MAJOR, canonicalId
 from typing import Optional
+from reprlib import recursive_repr
 
 if PYTHON_VERSION_MAJOR > 2:
     def unicode(s):
         return s
+    from sys import intern
 
 # Sample licence header
 licenseString = """Copyright (C) 2009-2013 Ulrich Apel.
@@ -60,8 +62,14 @@ def realchr(i):
     if i < 0x10000: return unichr(i)
     else: return unichr(((i - 0x10000) >> 10) + 0xD800) + unichr(0xDC00 + (i & 0x3ff))
 
+def slotsDict(o):
+    """Equivalent of vars() for the slotted classes below."""
+    return dict([(name, getattr(o, name)) for name in o.__slots__])
+
 class Kanji:
     """Describes a kanji. The root stroke group is accessible from the strokes member."""
+    __slots__ = ("code", "variant", "strokes")
+
     def __init__(self, code, variant = None):
         # Unicode of char being represented (standard str)
         self.code = canonicalId(code)
@@ -69,8 +77,9 @@ class Kanji:
         self.variant = variant
         self.strokes = None
 
+    @recursive_repr("{...}")
     def __repr__(self):
-        return repr(vars(self))
+        return repr(slotsDict(self))
 
     # String identifier used to uniquely identify the kanji
     def kId(self):
@@ -97,6 +106,8 @@ class Kanji:
 
 class StrokeGr:
     """Describes a stroke group belonging to a kanji as closely as possible to the XML format. Sub-stroke groups or strokes are available in the childs member. They can either be of class StrokeGr or Stroke so their type should be checked."""
+    __slots__ = ("parent", "element", "original", "part", "number", "variant", "partial", "tradForm", "radicalForm", "position", "radical", "phon", "childs")
+
     def __init__(self, parent = None):
         self.parent = parent
         if parent: parent.childs.append(self)
@@ -116,8 +127,9 @@ class StrokeGr:
 
         self.childs = []
 
+    @recursive_repr("{...}")
     def __repr__(self):
-        return repr(vars(self))
+        return repr(slotsDict(self))
 
     def setParent(self, parent):
         if self.parent is not None or parent is None:
@@ -222,13 +234,16 @@ class StrokeGr:
 
 class Stroke:
     """A single stroke, containing its type and (optionally) its SVG data."""
+    __slots__ = ("stype", "svg", "numberPos")
+
     def __init__(self, parent):
         self.stype = None
         self.svg = None
         self.numberPos = None
 
+    @recursive_repr("{...}")
     def __repr__(self):
-        return repr(vars(self))
+        return repr(slotsDict(self))
 
     def numberToSVG(self, out, number, indent = 0):
         if self.numberPos:
@@ -243,6 +258,31 @@ class Stroke:
         s += '/>\n'
         out.write(s)
 
+def isTrue(value):
+    return str(value) == "true"
+
+# Group attribute name -> (StrokeGr member, conversion). Strings that repeat
+# across the corpus are interned so that all groups share a single copy.
+groupAttributes = {
+    "kvg:element": ("element", intern),
+    "kvg:variant": ("variant", str),
+    "kvg:partial": ("partial", str),
+    "kvg:original": ("original", intern),
+    "kvg:part": ("part", int),
+    "kvg:number": ("number", int),
+    "kvg:tradForm": ("tradForm", isTrue),
+    "kvg:radicalForm": ("radicalForm", isTrue),
+    "kvg:position": ("position", intern),
+    "kvg:radical": ("radical", intern),
+    "kvg:phon": ("phon", intern),
+}
+
+def parseGroupAttributes(group, attrs):
+    for name in attrs.keys():
+        member = groupAttributes.get(name)
+        if member is not None:
+            setattr(group, member[0], member[1](attrs[name]))
+
 class KanjisHandler(BasicHandler):
     """XML handler for parsing kanji files. It can handle single-kanji files or aggregation files. After parsing, the kanjis are accessible through the kanjis member, indexed by their svg file name."""
     def __init__(self):
@@ -284,17 +324,7 @@ class KanjisHandler(BasicHandler):
         group = StrokeGr(self.group)
 
         # Now parse group attributes
-        if "kvg:element" in attrs: group.element = unicode(attrs["kvg:element"])
-        if "kvg:variant" in attrs: group.variant = str(attrs["kvg:variant"])
-        if "kvg:partial" in attrs: group.partial = str(attrs["kvg:partial"])
-        if "kvg:original" in attrs: group.original = unicode(attrs["kvg:original"])
-        if "kvg:part" in attrs: group.part = int(attrs["kvg:part"])
-        if "kvg:number" in attrs: group.number = int(attrs["kvg:number"])
-        if "kvg:tradForm" in attrs and str(attrs["kvg:tradForm"]) == "true": group.tradForm = True
-        if "kvg:radicalForm" in attrs and str(attrs["kvg:radicalForm"]) == "true": group.radicalForm = True
-        if "kvg:position" in attrs: group.position = unicode(attrs["kvg:position"])
-        if "kvg:radical" in attrs: group.radical = unicode(attrs["kvg:radical"])
-        if "kvg:phon" in attrs: group.phon = unicode(attrs["kvg:phon"])
+        parseGroupAttributes(group, attrs)
 
         self.group = group
 
@@ -335,7 +365,7 @@ class KanjisHandler(BasicHandler):
             raise Exception("Stroke must be inside a kanji and group!")
         stroke = Stroke(self.group)
         if "kvg:type" in attrs:
-            stroke.stype = unicode(attrs["kvg:type"])
+            stroke.stype = intern(attrs["kvg:type"])
         if "d" in attrs: stroke.svg = unicode(attrs["d"])
         self.group.childs.append(stroke)
 
@@ -347,6 +377,9 @@ class SVGHandler(BasicHandler):
         self.currentKanji = None
         self.groups = []
         self.metComponents = set()
+        # The stroke numbers follow the strokes of their kanji
+        self.lastStrokes = []
+        self.numberPos = None
 
     def handle_start_g(self, attrs):
         group = StrokeGr()
@@ -368,17 +401,7 @@ class SVGHandler(BasicHandler):
             group.setParent(self.groups[-1])
 
         # Now parse group attributes
-        if "kvg:element" in attrs: group.element = unicode(attrs["kvg:element"])
-        if "kvg:variant" in attrs: group.variant = str(attrs["kvg:variant"])
-        if "kvg:partial" in attrs: group.partial = str(attrs["kvg:partial"])
-        if "kvg:original" in attrs: group.original = unicode(attrs["kvg:original"])
-        if "kvg:part" in attrs: group.part = int(attrs["kvg:part"])
-        if "kvg:number" in attrs: group.number = int(attrs["kvg:number"])
-        if "kvg:tradForm" in attrs and str(attrs["kvg:tradForm"]) == "true": group.tradForm = True
-        if "kvg:radicalForm" in attrs and str(attrs["kvg:radicalForm"]) == "true": group.radicalForm = True
-        if "kvg:position" in attrs: group.position = unicode(attrs["kvg:position"])
-        if "kvg:radical" in attrs: group.radical = unicode(attrs["kvg:radical"])
-        if "kvg:phon" in attrs: group.phon = unicode(attrs["kvg:phon"])
+        parseGroupAttributes(group, attrs)
 
         self.groups.append(group)
 
@@ -389,13 +412,13 @@ class SVGHandler(BasicHandler):
             if not group.part: print("%s: Number specified, but part missing" % (self.currentKanji.kId()))
             # The group must exist already
             if group.part > 1:
-                if not self.compCpt.has_key(group.element + str(group.number)):
+                if (group.element + str(group.number)) not in self.compCpt:
                     print("%s: Missing numbered group" % (self.currentKanji.kId()))
                 elif self.compCpt[group.element + str(group.number)] != group.part - 1:
                     print("%s: Incorrectly numbered group" % (self.currentKanji.kId()))
             # The group must not exist
             else:
-                if self.compCpt.has_key(group.element + str(group.number)):
+                if (group.element + str(group.number)) in self.compCpt:
                     print("%s: Duplicate numbered group" % (self.currentKanji.kId()))
             self.compCpt[group.element + str(group.number)] = group.part
         # No number, just a part - groups restart with part 1, otherwise must
@@ -403,7 +426,7 @@ class SVGHandler(BasicHandler):
         elif group.part:
                 # The group must exist already
             if group.part > 1:
-                if not self.compCpt.has_key(group.element):
+                if group.element not in self.compCpt:
                     print("%s: Incorrectly started multi-part group" % (self.currentKanji.kId()))
                 elif self.compCpt[group.element] != group.part - 1:
                     print("%s: Incorrectly splitted multi-part group" % (self.currentKanji.kId()))
@@ -416,16 +439,28 @@ class SVGHandler(BasicHandler):
         # End of kanji?
         if len(self.groups) == 1: # index 1 - ignore root group
             self.currentKanji.strokes = group
+            self.lastStrokes = self.currentKanji.getStrokes()
             self.currentKanji = None
             self.groups = []
 
+    def handle_start_text(self, attrs):
+        # Stroke numbers are positioned with a "matrix(1 0 0 1 x y)" transform
+        values = str(attrs.get("transform", "")).replace("matrix(", "").replace(")", "").split()
+        self.numberPos = (float(values[4]), float(values[5])) if len(values) == 6 else None
+
+    def handle_data_text(self, data):
+        data = data.strip()
+        if self.numberPos is not None and data.isdigit() and 0 < int(data) <= len(self.lastStrokes):
+            self.lastStrokes[int(data) - 1].numberPos = self.numberPos
+        self.numberPos = None
+
 
     def handle_start_path(self, attrs):
         if len(self.groups) == 0: parent = None
         else: parent = self.groups[-1]
         stroke = Stroke(parent)
         if "kvg:type" in attrs:
-            stroke.stype = unicode(attrs["kvg:type"])
+            stroke.stype = intern(attrs["kvg:type"])
         if "d" in attrs:
             stroke.svg = unicode(attrs["d"])
         self.groups[-1].childs.append(stroke)
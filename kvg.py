@@ -16,9 +16,9 @@
 #  You should have received a copy of the GNU General Public License
 #  along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import sys, os, re, datetime
+import sys, os, re, datetime, json, hashlib, zlib
 from kanjivg import licenseString
-from utils import open
+from utils import open, SvgCatalog
 
 pathre = re.compile(r'<path .*d="([^"]*)".*/>')
 
@@ -26,7 +26,15 @@ helpString = """Usage: %s <command> [ kanji files ]
 Recognized commands:
   split file1 [ file2 ... ]       extract path data into a -paths suffixed file
   merge file1 [ file2 ... ]       merge path data from -paths suffixed file
-  release                         create single release file""" % (sys.argv[0],)
+  release [ --jobs N ]            create single release file, transforming
+          [ --incremental ]       files with N worker processes. With
+          [ --minify ]            --incremental only the files changed since
+          [ --precision N ]       the last release are transformed again.
+                                  --minify also writes a minified release
+                                  file, with path coordinates rounded to N
+                                  decimals (1 by default). A binary copy of
+                                  the release file, kanjivg.bin, is always
+                                  written for fast lookups""" % (sys.argv[0],)
 
 def createPathsSVG(f):
 	s = open(f, "r", encoding="utf-8").read()
@@ -61,34 +69,339 @@ def mergePathsSVG(f):
 		del paths[0]
 	open(f, "w", encoding="utf-8").write(s)
 
-def release():
-	datadir = "kanji"
-	idMatchString = "<g id=\"kvg:StrokePaths_"
-	allfiles = os.listdir(datadir)
-	files = []
-	for f in allfiles:
-		if len(f) == 9: files.append(f)
-	del allfiles
-	files.sort()
-	
-	out = open("kanjivg.xml", "w", encoding='utf8')
-	out.write('<?xml version="1.0" encoding="UTF-8"?>\n')
-	out.write("<!--\n")
-	out.write(licenseString)
-	out.write("\nThis file has been generated on %s, using the latest KanjiVG data\nto this date." % (datetime.date.today()))
-	out.write("\n-->\n")
-	out.write("<kanjivg xmlns:kvg='http://kanjivg.tagaini.net'>\n")
-	for f in files:
-		data = open(os.path.join(datadir, f), encoding='utf8').read()
-		data = data.replace("\r\n", "\n")
-		data = data[data.find("<svg "):]
-		data = data[data.find(idMatchString) + len(idMatchString):]
-		kidend = data.find("\"")
-		data = "<kanji id=\"kvg:kanji_%s\">" % (data[:kidend],) + data[data.find("\n"):data.find('<g id="kvg:StrokeNumbers_') - 5] + "</kanji>\n"
-		out.write(data)
+idMatchString = "<g id=\"kvg:StrokePaths_"
+
+releaseFile = "kanjivg.xml"
+# The manifest records, for each source file of the release file, its
+# [ mtime_ns, size, sha1, offset, length ], offset and length being the
+# position of its <kanji> block in the release file in bytes.
+manifestFile = releaseFile + ".manifest"
+manifestVersion = 1
+
+# Number of files a release worker transforms per task
+releaseChunkSize = 64
+
+def releaseData(data):
+	"""Returns the <kanji> block of the release file for the contents of an SVG file."""
+	data = data.replace("\r\n", "\n")
+	data = data[data.find("<svg "):]
+	data = data[data.find(idMatchString) + len(idMatchString):]
+	kidend = data.find("\"")
+	return "<kanji id=\"kvg:kanji_%s\">" % (data[:kidend],) + data[data.find("\n"):data.find('<g id="kvg:StrokeNumbers_') - 5] + "</kanji>\n"
+
+def releaseEntry(path):
+	"""Returns the encoded <kanji> block of the SVG file at path, and the sha1 of the file."""
+	source = open(path, "rb").read()
+	return releaseData(source.decode("utf8")).encode("utf8"), hashlib.sha1(source).hexdigest()
+
+def releaseChunk(paths):
+	return [releaseEntry(path) for path in paths]
+
+def releaseEntries(files, jobs = 1):
+	"""Yields the releaseEntry() of files, in order. With jobs > 1 the files are
+	transformed by a process pool; at most a few chunks per worker are in flight
+	so that memory use does not grow with the corpus."""
+	paths = [f.path for f in files]
+	if jobs <= 1:
+		for path in paths:
+			yield releaseEntry(path)
+		return
+
+	from concurrent.futures import ProcessPoolExecutor
+	from collections import deque
+	window = jobs * 2
+	with ProcessPoolExecutor(max_workers=jobs) as executor:
+		pending = deque()
+		for i in range(0, len(paths), releaseChunkSize):
+			pending.append(executor.submit(releaseChunk, paths[i:i + releaseChunkSize]))
+			if len(pending) >= window:
+				for entry in pending.popleft().result():
+					yield entry
+		while len(pending) > 0:
+			for entry in pending.popleft().result():
+				yield entry
+
+minReleaseFile = "kanjivg.min.xml"
+
+pathTokenRe = re.compile(r"[A-Za-z]|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+# Number of parameters of each path command, and which of them are x and y coordinates
+pathCommands = {
+	"M": (2, (0,), (1,)),
+	"L": (2, (0,), (1,)),
+	"H": (1, (0,), ()),
+	"V": (1, (), (0,)),
+	"C": (6, (0, 2, 4), (1, 3, 5)),
+	"S": (4, (0, 2), (1, 3)),
+	"Q": (4, (0, 2), (1, 3)),
+	"T": (2, (0,), (1,)),
+	"A": (7, (5,), (6,)),
+	"Z": (0, (), ()),
+}
+
+def absolutePath(d):
+	"""Returns the segments of path data d as (command, params) pairs, with
+	upper case commands and absolute coordinates. Implicitly repeated commands
+	are returned as separate segments."""
+	tokens = pathTokenRe.findall(d)
+	segments = []
+	x = y = startX = startY = 0.0
+	command = None
+	i = 0
+	while i < len(tokens):
+		if tokens[i].isalpha():
+			command = tokens[i]
+			i += 1
+		elif command is None:
+			raise Exception("Path data does not start with a command: %s" % (d,))
+		upper = command.upper()
+		count, xs, ys = pathCommands[upper]
+		params = [float(t) for t in tokens[i:i + count]]
+		if len(params) != count:
+			raise Exception("Missing parameters for %s in path data: %s" % (command, d))
+		i += count
+		if command != upper:
+			for j in xs: params[j] += x
+			for j in ys: params[j] += y
+		if upper == "Z":
+			x, y = startX, startY
+		else:
+			if xs: x = params[xs[-1]]
+			if ys: y = params[ys[-1]]
+			if upper == "M":
+				startX, startY = x, y
+				# coordinates after a moveto are implicit linetos
+				command = "l" if command == "m" else "L"
+		segments.append((upper, params))
+		if upper == "Z" and i < len(tokens) and not tokens[i].isalpha():
+			raise Exception("Parameters after closepath in path data: %s" % (d,))
+	return segments
+
+def formatNumber(value, scale, precision):
+	"""Formats value, in units of 1/scale, with at most precision decimals and
+	no leading zero."""
+	s = "%.*f" % (precision, value / scale) if precision > 0 else "%d" % (value,)
+	if "." in s: s = s.rstrip("0").rstrip(".")
+	if s.startswith("0."): s = s[1:]
+	elif s.startswith("-0."): s = "-" + s[2:]
+	return "0" if s in ("", "-0", "-") else s
+
+def minifyPath(d, precision):
+	"""Rewrites path data d with relative commands and coordinates rounded to
+	precision decimals. Every coordinate is rounded in absolute terms first, so
+	that rounding errors do not accumulate along the path."""
+	scale = 10 ** precision
+	out = []
+	x = y = startX = startY = 0
+	last = None
+	for i, (command, params) in enumerate(absolutePath(d)):
+		count, xs, ys = pathCommands[command]
+		values = [round(p * scale) for p in params]
+		if command == "A":
+			# radii (0, 1) and the x axis rotation angle (2) are rounded like coordinates,
+			# the large arc and sweep flags (3, 4) are kept as they are
+			values[3] = int(params[3]) * scale; values[4] = int(params[4]) * scale
+		for j in xs: values[j] -= x
+		for j in ys: values[j] -= y
+		# the first moveto is the same in absolute and relative terms
+		letter = "M" if i == 0 else command.lower()
+		if letter != last or letter in ("m", "M"):
+			out.append(letter)
+			separator = False
+		else:
+			separator = True
+		for value in values:
+			number = formatNumber(value, scale, precision)
+			if separator and not number.startswith("-"): out.append(" ")
+			out.append(number)
+			separator = True
+		if command == "Z":
+			x, y = startX, startY
+		else:
+			if xs: x += values[xs[-1]]
+			if ys: y += values[ys[-1]]
+			if command == "M": startX, startY = x, y
+		last = letter
+	return "".join(out)
+
+groupIdRe = re.compile(r'(<(?:g|path)) id="kvg:[^"]*"')
+pathDataRe = re.compile(r' d="([^"]*)"')
+whitespaceRe = re.compile(r">\s+<")
+
+def minifyBlock(block, precision):
+	"""Minifies a <kanji> block of the release file: group and path ids are
+	dropped (KanjisHandler does not read them, and they follow from the order
+	of the groups and paths), as is the whitespace between tags. The kanji id
+	and every kvg: attribute are kept."""
+	block = groupIdRe.sub(r"\1", block)
+	block = pathDataRe.sub(lambda m: ' d="%s"' % (minifyPath(m.group(1), precision),), block)
+	return whitespaceRe.sub("><", block.strip())
+
+kanjiBlockRe = re.compile(r"<kanji .*?</kanji>", re.S)
+
+def writeMinifiedRelease(precision = 1):
+	"""Writes the minified version of the release file, see minifyBlock."""
+	data = open(releaseFile, "r", encoding="utf8").read()
+	tmpFile = minReleaseFile + ".tmp"
+	out = open(tmpFile, "w", encoding="utf8")
+	# the license comment is kept, its attribution clause applies to the minified file as well
+	out.write(data[:data.find("<kanjivg ")].replace("-->\n", "-->"))
+	out.write("<kanjivg xmlns:kvg='http://kanjivg.tagaini.net'>")
+	for match in kanjiBlockRe.finditer(data):
+		out.write(minifyBlock(match.group(0), precision))
 	out.write("</kanjivg>\n")
 	out.close()
-	print("%d kanji emitted" % len(files))
+	os.replace(tmpFile, minReleaseFile)
+
+def structureSignature(kanji):
+	"""The group attributes and stroke types of kanji, in document order."""
+	from kanjivg import StrokeGr, slotsDict
+	signature = []
+	def walk(group):
+		attrs = slotsDict(group)
+		del attrs["parent"], attrs["childs"]
+		signature.append(sorted(attrs.items()))
+		for child in group.childs:
+			if isinstance(child, StrokeGr): walk(child)
+			else: signature.append(child.stype)
+		signature.append(None)
+	walk(kanji.strokes)
+	return signature
+
+def checkMinifiedRelease(precision = 1):
+	"""Parses the release file and its minified version with KanjisHandler,
+	and checks that both have the same kanji, groups, attributes and strokes,
+	and that every path coordinate moved by no more than the rounding error."""
+	from utils import iterXmlFile
+	from itertools import zip_longest
+	tolerance = 0.5 / 10 ** precision + 1e-9
+	count = 0
+	for original, minified in zip_longest(iterXmlFile(releaseFile), iterXmlFile(minReleaseFile)):
+		if minified is None:
+			raise Exception("%s: missing from the minified release" % (original.kId(),))
+		if original is None:
+			raise Exception("%s: not in the release file" % (minified.kId(),))
+		if original.kId() != minified.kId():
+			raise Exception("Kanji order differs: %s and %s" % (original.kId(), minified.kId()))
+		if structureSignature(original) != structureSignature(minified):
+			raise Exception("%s: structure differs in the minified release" % (original.kId(),))
+		for stroke, minStroke in zip(original.getStrokes(), minified.getStrokes()):
+			segments, minSegments = absolutePath(stroke.svg), absolutePath(minStroke.svg)
+			if [s[0] for s in segments] != [s[0] for s in minSegments]:
+				raise Exception("%s: path commands differ in the minified release" % (original.kId(),))
+			for (command, params), (_, minParams) in zip(segments, minSegments):
+				if any(abs(a - b) > tolerance for a, b in zip(params, minParams)):
+					raise Exception("%s: path moved by more than %g in the minified release" % (original.kId(), tolerance))
+		count += 1
+	return count
+
+def sizeReport(path):
+	data = open(path, "rb").read()
+	return "%s: %d bytes, %d bytes gzipped" % (path, len(data), len(zlib.compress(data, 9)))
+
+def releaseHeader():
+	return ('<?xml version="1.0" encoding="UTF-8"?>\n' +
+		"<!--\n" +
+		licenseString +
+		"\nThis file has been generated on %s, using the latest KanjiVG data\nto this date." % (datetime.date.today()) +
+		"\n-->\n" +
+		"<kanjivg xmlns:kvg='http://kanjivg.tagaini.net'>\n").encode("utf8")
+
+def loadManifest():
+	"""Returns the manifest of the current release file, or None if there is
+	none or if the release file has been modified since it was written."""
+	if not os.path.exists(manifestFile) or not os.path.exists(releaseFile):
+		return None
+	with open(manifestFile, "r", encoding="utf8") as f:
+		manifest = json.load(f)
+	if manifest.get("version") != manifestVersion:
+		return None
+	st = os.stat(releaseFile)
+	if manifest.get("output") != [st.st_mtime_ns, st.st_size]:
+		return None
+	return manifest
+
+def writeRelease(files, entries):
+	"""Writes the release file from the (block, sha1) entries of files, along with its manifest."""
+	manifest = { "version": manifestVersion, "files": {} }
+	tmpFile = releaseFile + ".tmp"
+	out = open(tmpFile, "wb")
+	offset = out.write(releaseHeader())
+	for f, (block, digest) in zip(files, entries):
+		st = os.stat(f.path)
+		manifest["files"][os.path.basename(f.path)] = [st.st_mtime_ns, st.st_size, digest, offset, len(block)]
+		offset += out.write(block)
+	out.write(b"</kanjivg>\n")
+	out.close()
+	os.replace(tmpFile, releaseFile)
+
+	st = os.stat(releaseFile)
+	manifest["output"] = [st.st_mtime_ns, st.st_size]
+	with open(manifestFile, "w", encoding="utf8") as f:
+		f.write(json.dumps(manifest, separators=(",", ":")))
+
+def incrementalEntries(files, manifest, old, changed):
+	"""Yields the (block, sha1) entries of files, reusing the blocks of the old
+	release file for files whose size and mtime did not change. The (file, block)
+	of the files whose contents changed, or that are new, are added to changed."""
+	known = manifest["files"]
+	for f in files:
+		entry = known.get(os.path.basename(f.path))
+		if entry is not None:
+			st = os.stat(f.path)
+			if entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+				yield old[entry[3]:entry[3] + entry[4]], entry[2]
+				continue
+		block, digest = releaseEntry(f.path)
+		if entry is None or entry[2] != digest:
+			changed.append((f, block))
+		yield block, digest
+
+def writeBinaryRelease(files = None, changed = None, oldCorpus = None):
+	"""Writes the memory mapped copy of the release file read by kvg_lookup.py and gen_db.py, see binary_corpus.py.
+	After an incremental release, oldCorpus being the copy of the previous release file, only the changed
+	blocks are parsed and the other kanji are copied from oldCorpus. Otherwise the whole release file is parsed."""
+	from binary_corpus import write_release_corpus, update_release_corpus, BINARY_FILE
+	size = None
+	if oldCorpus is not None:
+		changedPaths = set([f.path for f, block in changed])
+		unchanged = [(f.id, getattr(f, "variant", None)) for f in files if f.path not in changedPaths]
+		size = update_release_corpus(oldCorpus, unchanged, [block for f, block in changed], releaseFile)
+		oldCorpus.close()
+	if size is None:
+		size = write_release_corpus(releaseFile)
+	print("%s: %d bytes" % (BINARY_FILE, size))
+
+def release(jobs = 1, incremental = False, minify = False, precision = 1):
+	datadir = "kanji"
+	files = SvgCatalog(datadir).baseFiles()
+
+	manifest = None
+	if incremental:
+		manifest = loadManifest()
+		if manifest is None:
+			print("No usable manifest for %s, doing a full release" % (releaseFile,))
+
+	if manifest is None:
+		writeRelease(files, releaseEntries(files, jobs))
+		print("%d kanji emitted" % len(files))
+		writeBinaryRelease()
+	else:
+		# Opened before the release file is replaced, while it still matches it
+		from binary_corpus import open_corpus
+		oldCorpus = open_corpus(releaseFile)
+		old = open(releaseFile, "rb").read()
+		changed = []
+		writeRelease(files, incrementalEntries(files, manifest, old, changed))
+		names = set([os.path.basename(f.path) for f in files])
+		removed = [name for name in manifest["files"] if name not in names]
+		print("%d kanji emitted, %d changed, %d removed" % (len(files), len(changed), len(removed)))
+		writeBinaryRelease(files, changed, oldCorpus)
+
+	if minify:
+		writeMinifiedRelease(precision)
+		print("%d kanji checked in %s" % (checkMinifiedRelease(precision), minReleaseFile))
+		print(sizeReport(releaseFile))
+		print(sizeReport(minReleaseFile))
 
 actions = {
 	"split": (createPathsSVG, 2),
@@ -104,9 +417,31 @@ if __name__ == "__main__":
 
 	action = actions[sys.argv[1]][0]
 	files = sys.argv[2:]
+	options = {}
+	while len(files) > 0 and files[0].startswith("--"):
+		if files[0] == "--jobs" and len(files) > 1 and files[1].isdigit():
+			options["jobs"] = int(files[1])
+			files = files[2:]
+		elif files[0] == "--incremental":
+			options["incremental"] = True
+			files = files[1:]
+		elif files[0] == "--minify":
+			options["minify"] = True
+			files = files[1:]
+		elif files[0] == "--precision" and len(files) > 1 and files[1].isdigit():
+			options["precision"] = int(files[1])
+			files = files[2:]
+		else:
+			print(helpString)
+			sys.exit(0)
+	# the options are those of release, which takes no files, and --precision only applies to --minify
+	if (len(options) > 0 and action != release) or (action == release and len(files) > 0) or \
+		("precision" in options and "minify" not in options):
+		print(helpString)
+		sys.exit(0)
 
 	if len(files) == 0:
-		action()
+		action(**options)
 	else:
 		for f in files:
 			if not os.path.exists(f):
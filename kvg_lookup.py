@@ -19,7 +19,8 @@
 
 import sys, os, re, datetime
 from kanjivg import Stroke, StrokeGr
-from utils import listSvgFiles, readXmlFile, canonicalId, PYTHON_VERSION_MAJOR
+from utils import SvgCatalog, readXmlFile, canonicalId, PYTHON_VERSION_MAJOR
+from binary_corpus import open_corpus
 
 if PYTHON_VERSION_MAJOR > 2:
     def unicode(s):
@@ -33,7 +34,8 @@ Recognized commands:
   find-svg      Find and view summary of an SVG file for the given
                 element in ./kanji/ directory.
   find-xml      Find and view summary of a <kanji> entry for
-                the given element from ./kanjivg.xml file.
+                the given element from ./kanjivg.xml file
+                (read from ./kanjivg.bin when it is up to date).
 
 Parameters:
   element       May either be the singular character, e.g. 並 or its
@@ -103,7 +105,7 @@ def characterSummary(c):
 
 def commandFindSvg(arg):
     id = canonicalId(arg)
-    kanji = [(f.path, f.read()) for f in listSvgFiles("./kanji/") if f.id == id]
+    kanji = [(f.path, f.read()) for f in SvgCatalog("./kanji/").variants(id)]
     print("Found %d files matching ID %s" % (len(kanji), id))
     for i, (path, c) in enumerate(kanji):
         print("\nFile %s (%d/%d):" % (path, i+1, len(kanji)))
@@ -111,8 +113,13 @@ def commandFindSvg(arg):
 
 def commandFindXml(arg):
     id = canonicalId(arg)
-    files = readXmlFile('./kanjivg.xml')
-    data = files.get(id, None)
+    # The binary copy of kanjivg.xml reads a single entry instead of parsing the whole file
+    corpus = open_corpus('./kanjivg.xml')
+    if corpus is not None:
+        with corpus:
+            data = corpus.get(id)
+    else:
+        data = readXmlFile('./kanjivg.xml').get(id, None)
     if data is not None:
         print(data)
         writeOutput(characterSummary(data) + "\n", sys.stdout)
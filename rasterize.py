@@ -0,0 +1,321 @@
+"""
+renders the kanji of kanji/*.svg to grayscale bitmaps with numpy, without an external svg renderer:
+
+- strokes are sampled from their path data (see stroke_geometry.py), densified to less than a pixel apart,
+  and stamped with a round brush of the kanjivg stroke width on a supersampled canvas,
+  which is then averaged down for antialiasing
+- stroke numbers (Kanji.outputStrokesNumbers) are drawn at their position with a small bitmap font
+
+renders are stored in a cache directory, keyed by the hash of the svg file and of the render options,
+so rendering the same file again only reads it. The cache is bounded in size, least recently used renders are evicted first.
+Files that are not in the cache are rendered by a pool of worker processes.
+
+examples:
+
+python3 rasterize.py 未 末 --size 64 128 --numbers --out previews
+python3 rasterize.py --size 256 --jobs 4      # every base file of kanji/
+"""
+
+import os
+import sys
+import time
+import zlib
+import struct
+import shutil
+import hashlib
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from kanjivg import Kanji
+from stroke_geometry import path_segments, sample_segments
+from utils import SvgCatalog, SvgFileInfo, canonicalId
+
+# bump when the output of render changes, so that cached renders are not reused
+RENDER_VERSION = 1
+
+CACHE_DIR = "raster_cache"
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+
+# kanjivg svgs are drawn on a 109 x 109 canvas, with a stroke width of 3 and stroke numbers of font size 8
+CANVAS_SIZE = 109.0
+STROKE_WIDTH = 3.0
+NUMBER_FONT_SIZE = 8.0
+NUMBER_GRAY = 0x80
+SUPERSAMPLING = 4
+# points sampled per Bézier segment, before they are densified
+SEGMENT_SAMPLES = 16
+
+# 3 x 5 bitmap font of the digits
+DIGITS = {
+    "0": ("111", "101", "101", "101", "111"),
+    "1": ("010", "110", "010", "010", "111"),
+    "2": ("111", "001", "111", "100", "111"),
+    "3": ("111", "001", "111", "001", "111"),
+    "4": ("101", "101", "111", "001", "001"),
+    "5": ("111", "100", "111", "001", "111"),
+    "6": ("111", "100", "111", "101", "111"),
+    "7": ("111", "001", "001", "001", "001"),
+    "8": ("111", "101", "111", "101", "111"),
+    "9": ("111", "101", "111", "001", "111"),
+}
+
+
+def brush(radius: float) -> np.ndarray:
+    # (offsets, 2) integer (x, y) offsets of a disk of radius pixels
+    r = int(np.ceil(radius))
+    ys, xs = np.mgrid[-r:r + 1, -r:r + 1]
+    inside = xs * xs + ys * ys <= radius * radius
+    return np.stack([xs[inside], ys[inside]], axis=1)
+
+
+def stroke_points(kanji: Kanji, scale: float, spacing: float) -> np.ndarray:
+    """
+    (points, 2) points along every stroke of kanji, in pixels of a canvas scaled by scale,
+    at most spacing pixels apart
+    """
+    segments = [segment for stroke in kanji.getStrokes() for segment in path_segments(stroke.svg or "")]
+    if not segments:
+        return np.zeros((0, 2))
+    points = sample_segments(np.array(segments, dtype=np.float64).reshape(-1, 4, 2), SEGMENT_SAMPLES) * scale
+    starts = points[:, :-1].reshape(-1, 2)
+    steps = (points[:, 1:] - points[:, :-1]).reshape(-1, 2)
+    # every step is split into enough sub steps to be at most spacing long
+    counts = np.maximum(np.ceil(np.sqrt((steps * steps).sum(axis=1)) / spacing).astype(np.int64), 1)
+    step_index = np.repeat(np.arange(len(steps)), counts)
+    fractions = (np.arange(len(step_index)) - np.repeat(np.cumsum(counts) - counts, counts)) / np.repeat(counts, counts)
+    return np.vstack([starts[step_index] + steps[step_index] * fractions[:, None], points[:, -1]])
+
+
+def stamp(canvas: np.ndarray, points: np.ndarray, offsets: np.ndarray, margin: int):
+    """
+    sets the pixels covered by the brush at every point.
+    canvas has margin extra pixels on every side, at least the brush radius, so that no pixel falls outside of it
+    """
+    if len(points) == 0:
+        return
+    width = canvas.shape[1]
+    pixels = np.clip(np.rint(points).astype(np.int64), 0, width - 2 * margin - 1) + margin
+    centers = np.unique(pixels[:, 1] * width + pixels[:, 0])
+    canvas.ravel()[(centers[:, None] + offsets[:, 1] * width + offsets[:, 0]).ravel()] = 1
+
+
+def draw_numbers(canvas: np.ndarray, kanji: Kanji, scale: float):
+    # draws the stroke numbers of kanji, their position being the bottom left corner of the text
+    cell = NUMBER_FONT_SIZE * scale / 7
+    size = canvas.shape[0]
+    for number, stroke in enumerate(kanji.getStrokes(), start=1):
+        if not stroke.numberPos:
+            continue
+        left = stroke.numberPos[0] * scale
+        top = stroke.numberPos[1] * scale - 5 * cell
+        for digit in str(number):
+            for row, bits in enumerate(DIGITS[digit]):
+                for column, bit in enumerate(bits):
+                    if bit == "1":
+                        x0, y0 = int(left + column * cell), int(top + row * cell)
+                        x1, y1 = int(left + (column + 1) * cell), int(top + (row + 1) * cell)
+                        canvas[max(y0, 0):min(max(y1, y0 + 1), size), max(x0, 0):min(max(x1, x0 + 1), size)] = 1
+            left += 4 * cell
+
+
+def downsample(canvas: np.ndarray, factor: int) -> np.ndarray:
+    # coverage of each pixel of a 0 / 1 uint8 canvas, from 0 to factor * factor
+    size = canvas.shape[0] // factor
+    coverage = np.zeros((size, size), dtype=np.uint16)
+    for dy in range(factor):
+        for dx in range(factor):
+            coverage += canvas[dy::factor, dx::factor]
+    return coverage
+
+
+def render(kanji: Kanji, size: int, numbers: bool = False) -> np.ndarray:
+    """(size, size) uint8 grayscale bitmap of kanji: black strokes and gray numbers on white"""
+    canvas_size = size * SUPERSAMPLING
+    scale = canvas_size / CANVAS_SIZE
+    radius = STROKE_WIDTH / 2 * scale
+    margin = int(np.ceil(radius))
+    strokes = np.zeros((canvas_size + 2 * margin, canvas_size + 2 * margin), dtype=np.uint8)
+    # brush stamps a quarter of their radius apart leave edges less than 3% of the radius off a straight line
+    stamp(strokes, stroke_points(kanji, scale, max(radius / 4, 0.5)), brush(radius), margin)
+    samples = SUPERSAMPLING * SUPERSAMPLING
+    image = 255 - downsample(strokes[margin:-margin, margin:-margin], SUPERSAMPLING) * (255 / samples)
+    if numbers:
+        digits = np.zeros((canvas_size, canvas_size), dtype=np.uint8)
+        draw_numbers(digits, kanji, scale)
+        image = np.minimum(image, 255 - downsample(digits, SUPERSAMPLING) * ((255 - NUMBER_GRAY) / samples))
+    return np.rint(image).astype(np.uint8)
+
+
+def encode_png(image: np.ndarray) -> bytes:
+    # 8 bit grayscale png, every row without filter
+    height, width = image.shape
+    raw = np.hstack([np.zeros((height, 1), dtype=np.uint8), image]).tobytes()
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 9)) + chunk(b"IEND", b"")
+
+
+def encode(image: np.ndarray, format: str) -> bytes:
+    return encode_png(image) if format == "png" else image.tobytes()
+
+
+class RasterCache:
+    """
+    directory of renders named by their key, bounded to max_bytes.
+    The least recently used renders are evicted first, use being tracked by the mtime of the files
+    """
+    def __init__(self, directory: str = CACHE_DIR, max_bytes: int = MAX_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        # file name -> size, least recently used first
+        self.entries: OrderedDict[str, int] = OrderedDict()
+        files = [entry for entry in os.scandir(directory) if entry.is_file() and not entry.name.endswith(".tmp")]
+        for entry in sorted(files, key=lambda entry: entry.stat().st_mtime_ns):
+            self.entries[entry.name] = entry.stat().st_size
+        self.total = sum(self.entries.values())
+        # max_bytes may be lower than when the cache was filled
+        self.evict()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def get(self, name: str) -> str | None:
+        # the path of a cached render, marked as just used
+        if name not in self.entries:
+            return None
+        path = self.path(name)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.total -= self.entries.pop(name)
+            return None
+        self.entries.move_to_end(name)
+        return path
+
+    def put(self, name: str, data: bytes) -> str:
+        path = self.path(name)
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+        if name in self.entries:
+            self.total -= self.entries.pop(name)
+        self.entries[name] = len(data)
+        self.total += len(data)
+        self.evict()
+        return path
+
+    def evict(self):
+        # the most recently used render is never evicted, even if it is larger than the cache
+        while self.total > self.max_bytes and len(self.entries) > 1:
+            name, size = self.entries.popitem(last=False)
+            self.total -= size
+            try:
+                os.remove(self.path(name))
+            except FileNotFoundError:
+                pass
+
+
+def render_key(svg: bytes, size: int, numbers: bool, format: str) -> str:
+    options = f"{RENDER_VERSION}:{size}:{int(numbers)}:{format}".encode()
+    return hashlib.sha1(options + b"\0" + svg).hexdigest() + "." + format
+
+
+def render_job(path: str, size: int, numbers: bool, format: str) -> bytes:
+    return encode(render(SvgFileInfo(os.path.basename(path), os.path.dirname(path)).read(), size, numbers), format)
+
+
+def render_chunk(jobs: list[tuple[str, int, bool, str]]) -> list[bytes]:
+    return [render_job(*job) for job in jobs]
+
+
+def render_files(paths: Iterable[str], sizes: list[int], numbers: bool, format: str = "png",
+                 cache: RasterCache | None = None, jobs: int = 1, chunk_size: int = 16) -> Iterator[tuple[str, int, str]]:
+    """
+    yields (svg path, size, cached render path) for every path and size.
+    Cached renders are yielded first, the others once they have been rendered by jobs worker processes
+    """
+    cache = cache or RasterCache()
+    missing: list[tuple[tuple[str, int, bool, str], str]] = []
+    for path in paths:
+        with open(path, "rb") as f:
+            svg = f.read()
+        for size in sizes:
+            name = render_key(svg, size, numbers, format)
+            cached = cache.get(name)
+            if cached is not None:
+                yield path, size, cached
+            else:
+                missing.append(((path, size, numbers, format), name))
+
+    chunks = [missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size)]
+    if jobs <= 1 or len(chunks) <= 1:
+        results = (render_chunk([job for job, _ in chunk]) for chunk in chunks)
+        for chunk, datas in zip(chunks, results):
+            for ((path, size, _, _), name), data in zip(chunk, datas):
+                yield path, size, cache.put(name, data)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for chunk, datas in zip(chunks, executor.map(render_chunk, [[job for job, _ in chunk] for chunk in chunks])):
+            for ((path, size, _, _), name), data in zip(chunk, datas):
+                yield path, size, cache.put(name, data)
+
+
+def find_files(kanjis: list[str], catalog: SvgCatalog) -> list[str]:
+    # svg paths of kanji characters, codes or paths
+    paths = []
+    for kanji in kanjis:
+        if kanji.endswith(".svg"):
+            paths.append(kanji)
+            continue
+        svg_file = catalog.base(canonicalId(kanji))
+        if svg_file is None:
+            print(f"{kanji}: no svg file found", file=sys.stderr)
+            continue
+        paths.append(svg_file.path)
+    return paths
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("kanji", type=str, nargs="*", help="kanji, codes or svg files, every base file of kanji/ by default")
+    parser.add_argument("--size", type=int, nargs="+", default=[128], help="width and height of the bitmaps, in pixels")
+    parser.add_argument("--numbers", action="store_true", help="draw the stroke numbers")
+    parser.add_argument("--format", choices=["png", "raw"], default="png", help="png, or raw 8 bit grayscale pixels")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--cache-dir", type=str, default=CACHE_DIR)
+    parser.add_argument("--max-cache-mb", type=int, default=MAX_CACHE_BYTES // (1024 * 1024))
+    parser.add_argument("--out", type=str, default=None, help="copy the renders to this directory, as <code>_<size>[_numbers].<format>")
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    catalog = SvgCatalog("./kanji/")
+    paths = find_files(args.kanji, catalog) if args.kanji else [svg_file.path for svg_file in catalog.baseFiles()]
+    cache = RasterCache(args.cache_dir, args.max_cache_mb * 1024 * 1024)
+    if args.out is not None:
+        os.makedirs(args.out, exist_ok=True)
+
+    started = time.time()
+    count = 0
+    for path, size, cached in render_files(paths, args.size, args.numbers, args.format, cache, args.jobs):
+        count += 1
+        if args.out is not None:
+            name = os.path.basename(path)[:-4] + f"_{size}" + ("_numbers" if args.numbers else "") + "." + args.format
+            shutil.copyfile(cached, os.path.join(args.out, name))
+        elif args.kanji:
+            print(cached)
+    print(f"{count} renders in {time.time() - started:.2f}s, cache: {len(cache.entries)} files, {cache.total // 1024} KiB", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""
+recognizes kanji from hand drawn strokes, given in stroke order as lists of (x, y) points.
+
+the strokes of every kanji of kanjivg.xml are precomputed (see stroke_geometry.py):
+- resampled into POINTS points evenly spaced along the stroke
+- normalized per kanji: centered on the bounding box of the kanji and scaled to a unit square
+- stored in INDEX_FILE as one packed (strokes, POINTS, 2) float32 array, kanji grouped by stroke count,
+  so the strokes of all kanji with n strokes are one contiguous (kanji, n, POINTS, 2) block
+- along with the direction classes allowed by the kvg:type of each stroke in TYPES_FILE,
+  and the elements and the block of each stroke count in META_FILE
+
+a query only looks at the block of its stroke count: kanji whose stroke types do not match the directions
+of the drawn strokes are pruned, and the rest are scored by their mean point distance, all at once.
+
+examples:
+
+python3 recognizer.py           # builds the index
+python3 recognizer.py --test 未 # recognizes the strokes of 未 with some noise added
+"""
+
+import json
+import math
+import time
+import argparse
+from typing import Sequence
+
+import numpy as np
+
+from stroke_geometry import CorpusStrokes, load_strokes, sample_segments, SAMPLES
+from kvg import releaseFile
+
+INDEX_FILE = "stroke_index.npy"
+TYPES_FILE = "stroke_index_types.npy"
+META_FILE = "stroke_index.json"
+
+POINTS = 16
+TOP = 10
+
+# direction classes of a stroke, from its start to its end point (y going down)
+HORIZONTAL, RISING, FALLING_RIGHT, VERTICAL, FALLING_LEFT = 1, 2, 4, 8, 16
+ANY_DIRECTION = 31
+# (start, end, class) ranges of the angle of a drawn stroke, in degrees
+DIRECTION_RANGES = [
+    (-20, 20, HORIZONTAL),
+    (-70, -20, RISING),
+    (20, 70, FALLING_RIGHT),
+    (70, 110, VERTICAL),
+    (110, 160, FALLING_LEFT),
+]
+# a drawn stroke this close to the end of a range also matches the neighbouring class
+DIRECTION_TOLERANCE = 12
+# drawn strokes longer than this times the distance between their ends are curves or hooks, of any class
+MAX_STRAIGHTNESS = 1.3
+
+# direction classes of the basic kvg:types, other types (hooks, turns...) match any direction
+TYPE_DIRECTIONS = {
+    "㇐": HORIZONTAL,
+    "㇀": RISING,
+    "㇏": FALLING_RIGHT,
+    "㇑": VERTICAL,
+    "㇒": FALLING_LEFT,
+    "㇔": FALLING_RIGHT | VERTICAL | FALLING_LEFT,
+}
+
+
+def type_directions(stype: str | None) -> int:
+    # the classes allowed by any of the alternatives of a kvg:type, i.e. ㇔/㇏
+    if not stype:
+        return ANY_DIRECTION
+    directions = 0
+    for alternative in stype.split("/"):
+        directions |= TYPE_DIRECTIONS.get(alternative[:1], ANY_DIRECTION)
+    return directions
+
+
+def stroke_directions(points: np.ndarray) -> int:
+    # classes of a drawn stroke, 0 if it cannot be told
+    chord = points[-1] - points[0]
+    chord_length = math.hypot(chord[0], chord[1])
+    if chord_length == 0:
+        return 0
+    length = np.sqrt((np.diff(points, axis=0) ** 2).sum(axis=1)).sum()
+    if length > MAX_STRAIGHTNESS * chord_length:
+        return 0
+    angle = math.degrees(math.atan2(chord[1], chord[0]))
+    directions = 0
+    for start, end, direction in DIRECTION_RANGES:
+        if start - DIRECTION_TOLERANCE <= angle <= end + DIRECTION_TOLERANCE:
+            directions |= direction
+    return directions
+
+
+def resample(points: np.ndarray, stroke_offsets: np.ndarray, count: int = POINTS) -> np.ndarray:
+    """
+    (strokes, count, 2) points evenly spaced along each polyline,
+    polyline i being points[stroke_offsets[i]:stroke_offsets[i + 1]]
+    """
+    stroke_count = len(stroke_offsets) - 1
+    sizes = np.diff(stroke_offsets)
+    steps = np.sqrt((np.diff(points, axis=0) ** 2).sum(axis=1))
+    # steps between two polylines do not count
+    steps[stroke_offsets[1:-1] - 1] = 0
+    distance = np.concatenate([[0.0], np.cumsum(steps)])
+    firsts = stroke_offsets[:-1]
+    lasts = stroke_offsets[1:] - 1
+    starts = distance[firsts]
+    lengths = distance[lasts] - starts
+
+    targets = starts[:, None] + lengths[:, None] * np.linspace(0.0, 1.0, count)[None, :]
+    after = np.searchsorted(distance, targets, side="left")
+    after = np.clip(after, (firsts + 1)[:, None], np.maximum(lasts, firsts + 1)[:, None])
+    after = np.minimum(after, len(points) - 1)
+    before = np.maximum(after - 1, firsts[:, None])
+    span = distance[after] - distance[before]
+    ratio = np.where(span > 0, (targets - distance[before]) / np.where(span > 0, span, 1), 0.0)
+    result = points[before] + (points[after] - points[before]) * ratio[..., None]
+    # single point polylines
+    result[sizes == 1] = points[firsts[sizes == 1]][:, None, :]
+    return result.reshape(stroke_count, count, 2)
+
+
+def normalize_kanji(strokes: np.ndarray) -> np.ndarray:
+    # centers (strokes, count, 2) points on their bounding box, scaled so its longest side is 1
+    low = strokes.reshape(-1, 2).min(axis=0)
+    high = strokes.reshape(-1, 2).max(axis=0)
+    size = max(float((high - low).max()), 1e-6)
+    return (strokes - (low + high) / 2) / size
+
+
+def corpus_points(corpus: CorpusStrokes, count: int = POINTS) -> np.ndarray:
+    # resampled (strokes, count, 2) points of every stroke of corpus, from the samples of its segments
+    points = sample_segments(corpus.segments, SAMPLES).reshape(-1, 2)
+    stroke_offsets = corpus.segment_offsets * SAMPLES
+    empty = np.diff(stroke_offsets) == 0
+    if empty.any():
+        raise ValueError(f"{int(empty.sum())} strokes have no path data")
+    return resample(points, stroke_offsets, count).astype(np.float32)
+
+
+def build_index(release_file: str = releaseFile, count: int = POINTS) -> int:
+    corpus = load_strokes(release_file)
+    # strokes without path data cannot be recognized
+    kanji_strokes = [
+        (i, corpus.stroke_offsets[i], corpus.stroke_offsets[i + 1])
+        for i in range(len(corpus.elements))
+        if corpus.stroke_offsets[i + 1] > corpus.stroke_offsets[i]
+        and all(corpus.segment_offsets[j + 1] > corpus.segment_offsets[j] for j in range(corpus.stroke_offsets[i], corpus.stroke_offsets[i + 1]))
+    ]
+    kept = np.concatenate([np.arange(start, end) for _, start, end in kanji_strokes])
+    kept_corpus = CorpusStrokes(
+        [corpus.codes[i] for i, _, _ in kanji_strokes],
+        [corpus.elements[i] for i, _, _ in kanji_strokes],
+        [corpus.stroke_types[j] for j in kept],
+        np.concatenate([[0], np.cumsum([end - start for _, start, end in kanji_strokes])]),
+        np.concatenate([[0], np.cumsum(np.diff(corpus.segment_offsets)[kept])]),
+        np.concatenate([corpus.segments[corpus.segment_offsets[j]:corpus.segment_offsets[j + 1]] for j in kept]),
+    )
+    points = corpus_points(kept_corpus, count)
+    directions = np.array([type_directions(stype) for stype in kept_corpus.stroke_types], dtype=np.uint8)
+
+    # kanji grouped by stroke count, in document order within a group
+    stroke_counts = kept_corpus.stroke_counts
+    order = np.argsort(stroke_counts, kind="stable")
+    packed_points = []
+    packed_directions = []
+    elements = []
+    blocks = {}
+    offset = 0
+    for i in order:
+        start, end = kept_corpus.stroke_offsets[i], kept_corpus.stroke_offsets[i + 1]
+        n = int(end - start)
+        if n not in blocks:
+            blocks[n] = [len(elements), len(elements), offset]
+        blocks[n][1] += 1
+        elements.append(kept_corpus.elements[i])
+        packed_points.append(normalize_kanji(points[start:end]))
+        packed_directions.append(directions[start:end])
+        offset += n
+
+    np.save(INDEX_FILE, np.concatenate(packed_points).astype(np.float32))
+    np.save(TYPES_FILE, np.concatenate(packed_directions))
+    with open(META_FILE, "w") as f:
+        # blocks: stroke count -> [first kanji, end kanji, first stroke]
+        json.dump({"points": count, "elements": elements, "blocks": blocks}, f, ensure_ascii=False)
+    return len(elements)
+
+
+class Recognizer:
+    """the stroke index, memory mapped"""
+    def __init__(self, index_file: str = INDEX_FILE, types_file: str = TYPES_FILE, meta_file: str = META_FILE):
+        self.points = np.load(index_file, mmap_mode="r")
+        self.directions = np.load(types_file, mmap_mode="r")
+        with open(meta_file) as f:
+            meta = json.load(f)
+        self.count: int = meta["points"]
+        self.elements: list[str] = meta["elements"]
+        self.blocks: dict[int, tuple[int, int, int]] = {int(n): tuple(block) for n, block in meta["blocks"].items()}
+
+    def recognize(self, strokes: Sequence[Sequence[tuple[float, float]]], top: int = TOP, max_mismatches: int | None = None) -> list[tuple[str, float]]:
+        """
+        candidates for strokes, best first, with their mean point distance (in units of the kanji size).
+        Only kanji with as many strokes are considered, and of these the ones where more than max_mismatches strokes
+        (a fourth of the strokes by default) go in a direction their kvg:type does not allow
+        """
+        n = len(strokes)
+        if n not in self.blocks:
+            return []
+        if max_mismatches is None:
+            max_mismatches = n // 4
+
+        drawn = [np.asarray(stroke, dtype=np.float64).reshape(-1, 2) for stroke in strokes]
+        offsets = np.concatenate([[0], np.cumsum([len(stroke) for stroke in drawn])])
+        query = normalize_kanji(resample(np.concatenate(drawn), offsets, self.count)).astype(np.float32)
+        query_directions = np.array([stroke_directions(stroke) for stroke in drawn], dtype=np.uint8)
+
+        first, end, stroke_offset = self.blocks[n]
+        kanji_count = end - first
+        points = self.points[stroke_offset:stroke_offset + kanji_count * n].reshape(kanji_count, n, self.count, 2)
+        directions = self.directions[stroke_offset:stroke_offset + kanji_count * n].reshape(kanji_count, n)
+
+        # drawn strokes whose direction cannot be told match anything
+        matches = ((directions & query_directions) != 0) | (query_directions == 0)
+        candidates = np.flatnonzero((~matches).sum(axis=1) <= max_mismatches)
+        if len(candidates) == 0:
+            return []
+        distances = np.sqrt(((points[candidates] - query) ** 2).sum(axis=3)).mean(axis=(1, 2))
+        best = np.argsort(distances)[:top]
+        return [(self.elements[first + candidates[i]], float(distances[i])) for i in best]
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--test", type=str, nargs="*", default=None, help="recognizes the strokes of these kanji, with noise added, instead of building the index")
+    parser.add_argument("--noise", type=float, default=1.5, help="standard deviation of the noise added by --test, the kanji being 109 wide")
+    parser.add_argument("--top", type=int, default=TOP)
+    parser.add_argument("--release-file", type=str, default=releaseFile)
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    if args.test is None:
+        started = time.time()
+        count = build_index(args.release_file)
+        print(f"{count} kanji indexed in {time.time() - started:.2f}s")
+        return
+
+    # test strokes: the sampled corpus strokes, shifted, scaled and with noise
+    corpus = load_strokes(args.release_file)
+    rows = {element: i for i, element in enumerate(corpus.elements)}
+    recognizer = Recognizer()
+    rng = np.random.default_rng(0)
+    for kanji in args.test:
+        if kanji not in rows:
+            print(f"{kanji}: not in {args.release_file}")
+            continue
+        i = rows[kanji]
+        strokes = []
+        for j in range(corpus.stroke_offsets[i], corpus.stroke_offsets[i + 1]):
+            segments = corpus.segments[corpus.segment_offsets[j]:corpus.segment_offsets[j + 1]]
+            points = sample_segments(segments, 8).reshape(-1, 2) * 2.5 + 30
+            strokes.append(points + rng.normal(0, args.noise * 2.5, points.shape))
+        started = time.time()
+        candidates = recognizer.recognize(strokes, args.top)
+        elapsed = (time.time() - started) * 1000
+        print(kanji, f"{elapsed:.1f}ms", " ".join(f"{element} ({distance:.3f})" for element, distance in candidates))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,65 +4,111 @@ examples:
 python3 search.py 戈
 python3 search.py -m 0 戈
 python3 search.py -m 0 --sort-file kanji_freq/innocent_corpus/kanji_component_freq_map.json --sort-file-is-freq-map 戈
+python3 search.py -m 0 --corpus innocent_corpus_components 戈
+python3 search.py -m 0 --corpus aozora 戈   # combinations sorted by aozora, see update_db.py --per-corpus
+
+python3 search.py -m 0 --recursive 戈   # every kanji containing 戈, at any depth
+python3 search.py -m 0 --all-of 氵 木 口 --none-of 艹   # kanji containing all of 氵 木 口 but not 艹, by frequency
+python3 search.py -m 0 --similar 未   # kanji that look like 未, see similarity.py
+python3 search.py -a --svg 未         # also prints the svg file of 未 stored in kanjivg.db
+
+python3 search.py --serve &         # keeps kanjivg.db, frequency maps and AnkiConnect connections warm
+python3 search.py --connect -m 0 戈  # same as above, answered by the server
 """
 
+import io
+import os
+import sys
 import json
+import socket
 import sqlite3
 import argparse
-import urllib.request
+import socketserver
+import contextlib
 from typing import Any
 
 from kanji_data import row_to_kanjivg_data
 from util import json_to_str
-from sort_kanji import to_freq_map
-
+from sort_kanji import to_freq_map, sort_kanji, FreqMap
+from anki_connect import AnkiConnect, ANKI_CONNECT_URL
+from svg_store import SvgStore
+import anki_mirror
+import freq_db
 
-def request(action, **params):
-    return {'action': action, 'params': params, 'version': 6}
+MAX_ANKI_RESULTS = 5
 
-def invoke(action, **params):
-    requestJson = json.dumps(request(action, **params)).encode('utf-8')
-    response = json.load(urllib.request.urlopen(urllib.request.Request('http://localhost:8765', requestJson)))
-    if len(response) != 2:
-        raise Exception('response has an unexpected number of fields')
-    if 'error' not in response:
-        raise Exception('response is missing required error field')
-    if 'result' not in response:
-        raise Exception('response is missing required result field')
-    if response['error'] is not None:
-        raise Exception(response['error'])
-    return response['result']
+# kanji -> (up to MAX_ANKI_RESULTS words, total number of cards)
+AnkiWords = dict[str, tuple[list[str], int]]
 
+SOCKET_FILE = "search.sock"
+DB_FILE = "kanjivg.db"
 
 
-def get_args():
+def get_parser():
     parser = argparse.ArgumentParser()
-    parser.add_argument("kanji", type=str, nargs="+")
+    parser.add_argument("kanji", type=str, nargs="*")
     parser.add_argument("-a", "--do-not-search-anki", action="store_true")
     parser.add_argument("-m", "--max", type=int, default=20)
     parser.add_argument("-v", "--verbose", action="store_true")
-    parser.add_argument("--sort-file", type=str, default="kanji_freq/innocent_corpus/kanji_meta_bank_1.json")
+    parser.add_argument("--svg", action="store_true", help="print the svg file of the kanji, as stored in kanjivg.db")
+    parser.add_argument("--corpus", type=str, default=None, help=f"frequency corpus of kanjivg.db to display ({freq_db.DEFAULT_CORPUS} by default) and sort the combinations by, see freq_db.py")
+    parser.add_argument("--sort-file", type=str, default=None, help="read the frequencies from this json file instead of --corpus")
     parser.add_argument("--sort-file-is-freq-map", action="store_true")
-    return parser.parse_args()
+    parser.add_argument("--all-of", type=str, nargs="+", default=[], help="list the kanji that contain all of these components, at any depth")
+    parser.add_argument("--none-of", type=str, nargs="+", default=[], help="excludes the kanji that contain any of these components from --all-of")
+    parser.add_argument("--similar", action="store_true", help="list the kanji that look the most like the kanji, instead of its combinations")
+    parser.add_argument("--top", type=int, default=10, help="number of kanji listed by --similar")
+    parser.add_argument("-r", "--recursive", action="store_true", help="list every kanji that contains the kanji at any depth, instead of only the direct combinations")
+    parser.add_argument("--anki-url", type=str, default=ANKI_CONNECT_URL)
+    parser.add_argument("--anki-workers", type=int, default=4, help="number of concurrent requests to AnkiConnect")
+    parser.add_argument("--live", action="store_true", help="always query AnkiConnect, instead of the local mirror of the Word field")
+    parser.add_argument("--sync", action="store_true", help="sync the local mirror of the Word field before searching")
+    parser.add_argument("--mirror-file", type=str, default=anki_mirror.MIRROR_FILE)
+    parser.add_argument("--serve", action="store_true", help="answer searches sent with --connect over a unix socket, until interrupted")
+    parser.add_argument("--connect", action="store_true", help="send this search to a running --serve process")
+    parser.add_argument("--socket", type=str, default=SOCKET_FILE)
+    return parser
+
+def get_args(argv: list[str] | None = None):
+    parser = get_parser()
+    args = parser.parse_args(argv)
+    if not args.kanji and not args.all_of and not args.serve:
+        parser.error("the following arguments are required: kanji")
+    if args.none_of and not args.all_of:
+        parser.error("--none-of requires --all-of")
+    return args
+
+def search_anki_words(client: AnkiConnect, kanjis: list[str]) -> AnkiWords:
+    """
+    looks up the words of all kanjis at once:
+    one batch of findCards actions, then one batch of cardsInfo actions
+    """
+    kanjis = list(dict.fromkeys(kanjis))
+    all_card_ids = client.multi([("findCards", {"query": f"Word:*{kanji}*"}) for kanji in kanjis])
+    some_card_ids = [sorted(card_ids)[:MAX_ANKI_RESULTS] for card_ids in all_card_ids]
+    all_cards_info = client.multi([("cardsInfo", {"cards": card_ids}) for card_ids in some_card_ids])
+
+    result = {}
+    for kanji, card_ids, cards_info in zip(kanjis, all_card_ids, all_cards_info):
+        words = [info["fields"]["Word"]["value"] for info in cards_info]
+        result[kanji] = (words, len(card_ids))
+    return result
 
-def print_kanji(kanji, freq_map, search_anki: bool):
-    MAX_ANKI_RESULTS = 5
+def search_mirror_words(mirror: sqlite3.Connection, kanjis: list[str]) -> AnkiWords:
+    return {kanji: anki_mirror.search_words(mirror, kanji, MAX_ANKI_RESULTS) for kanji in kanjis}
+
+def print_kanji(kanji, freq_map, anki_words: AnkiWords | None = None):
     sort_value = freq_map.get(kanji, None)
     display_value = None
     if sort_value is not None:
         display_value = sort_value.get("displayValue")
     print_values = [kanji, display_value]
 
-    if search_anki:
+    if anki_words is not None and kanji in anki_words:
         print_values.append("-")
-        words = []
-        card_ids = invoke("findCards", query=f"Word:*{kanji}*")
-        some_card_ids = sorted(card_ids)[:MAX_ANKI_RESULTS]
-        cards_info = invoke("cardsInfo", cards=some_card_ids)
-        if cards_info:
-            for info in cards_info:
-                words.append(info["fields"]["Word"]["value"])
-            remaining = len(card_ids) - MAX_ANKI_RESULTS
+        words, total = anki_words[kanji]
+        if words:
+            remaining = total - MAX_ANKI_RESULTS
             print_values.append("　".join(words))
             if remaining > 0:
                 print_values.append(f"+{remaining}")
@@ -77,9 +123,9 @@ def print_components(components):
         print("No components found.")
 
 
-def print_combinations(combinations, freq_map, search_anki: bool = False, max: int=20):
-    for i, kanji in enumerate(combinations):
-        print_kanji(kanji, freq_map, search_anki and i < max)
+def print_combinations(combinations, freq_map, anki_words: AnkiWords | None = None):
+    for kanji in combinations:
+        print_kanji(kanji, freq_map, anki_words)
 
         #print(json.dumps(json_data, indent=2, ensure_ascii=False))
     if len(combinations) == 0:
@@ -88,7 +134,7 @@ def print_combinations(combinations, freq_map, search_anki: bool = False, max: i
 def get_row_data(cur, kanji: str) -> list[Any] | None:
     # TODO: near duplicate function in kanji_data.py: get_kanjivg_data
     SQL = "SELECT * FROM kanjivg WHERE element = ?"
-    data_list = cur.execute(SQL, kanji).fetchall()
+    data_list = cur.execute(SQL, (kanji,)).fetchall()
     if len(data_list) > 1:
         print(f"Found more than one entry in kanjivg for {kanji}?")
     if len(data_list) == 0:
@@ -97,36 +143,306 @@ def get_row_data(cur, kanji: str) -> list[Any] | None:
     return data
 
 
-def main():
-    args = get_args()
+def get_recursive_combinations(cur, kanji: str) -> list[str]:
+    # closest first, see gen_db.write_closure
+    SQL = "SELECT ancestor FROM component_closure WHERE descendant = ? ORDER BY depth"
+    return [row[0] for row in cur.execute(SQL, (kanji,))]
+
+
+def get_component_bits(cur, component: str) -> int:
+    # bitset of the ids of the kanji containing component, see gen_db.write_component_bitsets
+    row = cur.execute("SELECT bits FROM component_bitsets WHERE component = ?", (component,)).fetchone()
+    return 0 if row is None else int.from_bytes(row[0], "little")
+
+def bitset_ids(bits: int) -> list[int]:
+    return [i for i, bit in enumerate(reversed(bin(bits)[2:])) if bit == "1"]
+
+def search_components(cur, all_of: list[str], none_of: list[str]) -> list[str]:
+    # the kanji containing every component of all_of and none of none_of, in id order
+    bits = get_component_bits(cur, all_of[0])
+    for component in all_of[1:]:
+        bits &= get_component_bits(cur, component)
+    for component in none_of:
+        bits &= ~get_component_bits(cur, component)
+    SQL = "SELECT element FROM kanjivg WHERE id IN (SELECT value FROM json_each(?)) ORDER BY id"
+    return [row[0] for row in cur.execute(SQL, (json.dumps(bitset_ids(bits)),))]
+
+
+class SearchContext:
+    """
+    resources used to answer searches: the kanjivg.db connection, frequency maps,
+    AnkiConnect clients and the mirror of the Word field.
+    They are opened on first use and kept until close(),
+    so a --serve process only loads them once for all its searches.
+    Files are cached by absolute path, as the searches of a --serve process can come from different directories.
+    """
+    def __init__(self):
+        self.conn: sqlite3.Connection | None = None
+        # (absolute path, inode, mtime) of the database self.conn was opened on
+        self.db_key: tuple[str, int, int] | None = None
+        # (absolute sort_file, is_freq_map) -> (mtime of sort_file, freq map)
+        self.freq_maps: dict[tuple[str, bool], tuple[float, FreqMap]] = {}
+        self.clients: dict[tuple[str, int], AnkiConnect] = {}
+        self.mirrors: dict[str, sqlite3.Connection] = {}
+        # ((absolute path, mtime) of the shapes and elements files, similarity index)
+        self.similarity_index: tuple[tuple[str, int, str, int], Any] | None = None
+
+    def open_db(self) -> sqlite3.Connection:
+        """
+        connects to the kanjivg.db of the current directory, at the start of every search.
+        The connection is kept while the file stays the same, and reopened when it changed:
+        db.sh removes kanjivg.db and builds a new file, gen_db.py --incremental rewrites it in place
+        """
+        path = os.path.abspath(DB_FILE)
+        st = os.stat(path)
+        key = (path, st.st_ino, st.st_mtime_ns)
+        if self.conn is None or key != self.db_key:
+            if self.conn is not None:
+                self.conn.close()
+            # statements are prepared once and cached by the connection
+            self.conn = sqlite3.connect(path)
+            self.db_key = key
+        return self.conn
+
+    def db(self) -> sqlite3.Connection:
+        if self.conn is None:
+            return self.open_db()
+        return self.conn
+
+    def corpus_freq_map(self, corpus: str, ranked: bool = False) -> freq_db.CorpusFreqMap | FreqMap:
+        if not freq_db.has_corpus(self.db(), corpus):
+            print(f"corpus {corpus} is not in kanjivg.db, see freq_db.py", file=sys.stderr)
+            return {}
+        return freq_db.CorpusFreqMap(self.db(), corpus, ranked)
+
+    def freq_map(self, sort_file: str, is_freq_map: bool) -> FreqMap:
+        sort_file = os.path.abspath(sort_file)
+        mtime = os.path.getmtime(sort_file)
+        cached = self.freq_maps.get((sort_file, is_freq_map))
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with open(sort_file) as f:
+            freq_list = json.load(f)
+        freq_map = freq_list if is_freq_map else to_freq_map(freq_list)
+        self.freq_maps[(sort_file, is_freq_map)] = (mtime, freq_map)
+        return freq_map
+
+    def similarity(self):
+        # numpy is only imported by the searches that need it
+        from similarity import SimilarityIndex, SHAPES_FILE, ELEMENTS_FILE
+        # reloaded when similarity.py rebuilt the index, as db.sh does
+        shapes_file, elements_file = os.path.abspath(SHAPES_FILE), os.path.abspath(ELEMENTS_FILE)
+        key = (shapes_file, os.stat(shapes_file).st_mtime_ns, elements_file, os.stat(elements_file).st_mtime_ns)
+        if self.similarity_index is None or self.similarity_index[0] != key:
+            self.similarity_index = (key, SimilarityIndex(shapes_file, elements_file))
+        return self.similarity_index[1]
+
+    def client(self, url: str, workers: int) -> AnkiConnect:
+        client = self.clients.get((url, workers))
+        if client is None:
+            client = AnkiConnect(url, workers)
+            self.clients[(url, workers)] = client
+        return client
+
+    def mirror(self, path: str) -> sqlite3.Connection:
+        path = os.path.abspath(path)
+        mirror = self.mirrors.get(path)
+        if mirror is None:
+            mirror = anki_mirror.open_mirror(path)
+            self.mirrors[path] = mirror
+        return mirror
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+            self.db_key = None
+        for client in self.clients.values():
+            client.shutdown()
+        for mirror in self.mirrors.values():
+            mirror.close()
+        self.clients = {}
+        self.mirrors = {}
+        self.similarity_index = None
+
 
-    with open(args.sort_file) as f:
-        freq_list = json.load(f)
-    if args.sort_file_is_freq_map:
-        freq_map = freq_list
+def search(args, context: SearchContext):
+    context.open_db()
+    if args.sort_file is not None:
+        freq_map = context.freq_map(args.sort_file, args.sort_file_is_freq_map)
     else:
-        freq_map = to_freq_map(freq_list)
-
-    with sqlite3.connect("kanjivg.db") as conn:
-        cur = conn.cursor()
-        for kanji in args.kanji:
-            row = get_row_data(cur, kanji)
-            if row is None:
-                print(f"{kanji}: Could not find row data.")
-                continue
+        # ranked by the corpus when update_db.py --per-corpus stored its ranks, for an explicit --corpus
+        ranked = args.corpus is not None and freq_db.has_corpus_ranks(context.db(), args.corpus)
+        freq_map = context.corpus_freq_map(args.corpus or freq_db.DEFAULT_CORPUS, ranked)
+    client = None if args.do_not_search_anki else context.client(args.anki_url, args.anki_workers)
 
-            data = row_to_kanjivg_data(row)
-            if data is None:
-                print(f"{kanji}: Could not find kanjivg data.")
-                continue
+    # the mirror is used whenever it exists, unless --live is given
+    mirror = None
+    use_mirror = not args.do_not_search_anki and not args.live
+    if use_mirror and (args.sync or os.path.exists(args.mirror_file)):
+        mirror = context.mirror(args.mirror_file)
+        if args.sync:
+            anki_mirror.sync(mirror, client)
+
+    # combinations sorted by the corpus when update_db.py --per-corpus stored them, otherwise in kanjivg order.
+    # Only for an explicit --corpus: the kanjivg order is the one db.sh chose (by component usage)
+    sorted_corpus = None
+    if args.corpus is not None and args.sort_file is None and freq_db.has_corpus_combinations(context.db(), args.corpus):
+        sorted_corpus = args.corpus
+
+    cur = context.db().cursor()
+    svg_store = SvgStore(context.db())
+    if args.all_of:
+        kanjis = sort_kanji(search_components(cur, args.all_of, args.none_of), freq_map)
+        anki_words = None
+        if mirror is not None:
+            anki_words = search_mirror_words(mirror, kanjis[:args.max])
+        elif client is not None:
+            anki_words = search_anki_words(client, kanjis[:args.max])
+        for kanji in kanjis:
+            print_kanji(kanji, freq_map, anki_words)
+        if len(kanjis) == 0:
+            print("No kanji contains all of the components.")
+        if args.kanji:
+            print()
+
+    for kanji in args.kanji:
+        row = get_row_data(cur, kanji)
+        if row is None:
+            print(f"{kanji}: Could not find row data.")
+            continue
 
-            if args.verbose:
-                print(f"{kanji} decomposition:", json_to_str(data.decomposition, indent=2))
-                print()
-            print_kanji(kanji, freq_map, not args.do_not_search_anki)
-            print_components(data.components)
+        data = row_to_kanjivg_data(row, svg_store)
+        if data is None:
+            print(f"{kanji}: Could not find kanjivg data.")
+            continue
+
+        if args.verbose:
+            if isinstance(freq_map, freq_db.CorpusFreqMap) and freq_map.ranked:
+                corpus_rank = freq_db.load_corpus_rank(context.db(), freq_map.corpus, kanji)
+                if corpus_rank is not None:
+                    data.rank, data.occurence, data.cumulative_percent = corpus_rank
+            print(f"{kanji} rank: {data.rank}, occurrences: {data.occurence}, cumulative percent: {data.cumulative_percent}")
+            print(f"{kanji} decomposition:", json_to_str(data.decomposition, indent=2))
             print()
-            print_combinations(data.combinations, freq_map, not args.do_not_search_anki, args.max)
+        if args.svg:
+            print(data.svg)
+        if args.similar:
+            similarity_index = context.similarity()
+            if kanji not in similarity_index:
+                print(f"{kanji}: not in the similarity index, see similarity.py")
+                continue
+            data.combinations = [element for element, _ in similarity_index.similar(kanji, args.top)]
+        elif args.recursive:
+            data.combinations = get_recursive_combinations(cur, kanji)
+        elif sorted_corpus is not None:
+            data.combinations = freq_db.load_combinations(context.db(), sorted_corpus, kanji) or data.combinations
+        anki_words = None
+        if mirror is not None:
+            anki_words = search_mirror_words(mirror, [kanji] + data.combinations[:args.max])
+        elif client is not None:
+            anki_words = search_anki_words(client, [kanji] + data.combinations[:args.max])
+
+        print_kanji(kanji, freq_map, anki_words)
+        print_components(data.components)
+        print()
+        print_combinations(data.combinations, freq_map, anki_words)
+    cur.close()
+
+
+def answer(argv: list[str], context: SearchContext, cwd: str | None = None) -> tuple[str, int]:
+    """
+    runs the search of the given command line arguments, returns its output and exit status.
+    Relative paths (kanjivg.db, --sort-file, --mirror-file...) are resolved against cwd, the directory of the client
+    """
+    output = io.StringIO()
+    status = 0
+    previous_cwd = os.getcwd()
+    with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+        try:
+            if cwd is not None:
+                os.chdir(cwd)
+            args = get_args(argv)
+            if args.serve or args.connect:
+                raise ValueError("--serve and --connect cannot be sent to the server")
+            search(args, context)
+        except SystemExit as e:
+            status = e.code if isinstance(e.code, int) else 1
+        except Exception as e:
+            print(f"{type(e).__name__}: {e}")
+            status = 1
+        finally:
+            os.chdir(previous_cwd)
+    return output.getvalue(), status
+
+
+def serve(socket_file: str):
+    """
+    answers searches over a unix socket, one JSON object per line:
+    request {"argv": [...], "cwd": "..."}, response {"output": "...", "status": 0}
+    the server answers one search at a time, so each search can change to the directory of its client
+    """
+    context = SearchContext()
+
+    class SearchHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            request = json.loads(self.rfile.readline())
+            output, status = answer(request["argv"], context, request.get("cwd"))
+            response = json.dumps({"output": output, "status": status}, ensure_ascii=False)
+            self.wfile.write(response.encode("utf-8") + b"\n")
+
+    if os.path.exists(socket_file):
+        os.remove(socket_file)
+    try:
+        with socketserver.UnixStreamServer(socket_file, SearchHandler) as server:
+            print(f"serving on {socket_file}")
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        context.close()
+        if os.path.exists(socket_file):
+            os.remove(socket_file)
+
+
+def client_argv(argv: list[str]) -> list[str]:
+    # the arguments of this process, without the ones only meant for the client
+    result = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg == "--connect":
+            continue
+        elif arg == "--socket":
+            skip = True
+        elif not arg.startswith("--socket="):
+            result.append(arg)
+    return result
+
+
+def forward(argv: list[str], socket_file: str) -> int:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_file)
+        sock.sendall(json.dumps({"argv": argv, "cwd": os.getcwd()}).encode("utf-8") + b"\n")
+        with sock.makefile("rb") as f:
+            response = json.loads(f.readline())
+    print(response["output"], end="")
+    return response["status"]
+
+
+def main():
+    args = get_args()
+    if args.serve:
+        serve(args.socket)
+    elif args.connect:
+        sys.exit(forward(client_argv(sys.argv[1:]), args.socket))
+    else:
+        context = SearchContext()
+        try:
+            search(args, context)
+        finally:
+            context.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,143 @@
+"""
+visual similarity index of the kanji of kanjivg.xml, for search.py --similar.
+
+every kanji is described by a fixed size shape vector, computed from its sampled strokes (see stroke_geometry.py):
+- an occupancy grid: the length of stroke that falls in each cell of a GRID x GRID grid, slightly blurred
+  so that strokes moved by less than a cell still overlap
+- a stroke direction histogram: the length of stroke going in each of DIRECTION_BINS directions
+both parts are normalized, so the similarity of two kanji is the dot product of their vectors.
+
+the vectors of all kanji are stored as a single float32 matrix in SHAPES_FILE, which is memory mapped at query time,
+and the element of each row in ELEMENTS_FILE.
+
+examples:
+
+python3 similarity.py           # builds the index
+python3 similarity.py 未        # the kanji that look the most like 未
+"""
+
+import json
+import time
+import argparse
+
+import numpy as np
+
+from stroke_geometry import CorpusStrokes, load_strokes, sample_segments, SAMPLES
+from kvg import releaseFile
+
+SHAPES_FILE = "kanji_shapes.npy"
+ELEMENTS_FILE = "kanji_shapes.json"
+
+GRID = 16
+DIRECTION_BINS = 8
+# weight of the direction histogram against the occupancy grid
+DIRECTION_WEIGHT = 0.5
+# the svg canvas of kanjivg is 109 x 109
+CANVAS_SIZE = 109.0
+TOP = 10
+
+
+def normalize(rows: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(rows, axis=1, keepdims=True)
+    return rows / np.where(norms == 0, 1, norms)
+
+
+def blur(grids: np.ndarray) -> np.ndarray:
+    # 3x3 binomial blur of (kanji, GRID, GRID) grids
+    padded = np.pad(grids, ((0, 0), (1, 1), (1, 1)))
+    kernel = np.array([1.0, 2.0, 1.0])
+    result = np.zeros_like(grids)
+    size = grids.shape[1]
+    for dy in range(3):
+        for dx in range(3):
+            result += kernel[dy] * kernel[dx] * padded[:, dy:dy + size, dx:dx + size]
+    return result / 16
+
+
+def shape_vectors(corpus: CorpusStrokes, samples: int = SAMPLES, grid: int = GRID, bins: int = DIRECTION_BINS) -> np.ndarray:
+    """
+    (kanji, grid * grid + bins) shape vectors of every kanji of corpus.
+    Each step between two samples of a segment adds its length to the grid cell of its midpoint
+    and to the histogram bin of its direction
+    """
+    kanji_count = len(corpus.elements)
+    points = sample_segments(corpus.segments, samples)
+    steps = np.diff(points, axis=1)
+    lengths = np.sqrt((steps * steps).sum(axis=2))
+    midpoints = (points[:, 1:] + points[:, :-1]) / 2
+
+    stroke_kanji = np.repeat(np.arange(kanji_count), corpus.stroke_counts)
+    segment_kanji = np.repeat(stroke_kanji, np.diff(corpus.segment_offsets))
+    step_kanji = np.broadcast_to(segment_kanji[:, None], lengths.shape)
+
+    cells = np.clip((midpoints / CANVAS_SIZE * grid).astype(np.int64), 0, grid - 1)
+    cell_index = step_kanji * grid * grid + cells[..., 1] * grid + cells[..., 0]
+    occupancy = np.bincount(cell_index.ravel(), weights=lengths.ravel(), minlength=kanji_count * grid * grid)
+    occupancy = blur(occupancy.reshape(kanji_count, grid, grid)).reshape(kanji_count, grid * grid)
+
+    # strokes drawn in opposite directions look the same
+    angles = np.mod(np.arctan2(steps[..., 1], steps[..., 0]), np.pi)
+    direction_bins = np.minimum((angles / np.pi * bins).astype(np.int64), bins - 1)
+    histogram = np.bincount((step_kanji * bins + direction_bins).ravel(), weights=lengths.ravel(), minlength=kanji_count * bins)
+    histogram = histogram.reshape(kanji_count, bins)
+
+    vectors = np.hstack([normalize(occupancy), DIRECTION_WEIGHT * normalize(histogram)])
+    return normalize(vectors).astype(np.float32)
+
+
+def build_index(release_file: str = releaseFile, shapes_file: str = SHAPES_FILE, elements_file: str = ELEMENTS_FILE) -> int:
+    corpus = load_strokes(release_file)
+    np.save(shapes_file, shape_vectors(corpus))
+    with open(elements_file, "w") as f:
+        json.dump(corpus.elements, f, ensure_ascii=False)
+    return len(corpus.elements)
+
+
+class SimilarityIndex:
+    """the shape matrix, memory mapped, and the element of each of its rows"""
+    def __init__(self, shapes_file: str = SHAPES_FILE, elements_file: str = ELEMENTS_FILE):
+        self.vectors = np.load(shapes_file, mmap_mode="r")
+        with open(elements_file) as f:
+            self.elements: list[str] = json.load(f)
+        self.rows = {element: i for i, element in enumerate(self.elements)}
+
+    def __contains__(self, element: str) -> bool:
+        return element in self.rows
+
+    def similar(self, element: str, top: int = TOP) -> list[tuple[str, float]]:
+        """the top most similar kanji of element with their similarity (1 = identical), the element itself excluded"""
+        row = self.rows[element]
+        scores = self.vectors @ self.vectors[row]
+        scores[row] = -np.inf
+        top = min(top, len(scores) - 1)
+        best = np.argpartition(-scores, top)[:top]
+        best = best[np.argsort(-scores[best])]
+        return [(self.elements[i], float(scores[i])) for i in best]
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("kanji", type=str, nargs="*", help="prints the kanji similar to these, instead of building the index")
+    parser.add_argument("--top", type=int, default=TOP)
+    parser.add_argument("--release-file", type=str, default=releaseFile)
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    if not args.kanji:
+        started = time.time()
+        count = build_index(args.release_file)
+        print(f"{count} kanji indexed in {time.time() - started:.2f}s")
+        return
+
+    index = SimilarityIndex()
+    for kanji in args.kanji:
+        if kanji not in index:
+            print(f"{kanji}: not in {SHAPES_FILE}")
+            continue
+        print(kanji, " ".join(f"{element} ({score:.3f})" for element, score in index.similar(kanji, args.top)))
+
+
+if __name__ == "__main__":
+    main()
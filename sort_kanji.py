@@ -3,6 +3,8 @@ outputs frequency map from a sort file. Can optionally sum up all component usag
 i.e. a component A is used in B and C, then the frequency of A is freq(A) + freq(B) + freq(C).
 
 - can currently output freq map or occurrence map
+- can read the frequencies from a corpus of kanjivg.db (see freq_db.py) instead of a sort file,
+  and write the result as a new corpus
 """
 
 import re
@@ -10,7 +12,6 @@ import json
 import sqlite3
 import argparse
 from typing import TypedDict, Any, Iterable
-from kanji_data import get_kanjivg_data
 
 rx_FREQ_USAGE = re.compile(r"\d+ \((\d+)\)")
 
@@ -70,8 +71,10 @@ def sort_kanji(kanjis: Iterable[str], freq_map: FreqMap):
 
 def get_args():
     parser = argparse.ArgumentParser()
-    parser.add_argument("sort_file", type=str)
+    parser.add_argument("sort_file", type=str, nargs="?", default=None)
+    parser.add_argument("--corpus", type=str, default=None, help="read the frequencies from this corpus of kanjivg.db instead of sort_file")
     parser.add_argument("--out-file", type=str, default=None)
+    parser.add_argument("--out-corpus", type=str, default=None, help="store the output frequencies as this corpus of kanjivg.db")
     parser.add_argument("--sum-components", action="store_true")
     parser.add_argument("--to-freq-map", action="store_true")
     return parser.parse_args()
@@ -101,53 +104,110 @@ def to_occurrence_map(freq_map: FreqMap):
     return occurrence_map
 
 
-def _create_component_usage_map(
-        key: str, cur, usage_map: dict[str, int], component_occurrence_map: dict[str, int], visited: set[str]
-):
-    # assumption: if in component_occurrence_map, then usage is fully filled
-    if key in component_occurrence_map:
-        return
-
-    data = get_kanjivg_data(cur, key)
-    if data is None:
-        return
+def load_combinations_graph(cur) -> dict[str, list[str]]:
+    # the whole component -> combinations graph, in a single join over component_edge (see gen_db.py)
+    if cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'component_edge'").fetchone() is None:
+        # kanjivg.db built before component_edge, decoded from the combinations column instead
+        return {element: json.loads(combinations) for element, combinations in cur.execute("SELECT element, combinations FROM kanjivg")}
+    SQL = """
+        SELECT child.element, parent.element FROM component_edge
+        JOIN kanjivg AS child ON child.id = component_edge.child_id
+        JOIN kanjivg AS parent ON parent.id = component_edge.parent_id
+        WHERE component_edge.parent_id != component_edge.child_id
+        ORDER BY component_edge.child_id, component_edge.parent_id
+    """
+    graph: dict[str, list[str]] = {element: [] for element, in cur.execute("SELECT element FROM kanjivg")}
+    for element, combination in cur.execute(SQL):
+        combinations = graph[element]
+        if not combinations or combinations[-1] != combination:
+            combinations.append(combination)
+    return graph
 
-    if key in visited:
-        return # prevents infinite loops, since sometimes components causes infinite loops
-    visited.add(key)
 
-    usage = usage_map.get(key, 0)
-    for combination in data.combinations:
-        #component_occurrence_map[key] += usage_map.get(combination, 0)
-        _create_component_usage_map(combination, cur, usage_map, component_occurrence_map, visited)
-        if combination in component_occurrence_map:
-            usage += component_occurrence_map[combination]
-        else:
-            print(f"combination not found, using default usage: {combination}")
-            usage += usage_map.get(key, 0)
-    component_occurrence_map[key] = usage
+def strongly_connected_components(graph: dict[str, list[str]], roots: Iterable[str]) -> list[list[str]]:
+    """
+    iterative version of Tarjan's algorithm, over the nodes of graph reachable from roots.
+    Components are returned in reverse topological order,
+    i.e. every component comes after all the components it has edges to.
+    """
+    index: dict[str, int] = {}
+    lowlink: dict[str, int] = {}
+    stack: list[str] = []
+    on_stack: set[str] = set()
+    result = []
+
+    for root in roots:
+        if root in index or root not in graph:
+            continue
+        # (node, iterator over its remaining edges)
+        work = [(root, iter(graph[root]))]
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, edges = work[-1]
+            for child in edges:
+                if child not in graph:
+                    continue
+                if child not in index:
+                    index[child] = lowlink[child] = len(index)
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(graph[child])))
+                    break
+                if child in on_stack:
+                    lowlink[node] = min(lowlink[node], index[child])
+            else:
+                # all edges of node have been visited
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.remove(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    result.append(component)
+    return result
 
 
 def create_component_usage_map(usage_map):
     """
     - creates a map that gets sums all frequencies from all combinations
 
-    recursive / dynamic programming
-    - traverses to leaves of the tree first
-    - only stores when all combinations have values
-    - ASSUMPTION: no loops! If there are loops, this may run forever / crash from too much recursion
+    dynamic programming over the component -> combinations graph, loaded in memory
+    - components that form a cycle are collapsed into a single node that sums the usage of all its members,
+      and every member gets that sum
+    - nodes are then summed in reverse topological order, so every combination is complete before it is used
+    - combinations that are not in kanjivg contribute their own usage only
     """
 
     with sqlite3.connect("kanjivg.db") as conn:
-        cur = conn.cursor()
-
-        visited = set()
-        component_occurrence_map = {}
-        for key in usage_map:
-            # assumption: if in component_occurrence_map, then usage is fully filled
-            _create_component_usage_map(key, cur, usage_map, component_occurrence_map, visited)
-        return component_occurrence_map
-    return {} # shouldn't ever be reached
+        graph = load_combinations_graph(conn.cursor())
+
+    component_occurrence_map = {}
+    for component in strongly_connected_components(graph, usage_map):
+        members = set(component)
+        usage = sum(usage_map.get(member, 0) for member in component)
+        # each combination outside of the component is only counted once,
+        # even if several members of the component have it
+        combinations = {}
+        for member in component:
+            for combination in graph[member]:
+                if combination not in members:
+                    combinations[combination] = None
+        for combination in combinations:
+            if combination in component_occurrence_map:
+                usage += component_occurrence_map[combination]
+            else:
+                usage += usage_map.get(combination, 0)
+        for member in component:
+            component_occurrence_map[member] = usage
+    return component_occurrence_map
 
 
 def to_component_freq_map(freq_map: FreqMap) -> FreqMap:
@@ -170,12 +230,24 @@ def main():
     # with open("kanji_freq/kanji_meta_bank_1.json") as f:
     # with open("kanji_freq/aozora/kanji_meta_bank_1.json") as f:
     args = get_args()
-    with open(args.sort_file) as f:
-        freq_list = json.load(f)
-    freq_map = to_freq_map(freq_list)
+    if args.corpus is not None:
+        import freq_db
+        with sqlite3.connect("kanjivg.db") as conn:
+            freq_map = freq_db.load_freq_map(conn, args.corpus)
+    elif args.sort_file is not None:
+        with open(args.sort_file) as f:
+            freq_list = json.load(f)
+        freq_map = to_freq_map(freq_list)
+    else:
+        raise SystemExit("either sort_file or --corpus is required")
     if args.sum_components:
         freq_map = to_component_freq_map(freq_map)
 
+    if args.out_corpus is not None:
+        import freq_db
+        with sqlite3.connect("kanjivg.db") as conn:
+            freq_db.ingest_freq_map(conn, args.out_corpus, freq_map)
+
     if args.out_file is not None:
         with open(args.out_file, "w") as f:
             if args.to_freq_map:
@@ -0,0 +1,224 @@
+"""
+geometry of the strokes of kanjivg.xml, computed with numpy:
+
+- every stroke path is parsed once into cubic Bézier segments (lines are converted to cubics),
+  stored as a single (segments, 4, 2) array for the whole corpus
+- all segments are sampled at once, and per stroke values are reduced from the samples:
+  length, bounding box, start and end points, and direction (angle from start to end point, in degrees)
+
+the per kanji totals are stored in kanjivg.db:
+
+    stroke_geometry(element, stroke_count, length, min_x, min_y, max_x, max_y)
+
+examples:
+
+python3 stroke_geometry.py
+python3 stroke_geometry.py --samples 32
+"""
+
+import time
+import sqlite3
+import argparse
+from dataclasses import dataclass
+
+import numpy as np
+
+from kvg import absolutePath, releaseFile
+from utils import iterXmlFile
+
+# points sampled per Bézier segment
+SAMPLES = 16
+
+
+@dataclass
+class CorpusStrokes:
+    """
+    the strokes of every kanji of the release file, in document order.
+    kanji i has the strokes stroke_offsets[i]:stroke_offsets[i + 1],
+    stroke j has the segments segment_offsets[j]:segment_offsets[j + 1]
+    """
+    codes: list[str]
+    elements: list[str]
+    stroke_types: list[str | None]
+    stroke_offsets: np.ndarray # (kanji + 1,)
+    segment_offsets: np.ndarray # (strokes + 1,)
+    segments: np.ndarray # (segments, 4, 2) control points
+
+    @property
+    def stroke_counts(self) -> np.ndarray:
+        return np.diff(self.stroke_offsets)
+
+
+@dataclass
+class StrokeGeometry:
+    length: np.ndarray # (strokes,)
+    bbox: np.ndarray # (strokes, 4): min_x, min_y, max_x, max_y
+    start: np.ndarray # (strokes, 2)
+    end: np.ndarray # (strokes, 2)
+    direction: np.ndarray # (strokes,) degrees, 0 = right, 90 = down
+
+
+def path_segments(d: str) -> list[tuple[float, ...]]:
+    """
+    cubic segments (x0, y0, x1, y1, x2, y2, x3, y3) of path data d.
+    Smooth curves are expanded with their reflected control point, lines with control points at a third.
+    """
+    segments = []
+    x = y = 0.0
+    # second control point of the previous curve, for S
+    control = None
+    for command, params in absolutePath(d):
+        if command == "M":
+            x, y = params
+            control = None
+        elif command == "C":
+            segments.append((x, y, *params))
+            control = (params[2], params[3])
+            x, y = params[4], params[5]
+        elif command == "S":
+            cx, cy = (2 * x - control[0], 2 * y - control[1]) if control is not None else (x, y)
+            segments.append((x, y, cx, cy, *params))
+            control = (params[0], params[1])
+            x, y = params[2], params[3]
+        elif command in ("L", "H", "V", "Z"):
+            if command == "L":
+                nx, ny = params
+            elif command == "H":
+                nx, ny = params[0], y
+            elif command == "V":
+                nx, ny = x, params[0]
+            else:
+                # absolutePath already moved back to the start of the subpath
+                continue
+            segments.append((x, y, x + (nx - x) / 3, y + (ny - y) / 3, x + 2 * (nx - x) / 3, y + 2 * (ny - y) / 3, nx, ny))
+            control = None
+            x, y = nx, ny
+        else:
+            raise ValueError(f"unsupported path command {command} in {d}")
+    return segments
+
+
+def load_strokes(path: str = releaseFile) -> CorpusStrokes:
+    codes: list[str] = []
+    elements: list[str] = []
+    stroke_types: list[str | None] = []
+    stroke_offsets = [0]
+    segment_offsets = [0]
+    segments: list[tuple[float, ...]] = []
+    for kanji in iterXmlFile(path):
+        element = kanji.strokes.element or chr(int(kanji.code, 16))
+        codes.append(kanji.code)
+        elements.append(element)
+        for stroke in kanji.getStrokes():
+            stroke_types.append(stroke.stype)
+            segments.extend(path_segments(stroke.svg or ""))
+            segment_offsets.append(len(segments))
+        stroke_offsets.append(len(stroke_types))
+    return CorpusStrokes(
+        codes,
+        elements,
+        stroke_types,
+        np.array(stroke_offsets, dtype=np.int64),
+        np.array(segment_offsets, dtype=np.int64),
+        np.array(segments, dtype=np.float64).reshape(-1, 4, 2),
+    )
+
+
+def bezier_basis(samples: int) -> np.ndarray:
+    # (samples, 4) Bernstein polynomials of a cubic Bézier, at evenly spaced t
+    t = np.linspace(0.0, 1.0, samples)
+    u = 1.0 - t
+    return np.stack([u ** 3, 3 * u ** 2 * t, 3 * u * t ** 2, t ** 3], axis=1)
+
+
+def sample_segments(segments: np.ndarray, samples: int = SAMPLES) -> np.ndarray:
+    # (segments, samples, 2) points of every segment
+    return np.matmul(bezier_basis(samples), segments)
+
+
+def compute_geometry(corpus: CorpusStrokes, samples: int = SAMPLES) -> StrokeGeometry:
+    """
+    per stroke geometry of the whole corpus, reduced from the sampled segments.
+    Strokes without segments (no path data) get a zero length and a NaN bounding box
+    """
+    stroke_count = len(corpus.stroke_types)
+    points = sample_segments(corpus.segments, samples)
+    steps = np.diff(points, axis=1)
+    segment_lengths = np.sqrt((steps * steps).sum(axis=2)).sum(axis=1)
+    # stroke index of every segment
+    segment_strokes = np.repeat(np.arange(stroke_count), np.diff(corpus.segment_offsets))
+
+    length = np.bincount(segment_strokes, weights=segment_lengths, minlength=stroke_count)
+
+    bbox = np.full((stroke_count, 4), np.nan)
+    start = np.full((stroke_count, 2), np.nan)
+    end = np.full((stroke_count, 2), np.nan)
+    has_segments = np.diff(corpus.segment_offsets) > 0
+    if len(corpus.segments):
+        firsts = corpus.segment_offsets[:-1][has_segments]
+        lasts = corpus.segment_offsets[1:][has_segments] - 1
+        bbox[has_segments, :2] = np.minimum.reduceat(points.min(axis=1), firsts, axis=0)
+        bbox[has_segments, 2:] = np.maximum.reduceat(points.max(axis=1), firsts, axis=0)
+        start[has_segments] = corpus.segments[firsts, 0]
+        end[has_segments] = corpus.segments[lasts, 3]
+    delta = end - start
+    direction = np.degrees(np.arctan2(delta[:, 1], delta[:, 0]))
+    return StrokeGeometry(length, bbox, start, end, direction)
+
+
+def kanji_totals(corpus: CorpusStrokes, geometry: StrokeGeometry) -> list[tuple[str, int, float, float, float, float, float]]:
+    # (element, stroke_count, length, min_x, min_y, max_x, max_y) of every kanji with strokes
+    counts = corpus.stroke_counts
+    has_strokes = counts > 0
+    firsts = corpus.stroke_offsets[:-1][has_strokes]
+    lengths = np.add.reduceat(geometry.length, firsts)
+    mins = np.fmin.reduceat(geometry.bbox[:, :2], firsts, axis=0)
+    maxs = np.fmax.reduceat(geometry.bbox[:, 2:], firsts, axis=0)
+    elements = [element for element, keep in zip(corpus.elements, has_strokes) if keep]
+    return [
+        (element, int(count), float(length), float(min_x), float(min_y), float(max_x), float(max_y))
+        for element, count, length, (min_x, min_y), (max_x, max_y) in zip(elements, counts[has_strokes], lengths, mins, maxs)
+    ]
+
+
+def write_table(conn: sqlite3.Connection, rows: list[tuple[str, int, float, float, float, float, float]]):
+    CREATE_TABLE_SQL = """
+        DROP TABLE IF EXISTS stroke_geometry;
+        CREATE TABLE stroke_geometry (
+            element text PRIMARY KEY NOT NULL,
+            stroke_count integer NOT NULL,
+            length real NOT NULL,
+            min_x real,
+            min_y real,
+            max_x real,
+            max_y real
+        ) WITHOUT ROWID;
+    """
+    conn.executescript(CREATE_TABLE_SQL)
+    INSERT_SQL = "INSERT OR REPLACE INTO stroke_geometry (element, stroke_count, length, min_x, min_y, max_x, max_y) VALUES (?,?,?,?,?,?,?)"
+    conn.executemany(INSERT_SQL, rows)
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", type=int, default=SAMPLES, help="points sampled per Bézier segment")
+    parser.add_argument("--release-file", type=str, default=releaseFile)
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    started = time.time()
+    corpus = load_strokes(args.release_file)
+    parsed = time.time()
+    geometry = compute_geometry(corpus, args.samples)
+    rows = kanji_totals(corpus, geometry)
+    computed = time.time()
+    with sqlite3.connect("kanjivg.db") as conn:
+        write_table(conn, rows)
+    print(f"{len(corpus.stroke_types)} strokes, {len(corpus.segments)} segments of {len(rows)} kanji")
+    print(f"parsed in {parsed - started:.2f}s, geometry computed in {computed - parsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+compressed storage of the svg files in kanjivg.db:
+
+    kanjivg_svg(element, data): the svg file of the element, zlib compressed with a preset dictionary
+    svg_dictionary(data): the preset dictionary, trained on a sample of the svg files by gen_db.py
+
+the svg files all share the same license header, DOCTYPE and most of their tags and attributes,
+which a preset dictionary lets zlib reference from the first byte of every file,
+instead of each file having to repeat them once before they compress.
+
+svgs are only read and decompressed when asked for, with SvgStore.get
+"""
+
+import re
+import zlib
+import sqlite3
+from collections import Counter
+from typing import Iterable
+
+# zlib only looks this far back, anything before the last 32 KB of a dictionary is unused
+MAX_DICTIONARY_SIZE = 32768
+COMPRESSION_LEVEL = 9
+
+rx_TOKEN = re.compile(r"[^\d\n]{4,}")
+
+
+def init_tables(conn: sqlite3.Connection):
+    CREATE_TABLES_SQL = """
+        DROP TABLE IF EXISTS kanjivg_svg;
+        DROP TABLE IF EXISTS svg_dictionary;
+        CREATE TABLE kanjivg_svg (
+            element text PRIMARY KEY NOT NULL,
+            data blob NOT NULL
+        );
+        CREATE TABLE svg_dictionary (
+            data blob NOT NULL
+        );
+    """
+    conn.executescript(CREATE_TABLES_SQL)
+
+
+def train_dictionary(texts: Iterable[str]) -> bytes:
+    """
+    preset dictionary of the strings shared by the sample texts:
+    - the lines found in at least a tenth of them (license header, DOCTYPE, closing tags...)
+    - the runs of non digits found in at least a twentieth of them (tags, attributes, stroke types...)
+    zlib encodes closer matches with fewer bits, so the most common strings are put last
+    """
+    texts = list(texts)
+    lines: Counter[str] = Counter()
+    tokens: Counter[str] = Counter()
+    for text in texts:
+        lines.update(set(text.splitlines(keepends=True)))
+        tokens.update(set(rx_TOKEN.findall(text)))
+    common_tokens = sorted((token for token, count in tokens.items() if count >= len(texts) // 20), key=lambda token: tokens[token] * len(token))
+    common_lines = sorted((line for line, count in lines.items() if count >= len(texts) // 10), key=lambda line: lines[line])
+    return "".join(common_tokens + common_lines).encode("utf-8")[-MAX_DICTIONARY_SIZE:]
+
+
+def compress(text: str, zdict: bytes) -> bytes:
+    compressor = zlib.compressobj(COMPRESSION_LEVEL, zdict=zdict)
+    return compressor.compress(text.encode("utf-8")) + compressor.flush()
+
+
+def decompress(data: bytes, zdict: bytes) -> str:
+    decompressor = zlib.decompressobj(zdict=zdict)
+    return (decompressor.decompress(data) + decompressor.flush()).decode("utf-8")
+
+
+def write_dictionary(conn: sqlite3.Connection, zdict: bytes):
+    conn.execute("DELETE FROM svg_dictionary")
+    conn.execute("INSERT INTO svg_dictionary (data) VALUES (?)", (zdict,))
+
+
+def load_dictionary(conn: sqlite3.Connection) -> bytes | None:
+    SQL = "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'svg_dictionary'"
+    if conn.execute(SQL).fetchone() is None:
+        return None
+    row = conn.execute("SELECT data FROM svg_dictionary").fetchone()
+    return None if row is None else row[0]
+
+
+class SvgStore:
+    """
+    reads the svg of an element from kanjivg_svg, decompressed on demand.
+    The dictionary is loaded on the first get
+    """
+    SQL = "SELECT data FROM kanjivg_svg WHERE element = ?"
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self.zdict: bytes | None = None
+
+    def get(self, element: str) -> str | None:
+        row = self.conn.execute(self.SQL, (element,)).fetchone()
+        if row is None:
+            return None
+        if self.zdict is None:
+            self.zdict = load_dictionary(self.conn) or b""
+        return decompress(row[0], self.zdict)
@@ -0,0 +1,301 @@
+"""
+anki_connect.py, search.py's Anki lookups and anki_mirror.py against a local stand-in AnkiConnect server.
+
+the stand-in is a threaded http.server answering findCards, cardsInfo, findNotes, notesInfo and multi
+from an in-memory collection, with one card per note. It records every HTTP request and connection,
+and can drop a kept-alive connection, as Anki does when it restarts.
+
+python3 -m unittest discover tests
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+import contextlib
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+import anki_mirror
+from anki_connect import AnkiConnect
+from search import MAX_ANKI_RESULTS, search_anki_words, search_mirror_words, print_kanji
+
+# Word field of every note, note ids are 1, 2, ...
+WORDS = [
+    "木", "木曜日", "大木", "木材", "並木", "木造", "木陰", "林", "林業", "森林",
+    "森", "本", "日本", "本当", "休む", "休日", "明日", "明るい", "月曜日", "未来",
+]
+
+
+class FakeCollection:
+    def __init__(self, words: list[str]):
+        # note id -> (word, mod)
+        self.notes = {note_id: (word, int(time.time()) - 10 * 86400) for note_id, word in enumerate(words, start=1)}
+
+    @staticmethod
+    def card_id(note_id: int) -> int:
+        # card ids are not note ids, but sort the same way
+        return 1000 + note_id
+
+    def edit(self, note_id: int, word: str):
+        self.notes[note_id] = (word, int(time.time()))
+
+    def find_notes(self, query: str) -> list[int]:
+        field, _, rest = query.partition(":")
+        pattern, _, edited = rest.partition(" edited:")
+        assert field == "Word", query
+        since = time.time() - int(edited) * 86400 if edited else 0
+        if pattern == "_*":
+            matches = lambda word: word != ""
+        else:
+            assert pattern.startswith("*") and pattern.endswith("*"), query
+            matches = lambda word: pattern[1:-1] in word
+        return [note_id for note_id, (word, mod) in self.notes.items() if matches(word) and mod >= since]
+
+    def invoke(self, action: str, params: dict):
+        if action == "findCards":
+            return [self.card_id(note_id) for note_id in self.find_notes(params["query"])]
+        if action == "findNotes":
+            return self.find_notes(params["query"])
+        if action == "cardsInfo":
+            infos = []
+            for card_id in params["cards"]:
+                word, mod = self.notes[card_id - 1000]
+                infos.append({"cardId": card_id, "note": card_id - 1000, "fields": {"Word": {"value": word, "order": 0}}})
+            return infos
+        if action == "notesInfo":
+            infos = []
+            for note_id in params["notes"]:
+                if note_id not in self.notes:
+                    infos.append({})
+                    continue
+                word, mod = self.notes[note_id]
+                infos.append({"noteId": note_id, "mod": mod, "fields": {"Word": {"value": word, "order": 0}}})
+            return infos
+        raise ValueError(f"unsupported action {action}")
+
+
+class FakeAnkiConnect(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, collection: FakeCollection):
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.collection = collection
+        self.lock = threading.Lock()
+        # (client port, {action: count}) of every HTTP request
+        self.requests: list[tuple[int, dict[str, int]]] = []
+        # when set, the connection is dropped after the next response, without a Connection: close header
+        self.drop_next = False
+        # when set, every response has a Connection: close header
+        self.close_always = False
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def connections(self) -> int:
+        return len(set(port for port, _ in self.requests))
+
+    def action_counts(self) -> dict[str, int]:
+        counts = {}
+        for _, actions in self.requests:
+            for action, count in actions.items():
+                counts[action] = counts.get(action, 0) + count
+        return counts
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        collection = self.server.collection
+        actions = {}
+        if body["action"] == "multi":
+            results = []
+            for action in body["params"]["actions"]:
+                actions[action["action"]] = actions.get(action["action"], 0) + 1
+                results.append({"result": collection.invoke(action["action"], action["params"]), "error": None})
+            result = results
+        else:
+            actions[body["action"]] = 1
+            result = collection.invoke(body["action"], body["params"])
+        with self.server.lock:
+            self.server.requests.append((self.client_address[1], actions))
+            drop, self.server.drop_next = self.server.drop_next, False
+
+        data = json.dumps({"result": result, "error": None}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if self.server.close_always:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(data)
+        if drop:
+            self.close_connection = True
+
+
+def old_invoke(url, action, **params):
+    requestJson = json.dumps({'action': action, 'params': params, 'version': 6}).encode('utf-8')
+    response = json.load(urllib.request.urlopen(urllib.request.Request(url, requestJson)))
+    if response['error'] is not None:
+        raise Exception(response['error'])
+    return response['result']
+
+
+def old_print_kanji(url, kanji, freq_map, search_anki: bool):
+    # print_kanji of search.py before the AnkiConnect client, one findCards and one cardsInfo request per kanji
+    sort_value = freq_map.get(kanji, None)
+    display_value = None
+    if sort_value is not None:
+        display_value = sort_value.get("displayValue")
+    print_values = [kanji, display_value]
+
+    if search_anki:
+        print_values.append("-")
+        words = []
+        card_ids = old_invoke(url, "findCards", query=f"Word:*{kanji}*")
+        some_card_ids = sorted(card_ids)[:MAX_ANKI_RESULTS]
+        cards_info = old_invoke(url, "cardsInfo", cards=some_card_ids)
+        if cards_info:
+            for info in cards_info:
+                words.append(info["fields"]["Word"]["value"])
+            remaining = len(card_ids) - MAX_ANKI_RESULTS
+            print_values.append("　".join(words))
+            if remaining > 0:
+                print_values.append(f"+{remaining}")
+        else:
+            print_values.append("Cannot find kanji in collection")
+    print(*print_values)
+
+
+class AnkiServerTest(unittest.TestCase):
+    def setUp(self):
+        self.collection = FakeCollection(WORDS)
+        self.server = FakeAnkiConnect(self.collection)
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.01,), daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+class AnkiConnectTest(AnkiServerTest):
+    def test_multi_batches(self):
+        queries = [f"Word:*{word[0]}*" for word in WORDS] * 6
+        with AnkiConnect(self.server.url, max_workers=3) as client:
+            results = client.multi([("findCards", {"query": query}) for query in queries])
+        self.assertEqual(results, [self.collection.invoke("findCards", {"query": query}) for query in queries])
+        # 120 actions, in batches of 50
+        self.assertEqual(sorted(actions["findCards"] for _, actions in self.server.requests), [20, 50, 50])
+        self.assertLessEqual(self.server.connections(), 3)
+
+    def test_keep_alive(self):
+        with AnkiConnect(self.server.url, max_workers=1) as client:
+            for word in WORDS:
+                client.invoke("findCards", query=f"Word:*{word}*")
+            client.multi([("findNotes", {"query": "Word:_*"})] * 120)
+        self.assertEqual(len(self.server.requests), len(WORDS) + 3)
+        self.assertEqual(self.server.connections(), 1)
+
+    def test_reconnect_after_dropped_connection(self):
+        with AnkiConnect(self.server.url, max_workers=1) as client:
+            client.invoke("findCards", query="Word:*木*")
+            self.server.drop_next = True
+            client.invoke("findCards", query="Word:*木*")
+            # the kept-alive connection was closed by the server, the request is sent again on a new one
+            self.assertEqual(client.invoke("findCards", query="Word:*林*"), [1008, 1009, 1010])
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.server.connections(), 2)
+
+    def test_connection_close(self):
+        self.server.close_always = True
+        with AnkiConnect(self.server.url, max_workers=1) as client:
+            for _ in range(3):
+                self.assertEqual(client.invoke("findNotes", query="Word:*森*"), [10, 11])
+            self.assertEqual(client.connections, [])
+        self.assertEqual(self.server.connections(), 3)
+
+
+class SearchAnkiWordsTest(AnkiServerTest):
+    # kanji without cards, with fewer and with more than MAX_ANKI_RESULTS cards, and a duplicate
+    KANJIS = ["木", "林", "森", "本", "休", "明", "月", "末", "木"]
+    FREQ_MAP = {"木": {"displayValue": "1"}, "林": {"displayValue": "2"}, "本": {"displayValue": "3"}}
+
+    def test_output_matches_old_format(self):
+        old = io.StringIO()
+        with contextlib.redirect_stdout(old):
+            for kanji in self.KANJIS:
+                old_print_kanji(self.server.url, kanji, self.FREQ_MAP, True)
+        old_requests = len(self.server.requests)
+
+        new = io.StringIO()
+        with AnkiConnect(self.server.url) as client, contextlib.redirect_stdout(new):
+            anki_words = search_anki_words(client, self.KANJIS)
+            for kanji in self.KANJIS:
+                print_kanji(kanji, self.FREQ_MAP, anki_words)
+
+        self.assertEqual(new.getvalue(), old.getvalue())
+        self.assertIn("木 1 - 木　木曜日　大木　木材　並木 +2\n", new.getvalue())
+        self.assertIn("末 None - Cannot find kanji in collection\n", new.getvalue())
+        self.assertEqual(old_requests, 2 * len(self.KANJIS))
+        # one multi request of findCards, one of cardsInfo
+        self.assertEqual([actions for _, actions in self.server.requests[old_requests:]], [{"findCards": 8}, {"cardsInfo": 8}])
+
+
+class MirrorSyncTest(AnkiServerTest):
+    KANJIS = ["木", "林", "森", "本", "休", "明", "日", "末", "曜日"]
+
+    def setUp(self):
+        super().setUp()
+        self.dir = tempfile.mkdtemp()
+        self.mirror = anki_mirror.open_mirror(os.path.join(self.dir, "anki_mirror.db"))
+        self.client = AnkiConnect(self.server.url)
+
+    def tearDown(self):
+        self.client.shutdown()
+        self.mirror.close()
+        shutil.rmtree(self.dir)
+        super().tearDown()
+
+    def assert_mirror_matches_anki(self):
+        self.assertEqual(search_mirror_words(self.mirror, self.KANJIS), search_anki_words(self.client, self.KANJIS))
+
+    def test_full_sync(self):
+        self.assertEqual(anki_mirror.sync(self.mirror, self.client), (len(WORDS), 0))
+        self.assert_mirror_matches_anki()
+
+    def test_incremental_sync(self):
+        anki_mirror.sync(self.mirror, self.client)
+        self.collection.edit(3, "大森")
+        self.collection.edit(len(WORDS) + 1, "末日")
+        del self.collection.notes[12]
+        self.server.requests = []
+        # only the edited and the new note are fetched
+        self.assertEqual(anki_mirror.sync(self.mirror, self.client), (2, 1))
+        self.assertEqual(self.server.action_counts(), {"findNotes": 2, "notesInfo": 1})
+        self.assert_mirror_matches_anki()
+
+    def test_full_resync(self):
+        anki_mirror.sync(self.mirror, self.client)
+        self.collection.notes = {1: ("木", 0), 2: ("森", 0)}
+        self.assertEqual(anki_mirror.sync(self.mirror, self.client, full=True), (2, len(WORDS) - 2))
+        self.assert_mirror_matches_anki()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+"""
+corpora stored by freq_db.py and update_db.py --per-corpus, as search.py --corpus reads them.
+
+the corpora are stored in the kanjivg.db of a small corpus of kanji/ files, in a temporary directory:
+- occ: display values with occurrences, ranked by occurrences with --occurrence-based
+- rank: ranks only
+
+python3 -m unittest discover tests
+"""
+
+import os
+import sys
+import json
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import subprocess
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+import freq_db
+
+# 休 体 林 森 本 木 人 未 末
+FIXTURE = ["04f11", "04f53", "06797", "068ee", "0672c", "06728", "04eba", "0672a", "0672b"]
+
+META_BANKS = {
+    "occ": [
+        ["木", "freq", {"value": 1, "displayValue": "1 (500)"}],
+        ["本", "freq", {"value": 2, "displayValue": "2 (300)"}],
+        ["休", "freq", {"value": 3, "displayValue": "3 (800)"}],
+        ["林", "freq", {"value": 4, "displayValue": "4 (100)"}],
+    ],
+    "rank": [["森", "freq", 1], ["林", "freq", 2], ["休", "freq", 3]],
+}
+
+
+class CorpusTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(cls.dir, "kanji"))
+        for code in FIXTURE:
+            shutil.copy(os.path.join(REPO, "kanji", code + ".svg"), os.path.join(cls.dir, "kanji"))
+        shutil.copy(os.path.join(REPO, "custom.json"), cls.dir)
+        cls.run_script("kvg.py", "release")
+        cls.run_script("gen_db.py")
+        for corpus, bank in META_BANKS.items():
+            os.mkdir(os.path.join(cls.dir, corpus))
+            with open(os.path.join(cls.dir, corpus, "kanji_meta_bank_1.json"), "w") as f:
+                json.dump(bank, f)
+            cls.run_script("freq_db.py", corpus)
+        cls.run_script("update_db.py", "--all-corpora", "--occurrence-based", "--update-frequencies", "--update-combinations")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dir)
+
+    @classmethod
+    def run_script(cls, script: str, *args: str) -> str:
+        return subprocess.run([sys.executable, os.path.join(REPO, script), *args], cwd=cls.dir, check=True, capture_output=True, text=True).stdout
+
+    def search(self, *args: str) -> list[str]:
+        return self.run_script("search.py", "-a", *args).splitlines()
+
+    def test_rank_picked_by_corpus(self):
+        self.assertIn("木 rank: 2, occurrences: 500, cumulative percent: 76.47058823529412", self.search("-v", "--corpus", "occ", "木"))
+        # rank only corpus, 木 is not in it and comes after the 3 kanji that are, in kanjivg order
+        self.assertIn("木 rank: 6, occurrences: None, cumulative percent: None", self.search("-v", "--corpus", "rank", "木"))
+
+    def test_sorted_by_corpus_ranks(self):
+        # 休 has the most occurrences, before 本 which ranks higher in the meta bank
+        self.assertEqual(self.search("--corpus", "occ", "--all-of", "木")[:3], ["休 3 (800)", "本 2 (300)", "林 4 (100)"])
+        self.assertEqual(self.search("--corpus", "rank", "--all-of", "木")[:3], ["森 1", "林 2", "休 3"])
+
+    def test_freq_map(self):
+        with sqlite3.connect(os.path.join(self.dir, "kanjivg.db")) as conn:
+            self.assertTrue(freq_db.has_corpus_ranks(conn, "occ"))
+            self.assertFalse(freq_db.has_corpus_ranks(conn, "missing"))
+            self.assertEqual(freq_db.CorpusFreqMap(conn, "occ").get("休"), {"value": 3, "displayValue": "3 (800)"})
+            self.assertEqual(freq_db.CorpusFreqMap(conn, "occ", ranked=True).get("休"), {"value": 1, "displayValue": "3 (800)", "occurrences": 800, "cumulativePercent": 47.05882352941176})
+            # every kanjivg row has a rank, elements of the corpus that are not kanjivg rows have none
+            self.assertIsNone(freq_db.CorpusFreqMap(conn, "occ", ranked=True).get("missing"))
+            self.assertEqual(freq_db.CorpusFreqMap(conn, "occ", ranked=True)["森"]["displayValue"], None)
+
+
+if __name__ == "__main__":
+    unittest.main()
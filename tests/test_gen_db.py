@@ -0,0 +1,104 @@
+"""
+gen_db.py --incremental must leave kanjivg.db as a full rebuild would.
+
+every test builds a small corpus of kanji/ files in a temporary directory, changes it,
+and compares the tables of an incremental build against a full rebuild of the changed corpus.
+svgs are compared decompressed, as each full build trains its own compression dictionary.
+
+python3 -m unittest discover tests
+"""
+
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import subprocess
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+import svg_store
+
+# 休 体 林 森 本 木 人 明 日 月 未 末 語
+FIXTURE = ["04f11", "04f53", "06797", "068ee", "0672c", "06728", "04eba", "0660e", "065e5", "06708", "0672a", "0672b", "08a9e"]
+
+TABLE_QUERIES = {
+    "kanjivg": "SELECT id, element, decomposition, components, combinations, rank, occurrences, cumulative_percent FROM kanjivg ORDER BY id",
+    "build_state": "SELECT element, hash, combinations_hash FROM build_state ORDER BY element",
+    "component_edge": "SELECT parent_id, child_id, ordinal, position FROM component_edge ORDER BY parent_id, ordinal",
+    "component_closure": "SELECT ancestor, descendant, depth FROM component_closure ORDER BY ancestor, descendant",
+    "component_bitsets": "SELECT component, bits FROM component_bitsets ORDER BY component",
+}
+
+
+def read_tables(path: str) -> dict[str, list]:
+    with sqlite3.connect(path) as conn:
+        tables = {table: conn.execute(sql).fetchall() for table, sql in TABLE_QUERIES.items()}
+        zdict = svg_store.load_dictionary(conn)
+        tables["kanjivg_svg"] = [(element, svg_store.decompress(data, zdict)) for element, data in conn.execute("SELECT element, data FROM kanjivg_svg ORDER BY element")]
+    return tables
+
+
+class IncrementalBuildTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.dir, "kanji"))
+        for code in FIXTURE:
+            shutil.copy(os.path.join(REPO, "kanji", code + ".svg"), os.path.join(self.dir, "kanji"))
+        shutil.copy(os.path.join(REPO, "custom.json"), self.dir)
+        self.run_script("kvg.py", "release")
+        self.run_script("gen_db.py")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def run_script(self, script: str, *args: str):
+        subprocess.run([sys.executable, os.path.join(REPO, script), *args], cwd=self.dir, check=True, capture_output=True)
+
+    def path(self, *names: str) -> str:
+        return os.path.join(self.dir, *names)
+
+    def edit_svg(self, code: str, old: str, new: str):
+        with open(self.path("kanji", code + ".svg"), encoding="utf-8") as f:
+            svg = f.read()
+        self.assertIn(old, svg)
+        with open(self.path("kanji", code + ".svg"), "w", encoding="utf-8") as f:
+            f.write(svg.replace(old, new, 1))
+
+    def assert_incremental_equals_full(self):
+        self.run_script("kvg.py", "release", "--incremental")
+        self.run_script("gen_db.py", "--incremental")
+        os.replace(self.path("kanjivg.db"), self.path("incremental.db"))
+        self.run_script("gen_db.py")
+        incremental = read_tables(self.path("incremental.db"))
+        full = read_tables(self.path("kanjivg.db"))
+        for table in full:
+            self.assertEqual(incremental[table], full[table], f"{table} differs from a full rebuild")
+
+    def test_unchanged(self):
+        self.assert_incremental_equals_full()
+
+    def test_new_component(self):
+        # 朩 is not in the corpus, it becomes a component without a kanji of its own,
+        # generated before the components of 語 that are not in the corpus either
+        self.edit_svg("04f11", 'kvg:element="木" kvg:position="right"', 'kvg:element="朩" kvg:position="right"')
+        self.assert_incremental_equals_full()
+
+    def test_changed_svg_and_removed_file(self):
+        self.edit_svg("0672a", "M30.13,30.77", "M31.13,30.77")
+        os.remove(self.path("kanji", "0672b.svg"))
+        self.assert_incremental_equals_full()
+
+    def test_added_file(self):
+        # 本 comes before other kanji of the release file, its row is not the last one of a full build
+        os.remove(self.path("kanji", "0672c.svg"))
+        self.run_script("kvg.py", "release")
+        self.run_script("gen_db.py")
+        shutil.copy(os.path.join(REPO, "kanji", "0672c.svg"), self.path("kanji"))
+        self.assert_incremental_equals_full()
+
+
+if __name__ == "__main__":
+    unittest.main()
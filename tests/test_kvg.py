@@ -0,0 +1,78 @@
+"""
+kvg.py release on a small corpus of kanji/ files, in a temporary directory.
+
+python3 -m unittest discover tests
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+# 休 未 末 木
+FIXTURE = ["04f11", "0672a", "0672b", "06728"]
+
+
+class ReleaseTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.dir, "kanji"))
+        for code in FIXTURE:
+            shutil.copy(os.path.join(REPO, "kanji", code + ".svg"), os.path.join(self.dir, "kanji"))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def kvg(self, *args: str) -> subprocess.CompletedProcess:
+        return subprocess.run([sys.executable, os.path.join(REPO, "kvg.py"), *args], cwd=self.dir, capture_output=True, text=True)
+
+    def path(self, *names: str) -> str:
+        return os.path.join(self.dir, *names)
+
+    def test_minify(self):
+        result = self.kvg("release", "--minify")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn("%d kanji checked in kanjivg.min.xml" % len(FIXTURE), result.stdout)
+
+    def test_truncated_minified_release(self):
+        self.assertEqual(self.kvg("release", "--minify").returncode, 0)
+        with open(self.path("kanjivg.min.xml"), encoding="utf-8") as f:
+            minified = f.read()
+        # without its last kanji, 末
+        with open(self.path("kanjivg.min.xml"), "w", encoding="utf-8") as f:
+            f.write(minified[:minified.rfind("<kanji ")] + "</kanjivg>\n")
+        result = subprocess.run([sys.executable, "-c", "import kvg; kvg.checkMinifiedRelease()"], cwd=self.dir, capture_output=True, text=True, env=dict(os.environ, PYTHONPATH=REPO))
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn("0672b: missing from the minified release", result.stderr)
+
+    def test_stray_files(self):
+        with open(self.path("kanji", ".DS_Store"), "wb") as f:
+            f.write(b"\0")
+        result = self.kvg("release")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        with open(self.path("kanjivg.xml"), encoding="utf-8") as f:
+            self.assertEqual(f.read().count("<kanji "), len(FIXTURE))
+
+    def test_release_options_only(self):
+        # the options of release are not passed to the other commands, --precision requires --minify
+        for args in [["split", "--jobs", "4", "kanji/0672a.svg"], ["merge", "--minify", "kanji/0672a.svg"], ["release", "--precision", "2"], ["release", "kanji/0672a.svg"]]:
+            result = self.kvg(*args)
+            self.assertEqual(result.returncode, 0, result.stderr)
+            self.assertTrue(result.stdout.startswith("Usage:"), args)
+            self.assertEqual(result.stderr, "")
+        self.assertEqual(sorted(os.listdir(self.dir)), ["kanji"])
+        self.assertEqual(sorted(os.listdir(self.path("kanji"))), sorted(code + ".svg" for code in FIXTURE))
+
+    def test_release_options(self):
+        result = self.kvg("release", "--jobs", "2", "--minify", "--precision", "2")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn("%d kanji checked in kanjivg.min.xml" % len(FIXTURE), result.stdout)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+"""
+searches answered by a search.py --serve process, through search.answer and a SearchContext kept between searches.
+
+every test builds kanjivg.db from a small corpus of kanji/ files in a temporary directory, the client's directory,
+while the server runs from another directory.
+
+python3 -m unittest discover tests
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from search import SearchContext, answer
+
+# 休 体 林 森 本 木 人
+FIXTURE = ["04f11", "04f53", "06797", "068ee", "0672c", "06728", "04eba"]
+
+
+class ServeTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.server_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.dir, "kanji"))
+        for code in FIXTURE:
+            shutil.copy(os.path.join(REPO, "kanji", code + ".svg"), os.path.join(self.dir, "kanji"))
+        shutil.copy(os.path.join(REPO, "custom.json"), self.dir)
+        self.build()
+        self.cwd = os.getcwd()
+        os.chdir(self.server_dir)
+        self.context = SearchContext()
+
+    def tearDown(self):
+        self.context.close()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir)
+        shutil.rmtree(self.server_dir)
+
+    def build(self):
+        # as db.sh does
+        for script, args in [("kvg.py", ["release"]), ("gen_db.py", [])]:
+            subprocess.run([sys.executable, os.path.join(REPO, script), *args], cwd=self.dir, check=True, capture_output=True)
+
+    def search(self, *argv: str) -> str:
+        output, status = answer(["-a", *argv], self.context, self.dir)
+        self.assertEqual(status, 0, output)
+        self.assertEqual(os.getcwd(), self.server_dir)
+        return output
+
+    def test_rebuilt_db_is_reopened(self):
+        self.assertIn("\n休 None\n", self.search("木"))
+        os.remove(os.path.join(self.dir, "kanji", "04f11.svg"))
+        os.remove(os.path.join(self.dir, "kanjivg.db"))
+        self.build()
+        self.assertNotIn("休", self.search("木"))
+
+    def test_paths_of_client_directory(self):
+        with open(os.path.join(self.dir, "freq.json"), "w") as f:
+            json.dump([["木", "freq", 3], ["休", "freq", 1], ["林", "freq", 2]], f)
+        self.assertEqual(self.search("--sort-file", "freq.json", "木"), "木 3\nNo components found.\n\n休 1\n本 None\n林 2\n森 None\n")
+        self.assertFalse(os.path.exists(os.path.join(self.server_dir, "kanjivg.db")))
+
+    def test_rebuilt_similarity_index_is_reloaded(self):
+        subprocess.run([sys.executable, os.path.join(REPO, "similarity.py")], cwd=self.dir, check=True, capture_output=True)
+        self.assertIn("休", self.search("--similar", "--top", "6", "木"))
+        os.remove(os.path.join(self.dir, "kanji", "04f11.svg"))
+        self.build()
+        subprocess.run([sys.executable, os.path.join(REPO, "similarity.py")], cwd=self.dir, check=True, capture_output=True)
+        self.assertNotIn("休", self.search("--similar", "--top", "6", "木"))
+
+    def test_missing_db(self):
+        os.remove(os.path.join(self.dir, "kanjivg.db"))
+        output, status = answer(["-a", "木"], self.context, self.dir)
+        self.assertEqual(status, 1)
+        self.assertIn("FileNotFoundError", output)
+        # no empty kanjivg.db is created in its place
+        self.assertFalse(os.path.exists(os.path.join(self.dir, "kanjivg.db")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+"""
+sort_kanji.py --sum-components on the kanjivg.db of a small corpus of kanji/ files, in a temporary directory,
+with and without the component_edge table of gen_db.py.
+
+python3 -m unittest discover tests
+"""
+
+import os
+import sys
+import json
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import subprocess
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from sort_kanji import load_combinations_graph
+
+# 休 体 林 森 本 木 人 明 日 月 未 末
+FIXTURE = ["04f11", "04f53", "06797", "068ee", "0672c", "06728", "04eba", "0660e", "065e5", "06708", "0672a", "0672b"]
+
+META_BANK = [
+    ["木", "freq", {"value": 1, "displayValue": "1 (500)"}],
+    ["日", "freq", {"value": 2, "displayValue": "2 (400)"}],
+    ["休", "freq", {"value": 3, "displayValue": "3 (300)"}],
+    ["林", "freq", {"value": 4, "displayValue": "4 (200)"}],
+    ["明", "freq", {"value": 5, "displayValue": "5 (100)"}],
+]
+
+
+class SumComponentsTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.dir, "kanji"))
+        for code in FIXTURE:
+            shutil.copy(os.path.join(REPO, "kanji", code + ".svg"), os.path.join(self.dir, "kanji"))
+        shutil.copy(os.path.join(REPO, "custom.json"), self.dir)
+        with open(os.path.join(self.dir, "meta_bank.json"), "w") as f:
+            json.dump(META_BANK, f)
+        for script, args in [("kvg.py", ["release"]), ("gen_db.py", [])]:
+            subprocess.run([sys.executable, os.path.join(REPO, script), *args], cwd=self.dir, check=True, capture_output=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def graph(self) -> dict[str, list[str]]:
+        with sqlite3.connect(os.path.join(self.dir, "kanjivg.db")) as conn:
+            return {element: sorted(combinations) for element, combinations in load_combinations_graph(conn.cursor()).items()}
+
+    def sum_components(self) -> dict[str, int]:
+        subprocess.run([sys.executable, os.path.join(REPO, "sort_kanji.py"), "meta_bank.json", "--sum-components", "--out-file", "out.json"], cwd=self.dir, check=True, capture_output=True)
+        with open(os.path.join(self.dir, "out.json")) as f:
+            return json.load(f)
+
+    def test_without_component_edge(self):
+        graph, usage = self.graph(), self.sum_components()
+        self.assertEqual(graph["木"], sorted(["休", "林", "本", "末", "未", "森"]))
+        self.assertEqual(usage["木"], 500 + 300 + 200)
+        # as in a kanjivg.db built before component_edge
+        with sqlite3.connect(os.path.join(self.dir, "kanjivg.db")) as conn:
+            conn.execute("DROP TABLE component_edge")
+        self.assertEqual(self.graph(), graph)
+        self.assertEqual(self.sum_components(), usage)
+
+
+if __name__ == "__main__":
+    unittest.main()
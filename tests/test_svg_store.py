@@ -0,0 +1,81 @@
+"""
+svgs stored in kanjivg.db by svg_store.py must read back as the bytes of their kanji/ file,
+through SvgStore and through the svg of the KanjiData of a kanjivg.db row.
+
+python3 -m unittest discover tests
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import unittest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+import svg_store
+from gen_db import init_table
+from kanji_data import get_kanjivg_data, row_to_kanjivg_data
+
+# 休 体 林 森 本 木 人 明 日 月 未 末, and a variant file
+FIXTURE = ["04f11", "04f53", "06797", "068ee", "0672c", "06728", "04eba", "0660e", "065e5", "06708", "0672a", "0672b", "04e3b-VtLst"]
+
+
+def read_svg(code: str) -> bytes:
+    with open(os.path.join(REPO, "kanji", code + ".svg"), "rb") as f:
+        return f.read()
+
+
+class SvgStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.svgs = {code: read_svg(code) for code in FIXTURE}
+        self.zdict = svg_store.train_dictionary(svg.decode("utf-8") for svg in self.svgs.values())
+        self.conn = sqlite3.connect(":memory:")
+        svg_store.init_tables(self.conn)
+        svg_store.write_dictionary(self.conn, self.zdict)
+        self.conn.executemany("INSERT INTO kanjivg_svg (element, data) VALUES (?,?)", (
+            (code, svg_store.compress(svg.decode("utf-8"), self.zdict)) for code, svg in self.svgs.items()
+        ))
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_dictionary(self):
+        self.assertLessEqual(len(self.zdict), svg_store.MAX_DICTIONARY_SIZE)
+        self.assertEqual(svg_store.load_dictionary(self.conn), self.zdict)
+        # the license header is shared by every file
+        self.assertIn(b"Creative Commons", self.zdict)
+
+    def test_round_trip(self):
+        store = svg_store.SvgStore(self.conn)
+        for code, svg in self.svgs.items():
+            self.assertEqual(store.get(code).encode("utf-8"), svg)
+        self.assertIsNone(store.get("99999"))
+
+    def test_compressed_smaller_than_without_dictionary(self):
+        with_dictionary = sum(len(svg_store.compress(svg.decode("utf-8"), self.zdict)) for svg in self.svgs.values())
+        without_dictionary = sum(len(svg_store.compress(svg.decode("utf-8"), b"")) for svg in self.svgs.values())
+        self.assertLess(with_dictionary, without_dictionary)
+
+    def test_kanji_data_svg(self):
+        # rows and svgs are stored by element in kanjivg.db
+        init_table(self.conn)
+        self.conn.execute("INSERT INTO kanjivg (id, element, decomposition, components, combinations) VALUES (1, '未', ?, '[]', '[]')", (json.dumps({"element": "未"}),))
+        self.conn.execute("INSERT INTO kanjivg_svg (element, data) VALUES ('未', ?)", (svg_store.compress(self.svgs["0672a"].decode("utf-8"), self.zdict),))
+        cur = self.conn.cursor()
+        data = get_kanjivg_data(cur, "未")
+        # only read from kanjivg_svg when accessed
+        self.assertIsNone(data._svg)
+        self.assertEqual(data.svg.encode("utf-8"), self.svgs["0672a"])
+        self.assertEqual(data.decomposition, {"element": "未"})
+
+        row = cur.execute("SELECT * FROM kanjivg").fetchone()
+        self.assertIsNone(row_to_kanjivg_data(row).svg)
+        data = row_to_kanjivg_data(row, svg_store.SvgStore(self.conn))
+        data.svg = "<svg/>"
+        self.assertEqual(data.svg, "<svg/>")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,11 +3,17 @@ updates the database with:
 - frequencies (occurrence, rank, cumulative_percent)
 - sorted combinations
 
-CURRENTLY REQUIRES A FREQUENCY FILE that is of format:
+REQUIRES A FREQUENCY FILE that is of format:
     {
         "kanji": number
     }
 known internally as: "freq_map"
+
+or a corpus of kanjivg.db (see freq_db.py) with --corpus,
+in which case the frequencies are computed with a single join against the frequencies table
+
+with --per-corpus (or --all-corpora) the results are stored per corpus next to each other,
+in corpus_ranks and corpus_combinations, and picked at query time with search.py --corpus
 """
 
 import json
@@ -15,14 +21,18 @@ import sqlite3
 import argparse
 from typing import Optional, TypeVar
 
-from util import json_to_str, COMBINATIONS, ELEMENT
+from util import json_to_str
+import freq_db
 
 def get_args():
     parser = argparse.ArgumentParser()
-    parser.add_argument("sort_file", type=str, default=None)
+    parser.add_argument("sort_file", type=str, nargs="?", default=None)
+    parser.add_argument("--corpus", type=str, default=None, help="use this corpus of kanjivg.db instead of sort_file")
     parser.add_argument("--occurrence-based", action="store_true")
     parser.add_argument("--update-frequencies", action="store_true")
     parser.add_argument("--update-combinations", action="store_true")
+    parser.add_argument("--per-corpus", action="store_true", help="store the results of --corpus in corpus_ranks / corpus_combinations, instead of the kanjivg columns")
+    parser.add_argument("--all-corpora", action="store_true", help="--per-corpus for every corpus of kanjivg.db")
     #parser.add_argument("--sort-file", type=str, default=None)
     #parser.add_argument("--sort-file-is-freq-map", action="store_true")
     return parser.parse_args()
@@ -33,19 +43,144 @@ def sort_kanji(occurrence_based: bool, lst: list[T], access_lambda, occurrence_m
         return list(reversed(sorted(lst, key=lambda x: -1 if access_lambda(x) not in occurrence_map else occurrence_map[access_lambda(x)])))
     return sorted(lst, key=lambda x: 99999999 if access_lambda(x) not in occurrence_map else occurrence_map[access_lambda(x)])
 
-def update_combinations(cur, element: str, combinations: list[str]):
-    UPDATE_ROW_SQL = "UPDATE kanjivg SET combinations = ? WHERE element = ?"
-    cur.execute(UPDATE_ROW_SQL, (json_to_str(combinations), element))
-
-def update_frequency(cur, element: str, rank: int, occurences: Optional[int], cumulative_percent: Optional[int]):
-    UPDATE_ROW_SQL = "UPDATE kanjivg SET (rank, occurrences, cumulative_percent) = (?,?,?) WHERE element = ?"
-    cur.execute(UPDATE_ROW_SQL, (rank, occurences, cumulative_percent, element))
+def update_combinations(cur, values: list[tuple[str, list[str]]]):
+    """
+    values: (element, combinations) pairs.
+    loaded into a temporary table, and applied with a single UPDATE ... FROM join
+    instead of one UPDATE per element
+    """
+    cur.execute("CREATE TEMP TABLE new_combinations (element text PRIMARY KEY NOT NULL, combinations text NOT NULL)")
+    INSERT_SQL = "INSERT OR REPLACE INTO new_combinations (element, combinations) VALUES (?,?)"
+    cur.executemany(INSERT_SQL, ((element, json_to_str(combinations)) for element, combinations in values))
+    UPDATE_SQL = """
+        UPDATE kanjivg SET combinations = new_combinations.combinations
+        FROM new_combinations WHERE kanjivg.element = new_combinations.element
+    """
+    cur.execute(UPDATE_SQL)
+    cur.execute("DROP TABLE new_combinations")
+
+def update_frequencies(cur, values: list[tuple[str, int, Optional[int], Optional[float]]]):
+    """
+    values: (element, rank, occurrences, cumulative_percent) tuples.
+    see update_combinations
+    """
+    cur.execute("CREATE TEMP TABLE new_frequencies (element text PRIMARY KEY NOT NULL, rank integer, occurrences integer, cumulative_percent real)")
+    INSERT_SQL = "INSERT OR REPLACE INTO new_frequencies (element, rank, occurrences, cumulative_percent) VALUES (?,?,?,?)"
+    cur.executemany(INSERT_SQL, values)
+    UPDATE_SQL = """
+        UPDATE kanjivg SET (rank, occurrences, cumulative_percent) = (new_frequencies.rank, new_frequencies.occurrences, new_frequencies.cumulative_percent)
+        FROM new_frequencies WHERE kanjivg.element = new_frequencies.element
+    """
+    cur.execute(UPDATE_SQL)
+    cur.execute("DROP TABLE new_frequencies")
+
+def ranked_sql(occurrence_based: bool) -> str:
+    """
+    (id, element, rank, occurrences, cumulative_percent) of every kanjivg row for the :corpus parameter,
+    the values main computes in python from a sort file.
+    Ties are ordered as the python sort does: by id, reversed when occurrence based.
+    """
+    if occurrence_based:
+        return """
+            SELECT id, element, rank, occurrences,
+                CAST(SUM(occurrences) OVER (ORDER BY rank ROWS UNBOUNDED PRECEDING) AS REAL) / (SELECT SUM(occurrences) FROM frequencies WHERE corpus = :corpus) * 100 AS cumulative_percent
+            FROM (
+                SELECT kanjivg.id, kanjivg.element, coalesce(frequencies.occurrences, 0) AS occurrences,
+                    ROW_NUMBER() OVER (ORDER BY coalesce(frequencies.occurrences, -1) DESC, kanjivg.id DESC) AS rank
+                FROM kanjivg LEFT JOIN frequencies ON frequencies.corpus = :corpus AND frequencies.element = kanjivg.element
+            )
+        """
+    return """
+        SELECT kanjivg.id, kanjivg.element,
+            ROW_NUMBER() OVER (ORDER BY coalesce(frequencies.rank, 99999999), kanjivg.id) AS rank,
+            NULL AS occurrences, NULL AS cumulative_percent
+        FROM kanjivg LEFT JOIN frequencies ON frequencies.corpus = :corpus AND frequencies.element = kanjivg.element
+    """
+
+def update_frequencies_from_corpus(cur, corpus: str, occurrence_based: bool):
+    """
+    same as update_frequencies with the values computed by main,
+    but ranks and cumulative percents are computed by sqlite from the frequencies table
+    """
+    SQL = f"""
+        UPDATE kanjivg SET (rank, occurrences, cumulative_percent) = (ranked.rank, ranked.occurrences, ranked.cumulative_percent)
+        FROM ({ranked_sql(occurrence_based)}) AS ranked
+        WHERE kanjivg.id = ranked.id
+    """
+    cur.execute(SQL, {"corpus": corpus})
+
+def store_corpus_ranks(cur, corpus: str, occurrence_based: bool):
+    """same as update_frequencies_from_corpus, but into corpus_ranks instead of the kanjivg columns"""
+    cur.execute("DELETE FROM corpus_ranks WHERE corpus = ?", (corpus,))
+    SQL = f"""
+        INSERT INTO corpus_ranks (corpus, element, rank, occurrences, cumulative_percent)
+        SELECT :corpus, element, rank, occurrences, cumulative_percent FROM ({ranked_sql(occurrence_based)})
+    """
+    cur.execute(SQL, {"corpus": corpus})
+
+def store_corpus_combinations(cur, corpus: str, values: list[tuple[str, list[str]]]):
+    """same as update_combinations, but into corpus_combinations instead of the kanjivg column"""
+    cur.execute("DELETE FROM corpus_combinations WHERE corpus = ?", (corpus,))
+    INSERT_SQL = "INSERT OR REPLACE INTO corpus_combinations (corpus, element, combinations) VALUES (?,?,?)"
+    cur.executemany(INSERT_SQL, ((corpus, element, json_to_str(combinations)) for element, combinations in values))
+
+def sort_combinations(occurrence_based: bool, rows, occurrence_map) -> list[tuple[str, list[str]]]:
+    # rows: (element, combinations json) of kanjivg, elements without combinations are skipped
+    new_combinations = []
+    for element, combinations_json in rows:
+        combinations = json.loads(combinations_json)
+        if len(combinations) == 0:
+            continue
+        if occurrence_map:
+            combinations = sort_kanji(occurrence_based, combinations, lambda x: x, occurrence_map)
+        new_combinations.append((element, combinations))
+    return new_combinations
+
+def corpus_occurrence_based(conn: sqlite3.Connection, corpus: str, occurrence_based: bool) -> bool:
+    """
+    --occurrence-based only applies to corpora with occurrences,
+    rank only corpora would otherwise be ranked as if every kanji had 0 occurrences
+    """
+    if occurrence_based and not freq_db.has_occurrences(conn, corpus):
+        print(f"corpus {corpus} has no occurrences, using its ranks")
+        return False
+    return occurrence_based
+
+def update_per_corpus(conn: sqlite3.Connection, args, rows):
+    """
+    stores the ranks and sorted combinations of each corpus in corpus_ranks / corpus_combinations,
+    leaving the kanjivg columns untouched
+    """
+    freq_db.init_corpus_tables(conn)
+    corpora = freq_db.list_corpora(conn) if args.all_corpora else [args.corpus]
+    cur = conn.cursor()
+    for corpus in corpora:
+        occurrence_based = corpus_occurrence_based(conn, corpus, args.occurrence_based)
+        if args.update_combinations:
+            occurrence_map = freq_db.load_rank_map(conn, corpus, occurrence_based)
+            store_corpus_combinations(cur, corpus, sort_combinations(occurrence_based, rows, occurrence_map))
+        if args.update_frequencies:
+            store_corpus_ranks(cur, corpus, occurrence_based)
+        print(f"stored corpus {corpus}")
 
 def main():
     args = get_args()
-
-    with open(args.sort_file) as f:
-        occurrence_map  = json.load(f)
+    if args.all_corpora:
+        args.per_corpus = True
+    if args.per_corpus and args.corpus is None and not args.all_corpora:
+        raise SystemExit("--per-corpus requires --corpus")
+
+    if args.per_corpus:
+        occurrence_map = None
+    elif args.corpus is not None:
+        with sqlite3.connect("kanjivg.db") as conn:
+            args.occurrence_based = corpus_occurrence_based(conn, args.corpus, args.occurrence_based)
+            occurrence_map = freq_db.load_rank_map(conn, args.corpus, args.occurrence_based)
+    elif args.sort_file is not None:
+        with open(args.sort_file) as f:
+            occurrence_map  = json.load(f)
+    else:
+        raise SystemExit("either sort_file or --corpus is required")
 
     #if args.sort_file is None:
     #    freq_map = {}
@@ -62,26 +197,28 @@ def main():
 
         # ASSUMPTION: can store all this in memory
         # fortunately, this is should only a few MB large
-        rows = list(cur.execute("SELECT * from kanjivg").fetchall())
+        rows = list(cur.execute("SELECT element, combinations from kanjivg ORDER BY id").fetchall())
         print(len(rows))
+        ELEMENT = 0
+
+        if args.per_corpus:
+            update_per_corpus(conn, args, rows)
+            return
 
         if args.update_combinations:
-            for row in rows:
-                combinations = json.loads(row[COMBINATIONS])
-                #print(row[ELEMENT], combinations)
-                if len(combinations) == 0:
-                    continue
-                if occurrence_map:
-                    combinations = sort_kanji(args.occurrence_based, combinations, lambda x: x, occurrence_map)
-                update_combinations(cur, row[ELEMENT], combinations)
+            update_combinations(cur, sort_combinations(args.occurrence_based, rows, occurrence_map))
 
-        if args.update_frequencies:
+        if args.update_frequencies and args.corpus is not None:
+            update_frequencies_from_corpus(cur, args.corpus, args.occurrence_based)
+
+        elif args.update_frequencies:
             sorted_rows = sort_kanji(args.occurrence_based, rows, lambda x: x[ELEMENT], occurrence_map)
             #sorted_rows = sorted(rows, key=lambda x: 99999999 if x[ELEMENT] not in occurrence_map else occurrence_map[x[ELEMENT]])
             # if occurrence based -> we iterate reversed (largest to smallest)
 
             complete_sum = sum(occurrence_map.values())
             current_sum = 0
+            new_frequencies = []
             for i, row in enumerate(sorted_rows):
                 element = row[ELEMENT]
                 occurences = None
@@ -90,7 +227,8 @@ def main():
                     current_sum += occurrence_map.get(element, 0)
                     occurences = occurrence_map.get(element, 0)
                     cumulative_percent = current_sum / complete_sum * 100
-                update_frequency(cur, element, i+1, occurences, cumulative_percent)
+                new_frequencies.append((element, i+1, occurences, cumulative_percent))
+            update_frequencies(cur, new_frequencies)
 
 
 if __name__ == "__main__":
@@ -1,11 +1,13 @@
 #!/bin/sh
 d=`date +%Y%m%d`
 outFileOne="kanjivg-$d.xml.gz"
+outFileMin="kanjivg-$d.min.xml.gz"
 outFileAll="kanjivg-$d-all.zip"
 outFileMain="kanjivg-$d-main.zip"
 zip -r $outFileAll kanji/*.svg
 zip -r $outFileMain kanji/?????.svg
-./kvg.py release
+./kvg.py release --minify
 gzip -c kanjivg.xml >$outFileOne
+gzip -c kanjivg.min.xml >$outFileMin
 #scp $outFileOne $outFileAll gnurou@gnurou.org:/srv/http/kanjivg/upload/Main/
 #ssh gnurou@gnurou.org "ln -sf $outFileOne /srv/http/kanjivg/upload/Main/kanjivg-latest.xml.gz"
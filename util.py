@@ -3,14 +3,14 @@ import json
 def json_to_str(j, indent=None):
     return json.dumps(j, ensure_ascii=False, indent=indent)
 
+# columns of the kanjivg table, the svg is in kanjivg_svg (see svg_store.py)
 ID = 0
 ELEMENT = 1
-SVG = 2
-DECOMPOSITION = 3
-COMPONENTS = 4
-COMBINATIONS = 5
-RANK = 6
-OCCURENCES = 7
-CUMULATIVE_PERCENT = 8
+DECOMPOSITION = 2
+COMPONENTS = 3
+COMBINATIONS = 4
+RANK = 5
+OCCURENCES = 6
+CUMULATIVE_PERCENT = 7
 
 
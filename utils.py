@@ -54,8 +54,9 @@ class SvgFileInfo:
         return parsed[0]
 
 def parseXmlFile(path, handler):
-    from xml.sax import parse
-    parse(path, handler)
+    from xmlhandler import ExpatDriver
+    with open(path, "rb") as f:
+        ExpatDriver(handler).parseFile(f)
 
 def listSvgFiles(dir):
     return [
@@ -63,6 +64,76 @@ def listSvgFiles(dir):
         for f in os.listdir(dir)
     ]
 
+class SvgCatalog:
+    """Index of the SVG files of a directory, built from a single listing. Files can be looked up by id and variant without scanning the whole list again."""
+    def __init__(self, dir):
+        self.dir = dir
+        # (id, variant) -> SvgFileInfo, variant is None for base files
+        self.files = {}
+        # id -> list of SvgFileInfo, sorted by file name
+        self.byId = {}
+        # other files, such as .DS_Store, are skipped
+        for file in sorted(name for name in os.listdir(dir) if name[-4:].lower() == ".svg"):
+            info = SvgFileInfo(file, dir)
+            variant = getattr(info, "variant", None)
+            self.files[(info.id, variant)] = info
+            self.byId.setdefault(info.id, []).append(info)
+
+    def __len__(self):
+        return len(self.files)
+
+    def __iter__(self):
+        for infos in self.byId.values():
+            for info in infos:
+                yield info
+
+    def __contains__(self, id):
+        return canonicalId(id) in self.byId
+
+    def ids(self):
+        return self.byId.keys()
+
+    def get(self, id, variant = None):
+        return self.files.get((canonicalId(id), variant), None)
+
+    def variants(self, id):
+        return self.byId.get(canonicalId(id), [])
+
+    def base(self, id):
+        # The non-variant file if there is one, otherwise the first variant
+        id = canonicalId(id)
+        info = self.files.get((id, None), None)
+        if info is None:
+            infos = self.byId.get(id, None)
+            if not infos:
+                return None
+            info = infos[0]
+        return info
+
+    def baseFiles(self):
+        return [info for info in self if not hasattr(info, "variant")]
+
+def iterXmlFile(path, KanjisHandler=None, chunkSize=65536):
+    """Parses an aggregation file incrementally, yielding each kanji as soon as its </kanji> end tag has been read. Only the kanji of the current chunk are kept in memory."""
+    if KanjisHandler is None:
+        from kanjivg import KanjisHandler
+    from xmlhandler import ExpatDriver
+    handler = KanjisHandler()
+    driver = ExpatDriver(handler)
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(chunkSize)
+            if not data:
+                break
+            driver.feed(data)
+            for kanji in handler.kanjis.values():
+                yield kanji
+            handler.kanjis.clear()
+    driver.feed(b"", True)
+    for kanji in handler.kanjis.values():
+        yield kanji
+    handler.kanjis.clear()
+
 def readXmlFile(path, KanjisHandler=None):
     if KanjisHandler is None:
         from kanjivg import KanjisHandler
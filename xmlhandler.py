@@ -17,11 +17,13 @@
 #  along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import xml.sax.handler
+import xml.parsers.expat
 
 class BasicHandler(xml.sax.handler.ContentHandler):
     def __init__(self):
         xml.sax.handler.ContentHandler.__init__(self)
         self.elementsTree = []
+        self.data = ""
 
     def currentElement(self):
         return str(self.elementsTree[-1])
@@ -32,14 +34,14 @@ class BasicHandler(xml.sax.handler.ContentHandler):
         if hasattr(self, attrName):
             rfunc = getattr(self, attrName)
             rfunc(atts)
-        self.characters = ""
+        self.data = ""
         return True
 
     def endElement(self, qName):
         attrName = "handle_data_" + qName
         if hasattr(self, attrName):
             rfunc = getattr(self, attrName)
-            rfunc(self.characters)
+            rfunc(self.data)
         attrName = "handle_end_" + str(qName)
         if hasattr(self, attrName):
             rfunc = getattr(self, attrName)
@@ -48,5 +50,49 @@ class BasicHandler(xml.sax.handler.ContentHandler):
         return True
 
     def characters(self, string):
-        self.characters += string
+        self.data += string
         return True
+
+    def dispatchTable(self, prefix):
+        """Returns a tag -> callback table of the methods of this handler whose name starts with prefix."""
+        return dict([(name[len(prefix):], getattr(self, name)) for name in dir(self) if name.startswith(prefix)])
+
+class ExpatDriver:
+    """Drives a BasicHandler with pyexpat directly, without going through SAX.
+    The handle_start_*, handle_end_* and handle_data_* callbacks of the handler
+    are looked up once into tag -> callback tables instead of for every tag.
+    The elementsTree of the handler is not maintained."""
+    def __init__(self, handler):
+        self.handler = handler
+        self.starts = handler.dispatchTable("handle_start_")
+        self.ends = handler.dispatchTable("handle_end_")
+        self.datas = handler.dispatchTable("handle_data_")
+        self.text = []
+
+        self.parser = xml.parsers.expat.ParserCreate()
+        self.parser.buffer_text = True
+        self.parser.StartElementHandler = self.startElement
+        self.parser.EndElementHandler = self.endElement
+        if len(self.datas) > 0:
+            self.parser.CharacterDataHandler = self.text.append
+
+    def startElement(self, name, attrs):
+        callback = self.starts.get(name)
+        if callback is not None:
+            callback(attrs)
+        if len(self.text) > 0:
+            del self.text[:]
+
+    def endElement(self, name):
+        callback = self.datas.get(name)
+        if callback is not None:
+            callback("".join(self.text))
+        callback = self.ends.get(name)
+        if callback is not None:
+            callback()
+
+    def feed(self, data, final = False):
+        self.parser.Parse(data, final)
+
+    def parseFile(self, f):
+        self.parser.ParseFile(f)